@@ -18,7 +18,17 @@ WEB_DIRECTORY = "web"
 EXCLUDE_MODULES = {
     '__init__',
     'character_editor_api',  # API module, not nodes
+    'character_archive',     # Library import/export used by the API
     'common',                # Utility functions only
+    'config_watcher',        # Config change tracking used by the API
+    'image_pipeline',        # Image processing used by the API
+    'model_catalog',         # Model metadata catalog used by the API
+    'model_index',           # Model folder index used by the API
+    'region_planner',        # Region merging used by the detailer
+    'route_metrics',         # Route instrumentation used by the API
+    'static_assets',         # Pre-compressed web files used by the API
+    'tag_index',             # Tag autocomplete index used by the API
+    'thumbnails',            # Thumbnail service used by the API
 }
 
 # Auto-discover and load all node modules
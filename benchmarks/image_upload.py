@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Benchmark for character and style image uploads.
+
+Compares the per-upload latency of the previous handler code (full decode,
+crop, resize, optimized JPEG) with image_pipeline.process_upload on
+generated 4K inputs.
+
+    python benchmarks/image_upload.py [--repeat N]
+"""
+
+import argparse
+import statistics
+import sys
+import tempfile
+import time
+from io import BytesIO
+from pathlib import Path
+from PIL import Image, ImageDraw
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import image_pipeline  # noqa: E402
+
+
+WIDTH, HEIGHT = 3840, 2160
+
+
+def make_input(fmt, **options):
+    """Generate a 4K test image with some detail, encoded in fmt."""
+    img = Image.radial_gradient('L').resize((WIDTH, HEIGHT))
+    img = Image.merge('RGB', (img, img.transpose(Image.Transpose.ROTATE_180),
+                              Image.effect_noise((WIDTH, HEIGHT), 40)))
+    draw = ImageDraw.Draw(img)
+    for i in range(0, WIDTH, 97):
+        draw.line((i, 0, WIDTH - i, HEIGHT), fill=(i % 255, 80, 160), width=5)
+    buffer = BytesIO()
+    img.save(buffer, fmt, **options)
+    return buffer.getvalue()
+
+
+def legacy_upload(image_bytes, path, size=image_pipeline.UPLOAD_SIZE):
+    """The upload handler code before the shared pipeline."""
+    img = Image.open(BytesIO(image_bytes))
+    img = img.convert('RGB')
+    width, height = img.size
+    if width > height:
+        left = (width - height) / 2
+        img = img.crop((left, 0, left + height, height))
+    else:
+        top = (height - width) / 2
+        img = img.crop((0, top, width, top + width))
+    img = img.resize((size, size), Image.Resampling.LANCZOS)
+    img.save(path, 'JPEG', quality=85, optimize=True)
+
+
+def time_upload(upload, image_bytes, path, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        upload(image_bytes, path)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--repeat', type=int, default=10)
+    args = parser.parse_args()
+
+    inputs = {
+        "JPEG": make_input('JPEG', quality=92),
+        "PNG": make_input('PNG'),
+    }
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = Path(tmp_dir) / "upload.jpg"
+        for name, image_bytes in inputs.items():
+            print(f"{name} {WIDTH}x{HEIGHT}, "
+                  f"{len(image_bytes) / 1024 / 1024:.1f} MiB")
+            for label, upload in (("before", legacy_upload),
+                                  ("after", image_pipeline.process_upload)):
+                timings = time_upload(upload, image_bytes, path, args.repeat)
+                print(f"  {label:<7} mean {statistics.mean(timings):7.1f} ms"
+                      f"  min {min(timings):7.1f} ms"
+                      f"  output {path.stat().st_size / 1024:.1f} KiB")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Benchmark for tag autocomplete search.
+
+Times prefix and fuzzy queries against the tag dictionary built from
+web/danbooru.csv, building the dictionary first if needed.
+
+    python benchmarks/tag_search.py [--repeat N]
+"""
+
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import tag_index  # noqa: E402
+
+
+PREFIX_QUERIES = [
+    "lo", "sa", "bo", "long", "hair", "blue ey", "fate", "hatsune",
+    "looking_at", "thigh", "1g", "school_uni",
+]
+
+# Misspellings of common tags, most with no prefix match
+FUZZY_QUERIES = [
+    "breats", "lnog_hair", "thighhihgs", "smlie", "hatsnue_miku",
+    "blonde_hiar", "skrit", "pantyhsoe", "twintials", "wnigs",
+    "looking_at_veiwer", "sailor_fkuu", "ponytial", "sweta",
+    "gloevs", "jaket", "ribon", "hoodei", "neckalce", "earings",
+    "hatsnue_mkiu", "thighhihgs_undr",
+]
+
+
+def time_queries(index, queries, repeat, **options):
+    timings = []
+    for query in queries:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            index.search(query, 20, **options)
+        timings.append((time.perf_counter() - start) / repeat * 1000)
+    return timings
+
+
+def report(label, queries, timings):
+    ordered = sorted(timings)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    print(f"{label}: mean {statistics.mean(timings):.2f} ms, "
+          f"p95 {p95:.2f} ms, max {max(timings):.2f} ms")
+    slowest = max(range(len(queries)), key=timings.__getitem__)
+    print(f"  slowest: {queries[slowest]!r}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--show", action="store_true",
+                        help="print the top fuzzy results")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    index = tag_index.load_index()
+    print(f"Loaded {index.name_count} names in "
+          f"{(time.perf_counter() - start) * 1000:.1f} ms")
+
+    report("prefix", PREFIX_QUERIES,
+           time_queries(index, PREFIX_QUERIES, args.repeat))
+    report("fuzzy", FUZZY_QUERIES,
+           time_queries(index, FUZZY_QUERIES, args.repeat, fuzzy=True))
+    report("fuzzy, prefix hits", PREFIX_QUERIES,
+           time_queries(index, PREFIX_QUERIES, args.repeat, fuzzy=True))
+
+    if args.show:
+        for query in FUZZY_QUERIES:
+            results = index.search(query, 5, fuzzy=True)
+            print(f"{query}: {[row['tag'] for row in results]}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,270 @@
+#!/usr/bin/env python3
+"""
+Zip archives of the character library, for backups and migrations.
+
+An archive holds characters.jsonc and the character images under their
+base64 file names. Exports are written straight into the response stream,
+imports are uploaded in chunks to a session directory and applied in one
+step once the whole archive is there.
+"""
+
+import io
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+import uuid
+import zipfile
+from pathlib import Path
+
+
+IMPORT_DIR = Path(__file__).parent / "config" / "imports"
+
+ARCHIVE_CHARACTERS = "characters.jsonc"
+ARCHIVE_IMAGES = "character_images/"
+
+# Bytes handed to the response at a time while exporting
+STREAM_CHUNK_SIZE = 256 * 1024
+
+# Largest chunk accepted by one upload request
+MAX_CHUNK_SIZE = 16 * 1024 * 1024
+
+# Sessions untouched for this many seconds are removed
+SESSION_TTL = 24 * 60 * 60
+
+SESSION_ID = re.compile(r'^[0-9a-f]{32}$')
+
+
+class StreamWriter(io.RawIOBase):
+    """
+    Write-only, non-seekable file object that hands its data to a callback
+    in chunks of STREAM_CHUNK_SIZE. zipfile detects that it cannot seek and
+    writes data descriptors after each member instead.
+    """
+
+    def __init__(self, send):
+        self.send = send
+        self.buffer = bytearray()
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.buffer += data
+        if len(self.buffer) >= STREAM_CHUNK_SIZE:
+            self.flush()
+        return len(data)
+
+    def flush(self):
+        if self.buffer:
+            self.send(bytes(self.buffer))
+            self.buffer.clear()
+
+
+def write_archive(fileobj, characters, image_path_for):
+    """
+    Write the character library as a zip archive.
+
+    Args:
+        fileobj: Writable file object, need not be seekable
+        characters: Dict of character name to data
+        image_path_for: Callable mapping a character name to its image path
+
+    Returns:
+        Number of images written
+    """
+    images = 0
+    with zipfile.ZipFile(fileobj, 'w') as archive:
+        content = json.dumps(characters, indent=4, ensure_ascii=False)
+        archive.writestr(
+            ARCHIVE_CHARACTERS, content, compress_type=zipfile.ZIP_DEFLATED)
+
+        for name in characters:
+            image_path = image_path_for(name)
+            if not image_path.exists():
+                continue
+            # JPEGs do not compress, store them as they are
+            archive.write(
+                image_path, ARCHIVE_IMAGES + image_path.name,
+                compress_type=zipfile.ZIP_STORED)
+            images += 1
+    return images
+
+
+def read_archive(archive_path, strip_comments, image_path_for):
+    """
+    Read and validate an uploaded archive.
+
+    Returns:
+        Tuple of (characters, images) where images maps a character name to
+        the archive member holding its image. Images of characters that are
+        not in the archive are ignored.
+    """
+    try:
+        archive = zipfile.ZipFile(archive_path)
+    except zipfile.BadZipFile as e:
+        raise ValueError(f"Not a zip archive: {e}")
+
+    with archive:
+        try:
+            content = archive.read(ARCHIVE_CHARACTERS).decode('utf-8')
+        except KeyError:
+            raise ValueError(f"Archive has no {ARCHIVE_CHARACTERS}")
+        characters = json.loads(strip_comments(content))
+        if not isinstance(characters, dict):
+            raise ValueError(f"{ARCHIVE_CHARACTERS} is not an object")
+
+        # Member names are only matched, never used as paths
+        members = {
+            info.filename[len(ARCHIVE_IMAGES):]: info.filename
+            for info in archive.infolist()
+            if info.filename.startswith(ARCHIVE_IMAGES)
+        }
+        images = {}
+        for name in characters:
+            member = members.get(image_path_for(name).name)
+            if member is not None:
+                images[name] = member
+    return characters, images
+
+
+def apply_import(archive_path, images, image_path_for, removed, commit):
+    """
+    Replace character images and run commit() as one transaction.
+
+    Every image is extracted to a staging directory first. Existing images
+    that are replaced or removed are moved aside, the staged ones moved
+    into place, and commit() saves the characters. If any step fails, the
+    previous images are put back, so the library is left as it was.
+
+    Args:
+        archive_path: Path of the uploaded archive
+        images: Dict of character name to archive member, see read_archive
+        image_path_for: Callable mapping a character name to its image path
+        removed: Names of characters whose images are deleted
+        commit: Callable saving the characters, run with the new images in
+            place
+    """
+    # One work directory per image directory, so every move is a rename
+    work_dirs = {}
+
+    def work_dir(parent):
+        if parent not in work_dirs:
+            work_dirs[parent] = Path(
+                tempfile.mkdtemp(prefix=".import-", dir=parent))
+        return work_dirs[parent]
+
+    staged = []
+    moved_aside = []
+    installed = []
+    try:
+        with zipfile.ZipFile(archive_path) as archive:
+            for name, member in images.items():
+                image_path = image_path_for(name)
+                staged_path = work_dir(image_path.parent) / image_path.name
+                with archive.open(member) as src, \
+                        open(staged_path, 'wb') as dst:
+                    shutil.copyfileobj(src, dst)
+                staged.append((staged_path, image_path))
+
+        try:
+            targets = [image_path_for(name) for name in removed]
+            targets += [image_path for _, image_path in staged]
+            for image_path in targets:
+                if not image_path.exists():
+                    continue
+                backup_path = (work_dir(image_path.parent) /
+                               f"{image_path.name}.bak")
+                os.replace(image_path, backup_path)
+                moved_aside.append((backup_path, image_path))
+
+            for staged_path, image_path in staged:
+                os.replace(staged_path, image_path)
+                installed.append(image_path)
+
+            commit()
+        except BaseException:
+            for image_path in installed:
+                try:
+                    image_path.unlink()
+                except OSError:
+                    pass
+            for backup_path, image_path in moved_aside:
+                os.replace(backup_path, image_path)
+            raise
+    finally:
+        for path in work_dirs.values():
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def session_dir(session_id):
+    """Get the directory of an import session, or None if it is invalid."""
+    if not SESSION_ID.match(session_id):
+        return None
+    path = IMPORT_DIR / session_id
+    return path if path.is_dir() else None
+
+
+def remove_stale_sessions():
+    """Remove import sessions that have not been touched in a while."""
+    if not IMPORT_DIR.exists():
+        return
+    cutoff = time.time() - SESSION_TTL
+    for path in IMPORT_DIR.iterdir():
+        try:
+            # Uploads append to the archive without touching the directory
+            archive = path / "archive.zip"
+            stamp = archive if archive.exists() else path
+            if path.is_dir() and stamp.stat().st_mtime < cutoff:
+                shutil.rmtree(path)
+                print(f"Removed stale import session {path.name}")
+        except OSError as e:
+            print(f"Error removing import session {path.name}: {e}")
+
+
+def create_session(size=None):
+    """
+    Start an import session.
+
+    Args:
+        size: Expected archive size in bytes, if known
+
+    Returns:
+        Session status dict
+    """
+    remove_stale_sessions()
+    session_id = uuid.uuid4().hex
+    path = IMPORT_DIR / session_id
+    path.mkdir(parents=True)
+    (path / "session.json").write_text(json.dumps({"size": size}))
+    (path / "archive.zip").touch()
+    return session_status(session_id)
+
+
+def session_status(session_id):
+    """Get the status of an import session, or None if it does not exist."""
+    path = session_dir(session_id)
+    if path is None:
+        return None
+    meta = json.loads((path / "session.json").read_text())
+    return {
+        "id": session_id,
+        "offset": (path / "archive.zip").stat().st_size,
+        "size": meta.get("size"),
+    }
+
+
+def archive_path(session_id):
+    """Get the path of the archive uploaded to a session."""
+    return IMPORT_DIR / session_id / "archive.zip"
+
+
+def remove_session(session_id):
+    """Remove an import session and everything uploaded to it."""
+    path = session_dir(session_id)
+    if path is None:
+        return False
+    shutil.rmtree(path)
+    return True
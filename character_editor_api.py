@@ -4,18 +4,30 @@ API endpoints for character editor
 Add this to your custom node's __init__.py or server setup
 """
 
+import asyncio
 import json
 import os
 import re
 import base64
-import folder_paths
+import threading
 from pathlib import Path
+from urllib.parse import unquote
 from aiohttp import web
-from PIL import Image
-from io import BytesIO
 import server
+from . import character_archive
+from . import config_watcher
+from . import image_pipeline
+from . import model_catalog
+from . import model_index
+from . import route_metrics
+from . import static_assets
+from . import tag_index
+from . import thumbnails
 
 
+# Every route below is registered through this, to collect metrics
+routes = route_metrics.InstrumentedRoutes(server.PromptServer.instance.routes)
+
 # Get the config path
 CONFIG_DIR = Path(__file__).parent / "config"
 CHARACTERS_FILE = CONFIG_DIR / "characters.jsonc"
@@ -45,6 +57,47 @@ def strip_jsonc_comments(content):
     return content
 
 
+# Requests in flight, so concurrent identical requests share one result
+inflight_requests = {}
+single_flight_stats = {"calls": 0, "coalesced": 0}
+
+
+async def single_flight(key, func, *args):
+    """
+    Get the result of func(*args), sharing it with every concurrent call
+    made with the same key.
+
+    Args:
+        key: Hashable identity of the request
+        func: Coroutine function, or a blocking function that is run in
+            the default executor
+    """
+    single_flight_stats["calls"] += 1
+    future = inflight_requests.get(key)
+    if future is not None:
+        single_flight_stats["coalesced"] += 1
+    else:
+        if asyncio.iscoroutinefunction(func):
+            future = asyncio.ensure_future(func(*args))
+        else:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(None, func, *args)
+        inflight_requests[key] = future
+
+        def forget(_):
+            if inflight_requests.get(key) is future:
+                del inflight_requests[key]
+        future.add_done_callback(forget)
+
+    # One caller going away must not cancel the others
+    return await asyncio.shield(future)
+
+
+def forget_flight(key):
+    """Make the next call with a key start afresh, after a write."""
+    inflight_requests.pop(key, None)
+
+
 def load_characters():
     """Load characters from JSONC file"""
     if not CHARACTERS_FILE.exists():
@@ -61,7 +114,47 @@ def save_characters(characters):
     """Save characters to JSONC file"""
     CONFIG_DIR.mkdir(parents=True, exist_ok=True)
     content = json.dumps(characters, indent=4, ensure_ascii=False)
-    CHARACTERS_FILE.write_text(content, encoding='utf-8')
+    # Replace the file in one step, so readers never see partial content
+    tmp_path = CHARACTERS_FILE.with_name(f"{CHARACTERS_FILE.name}.tmp")
+    tmp_path.write_text(content, encoding='utf-8')
+    os.replace(tmp_path, CHARACTERS_FILE)
+    forget_flight(("config", "characters"))
+    CONFIG_WATCHER.check("characters", force=True)
+
+
+def load_config_file(path):
+    """Load a JSONC config file"""
+    content = path.read_text(encoding='utf-8')
+    return json.loads(strip_jsonc_comments(content))
+
+
+def read_config(config):
+    """Load a watched config, or an empty dict if it does not exist yet"""
+    if config == "characters":
+        return load_characters()
+    path = CONFIG_FILES[config]
+    return load_config_file(path) if path.exists() else {}
+
+
+def broadcast_config_change(config, version, entries):
+    """Tell every connected client which entries of a config changed"""
+    server.PromptServer.instance.send_sync("mudknight.config_changed", {
+        "config": config,
+        "version": version,
+        "entries": entries,
+    })
+
+
+# Config files whose changes are pushed to clients, from any source
+CONFIG_FILES = {
+    "characters": CHARACTERS_FILE,
+    "models": CONFIG_DIR / "models.jsonc",
+    "styles": CONFIG_DIR / "styles.jsonc",
+    "tags": CONFIG_DIR / "tags.jsonc",
+}
+CONFIG_WATCHER = config_watcher.ConfigWatcher(
+    CONFIG_FILES, load_config_file, broadcast_config_change)
+CONFIG_WATCHER.start()
 
 
 def get_image_path(character_name):
@@ -83,11 +176,12 @@ def get_style_image_path(style_name):
     return STYLE_IMAGES_DIR / f"{safe_name}.jpg"
 
 
-@server.PromptServer.instance.routes.get('/character_editor')
+@routes.get('/character_editor')
 async def get_characters(request):
     """Get all characters"""
     try:
-        characters = load_characters()
+        characters = await single_flight(
+            ("config", "characters"), read_config, "characters")
         return web.json_response(characters)
     except Exception as e:
         return web.json_response(
@@ -96,7 +190,7 @@ async def get_characters(request):
         )
 
 
-@server.PromptServer.instance.routes.post('/character_editor')
+@routes.post('/character_editor')
 async def update_characters(request):
     """Update characters"""
     try:
@@ -110,7 +204,7 @@ async def update_characters(request):
         )
 
 
-@server.PromptServer.instance.routes.delete('/character_editor/{name}')
+@routes.delete('/character_editor/{name}')
 async def delete_character(request):
     """Delete a character"""
     try:
@@ -139,7 +233,7 @@ async def delete_character(request):
         )
 
 
-@server.PromptServer.instance.routes.post('/character_editor/rename')
+@routes.post('/character_editor/rename')
 async def rename_character(request):
     """Rename a character and its image"""
     try:
@@ -192,7 +286,7 @@ async def rename_character(request):
                 )
 
 
-@server.PromptServer.instance.routes.get(
+@routes.get(
     '/character_editor/image/{name}'
 )
 async def get_character_image(request):
@@ -217,7 +311,7 @@ async def get_character_image(request):
         )
 
 
-@server.PromptServer.instance.routes.post(
+@routes.post(
     '/character_editor/image/{name}'
 )
 async def upload_character_image(request):
@@ -233,32 +327,18 @@ async def upload_character_image(request):
         if image_data.startswith('data:image'):
             image_data = image_data.split(',', 1)[1]
 
-        # Decode and process image
+        # Center crop to a 256x256 JPEG, off the event loop
         image_bytes = base64.b64decode(image_data)
-        img = Image.open(BytesIO(image_bytes))
-
-        # Resize to 256x256 with center crop
-        size = 256
-        img = img.convert('RGB')
-
-        # Calculate crop dimensions
-        width, height = img.size
-        if width > height:
-            left = (width - height) / 2
-            img = img.crop((left, 0, left + height, height))
-        else:
-            top = (height - width) / 2
-            img = img.crop((0, top, width, top + width))
-
-        # Resize
-        img = img.resize((size, size), Image.Resampling.LANCZOS)
-
-        # Save as JPEG
         image_path = get_image_path(name)
         print(f"Saving image to: {image_path}")
-        img.save(image_path, 'JPEG', quality=85, optimize=True)
-
-        return web.json_response({"success": True})
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(
+            None, image_pipeline.process_upload, image_bytes, image_path)
+
+        return web.json_response({
+            "success": True,
+            "version": thumbnails.source_version(image_path)
+        })
     except Exception as e:
         print(f"Error uploading image: {e}")
         return web.json_response(
@@ -267,7 +347,7 @@ async def upload_character_image(request):
         )
 
 
-@server.PromptServer.instance.routes.delete(
+@routes.delete(
     '/character_editor/image/{name}'
 )
 async def delete_character_image(request):
@@ -291,7 +371,246 @@ async def delete_character_image(request):
         )
 
 
-@server.PromptServer.instance.routes.get('/style_editor/image/{name}')
+@routes.get('/character_editor/export')
+async def export_characters(request):
+    """Stream the characters and their images as a zip archive"""
+    try:
+        characters = load_characters()
+        response = web.StreamResponse(headers={
+            'Content-Type': 'application/zip',
+            'Content-Disposition': 'attachment; filename="characters.zip"',
+        })
+        response.enable_chunked_encoding()
+        await response.prepare(request)
+    except Exception as e:
+        return web.json_response({"error": str(e)}, status=500)
+
+    loop = asyncio.get_running_loop()
+
+    def send(data):
+        # Waiting for each write keeps memory bounded on slow clients
+        asyncio.run_coroutine_threadsafe(response.write(data), loop).result()
+
+    def build():
+        with character_archive.StreamWriter(send) as writer:
+            return character_archive.write_archive(
+                writer, characters, get_image_path)
+
+    try:
+        images = await loop.run_in_executor(None, build)
+        await response.write_eof()
+        print(f"Exported {len(characters)} characters, {images} images")
+    except Exception as e:
+        # The headers are sent already, all we can do is cut the stream
+        print(f"Error exporting characters: {e}")
+    return response
+
+
+# One lock per import session, so chunks are appended one at a time
+import_locks = {}
+
+
+def import_lock(session_id):
+    """Get the lock of an import session, or None if there is no such
+    session"""
+    if character_archive.session_dir(session_id) is None:
+        return None
+    return import_locks.setdefault(session_id, asyncio.Lock())
+
+
+def commit_import(session_id, mode):
+    """
+    Apply an uploaded archive to the character library. The images and
+    characters are replaced together, or not at all.
+    """
+    archive_path = character_archive.archive_path(session_id)
+    imported, images = character_archive.read_archive(
+        archive_path, strip_jsonc_comments, get_image_path)
+
+    existing = load_characters()
+    if mode == 'replace':
+        characters = imported
+        removed = existing.keys() - characters.keys()
+    else:
+        characters = {**existing, **imported}
+        removed = ()
+
+    character_archive.apply_import(
+        archive_path, images, get_image_path, removed,
+        lambda: save_characters(characters))
+    return len(imported), len(images)
+
+
+@routes.post('/character_editor/import')
+async def start_import(request):
+    """
+    Start a chunked import. The body may give the archive size in bytes,
+    which lets the commit check that the upload is complete.
+    """
+    try:
+        data = await request.json() if request.can_read_body else {}
+        size = data.get('size')
+        if size is not None and (not isinstance(size, int) or size < 0):
+            return web.json_response(
+                {"error": "size must be a non-negative integer"}, status=400)
+        return web.json_response(character_archive.create_session(size))
+    except Exception as e:
+        return web.json_response({"error": str(e)}, status=500)
+
+
+@routes.get('/character_editor/import/{id}')
+async def get_import(request):
+    """Get the status of an import, to find where to resume the upload"""
+    try:
+        status = character_archive.session_status(request.match_info['id'])
+        if status is None:
+            return web.json_response(
+                {"error": "Import not found"}, status=404)
+        return web.json_response(status)
+    except Exception as e:
+        return web.json_response({"error": str(e)}, status=500)
+
+
+@routes.put('/character_editor/import/{id}')
+async def upload_import_chunk(request):
+    """
+    Append a chunk to an import. The offset query parameter must match the
+    bytes received so far, otherwise the current offset is returned with a
+    409 so the client can resume from there.
+    """
+    try:
+        session_id = request.match_info['id']
+        try:
+            offset = int(request.query.get('offset', ''))
+        except ValueError:
+            return web.json_response(
+                {"error": "Missing or invalid offset"}, status=400)
+
+        lock = import_lock(session_id)
+        if lock is None:
+            return web.json_response(
+                {"error": "Import not found"}, status=404)
+        async with lock:
+            status = character_archive.session_status(session_id)
+            if status is None:
+                return web.json_response(
+                    {"error": "Import not found"}, status=404)
+            if offset != status['offset']:
+                return web.json_response({
+                    "error": "Offset mismatch",
+                    "offset": status['offset'],
+                }, status=409)
+
+            limit = character_archive.MAX_CHUNK_SIZE
+            if status['size'] is not None:
+                limit = min(limit, status['size'] - offset)
+            if (request.content_length or 0) > limit:
+                return web.json_response(
+                    {"error": f"Chunk larger than {limit} bytes"},
+                    status=413)
+
+            # Partial chunks are kept, the client resumes after them. File
+            # access runs in the executor to keep the event loop free.
+            received = 0
+            path = character_archive.archive_path(session_id)
+            loop = asyncio.get_running_loop()
+            f = await loop.run_in_executor(None, open, path, 'ab')
+            try:
+                async for data in request.content.iter_chunked(1 << 16):
+                    received += len(data)
+                    if received > limit:
+                        await loop.run_in_executor(None, f.truncate, offset)
+                        return web.json_response(
+                            {"error": f"Chunk larger than {limit} bytes"},
+                            status=413)
+                    await loop.run_in_executor(None, f.write, data)
+            finally:
+                await loop.run_in_executor(None, f.close)
+
+            return web.json_response({
+                "id": session_id,
+                "offset": offset + received,
+                "size": status['size'],
+            })
+    except Exception as e:
+        return web.json_response({"error": str(e)}, status=500)
+
+
+@routes.post(
+    '/character_editor/import/{id}/commit'
+)
+async def commit_import_route(request):
+    """
+    Apply an uploaded archive. With mode "merge" (the default) imported
+    characters are added to or replace existing ones, with "replace" the
+    library becomes exactly the archive.
+    """
+    try:
+        session_id = request.match_info['id']
+        data = await request.json() if request.can_read_body else {}
+        mode = data.get('mode', 'merge')
+        if mode not in ('merge', 'replace'):
+            return web.json_response(
+                {"error": "mode must be merge or replace"}, status=400)
+
+        lock = import_lock(session_id)
+        if lock is None:
+            return web.json_response(
+                {"error": "Import not found"}, status=404)
+        async with lock:
+            status = character_archive.session_status(session_id)
+            if status is None:
+                return web.json_response(
+                    {"error": "Import not found"}, status=404)
+            if status['size'] is not None and \
+                    status['offset'] != status['size']:
+                return web.json_response({
+                    "error": "Upload incomplete",
+                    "offset": status['offset'],
+                }, status=409)
+
+            loop = asyncio.get_running_loop()
+            try:
+                count, images = await loop.run_in_executor(
+                    None, commit_import, session_id, mode)
+            except ValueError as e:
+                return web.json_response({"error": str(e)}, status=400)
+
+            character_archive.remove_session(session_id)
+        import_locks.pop(session_id, None)
+
+        print(f"Imported {count} characters, {images} images ({mode})")
+        return web.json_response({
+            "success": True,
+            "characters": count,
+            "images": images,
+        })
+    except Exception as e:
+        print(f"Error importing characters: {e}")
+        return web.json_response({"error": str(e)}, status=500)
+
+
+@routes.delete('/character_editor/import/{id}')
+async def abort_import(request):
+    """Abort an import and remove what was uploaded"""
+    try:
+        session_id = request.match_info['id']
+        lock = import_lock(session_id)
+        if lock is None:
+            return web.json_response(
+                {"error": "Import not found"}, status=404)
+        async with lock:
+            removed = character_archive.remove_session(session_id)
+        import_locks.pop(session_id, None)
+        if not removed:
+            return web.json_response(
+                {"error": "Import not found"}, status=404)
+        return web.json_response({"success": True})
+    except Exception as e:
+        return web.json_response({"error": str(e)}, status=500)
+
+
+@routes.get('/style_editor/image/{name}')
 async def get_style_image(request):
     """Get style image"""
     try:
@@ -307,7 +626,7 @@ async def get_style_image(request):
         return web.json_response({"error": str(e)}, status=500)
 
 
-@server.PromptServer.instance.routes.post('/style_editor/image/{name}')
+@routes.post('/style_editor/image/{name}')
 async def upload_style_image(request):
     """Upload style image"""
     try:
@@ -320,38 +639,24 @@ async def upload_style_image(request):
         if image_data.startswith('data:image'):
             image_data = image_data.split(',', 1)[1]
 
-        # Decode and process image
+        # Center crop to a 256x256 JPEG, off the event loop
         image_bytes = base64.b64decode(image_data)
-        img = Image.open(BytesIO(image_bytes))
-
-        # Resize to 256x256 with center crop
-        size = 256
-        img = img.convert('RGB')
-
-        # Calculate crop dimensions
-        width, height = img.size
-        if width > height:
-            left = (width - height) / 2
-            img = img.crop((left, 0, left + height, height))
-        else:
-            top = (height - width) / 2
-            img = img.crop((0, top, width, top + width))
-
-        # Resize
-        img = img.resize((size, size), Image.Resampling.LANCZOS)
-
-        # Save as JPEG
         image_path = get_style_image_path(name)
         print(f"Saving style image to: {image_path}")
-        img.save(image_path, 'JPEG', quality=85, optimize=True)
-
-        return web.json_response({"success": True})
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(
+            None, image_pipeline.process_upload, image_bytes, image_path)
+
+        return web.json_response({
+            "success": True,
+            "version": thumbnails.source_version(image_path)
+        })
     except Exception as e:
         print(f"Error uploading style image: {e}")
         return web.json_response({"error": str(e)}, status=500)
 
 
-@server.PromptServer.instance.routes.delete('/style_editor/image/{name}')
+@routes.delete('/style_editor/image/{name}')
 async def delete_style_image(request):
     """Delete style image"""
     try:
@@ -370,23 +675,18 @@ async def delete_style_image(request):
 
 
 # Model editor endpoints
-@server.PromptServer.instance.routes.get('/model_editor')
+@routes.get('/model_editor')
 async def get_models(request):
     """Get all models"""
     try:
-        models_file = CONFIG_DIR / "models.jsonc"
-        if not models_file.exists():
-            return web.json_response({})
-        
-        content = models_file.read_text(encoding='utf-8')
-        clean_content = strip_jsonc_comments(content)
-        models = json.loads(clean_content)
+        models = await single_flight(
+            ("config", "models"), read_config, "models")
         return web.json_response(models)
     except Exception as e:
         return web.json_response({"error": str(e)}, status=500)
 
 
-@server.PromptServer.instance.routes.post('/model_editor')
+@routes.post('/model_editor')
 async def update_models(request):
     """Update models"""
     try:
@@ -394,29 +694,26 @@ async def update_models(request):
         models_file = CONFIG_DIR / "models.jsonc"
         content = json.dumps(data, indent=4, ensure_ascii=False)
         models_file.write_text(content, encoding='utf-8')
+        forget_flight(("config", "models"))
+        CONFIG_WATCHER.check("models", force=True)
         return web.json_response({"success": True})
     except Exception as e:
         return web.json_response({"error": str(e)}, status=500)
 
 
 # Style editor endpoints
-@server.PromptServer.instance.routes.get('/style_editor')
+@routes.get('/style_editor')
 async def get_styles(request):
     """Get all styles"""
     try:
-        styles_file = CONFIG_DIR / "styles.jsonc"
-        if not styles_file.exists():
-            return web.json_response({})
-
-        content = styles_file.read_text(encoding='utf-8')
-        clean_content = strip_jsonc_comments(content)
-        styles = json.loads(clean_content)
+        styles = await single_flight(
+            ("config", "styles"), read_config, "styles")
         return web.json_response(styles)
     except Exception as e:
         return web.json_response({"error": str(e)}, status=500)
 
 
-@server.PromptServer.instance.routes.post('/style_editor')
+@routes.post('/style_editor')
 async def update_styles(request):
     """Update styles"""
     try:
@@ -424,6 +721,8 @@ async def update_styles(request):
         styles_file = CONFIG_DIR / "styles.jsonc"
         content = json.dumps(data, indent=4, ensure_ascii=False)
         styles_file.write_text(content, encoding='utf-8')
+        forget_flight(("config", "styles"))
+        CONFIG_WATCHER.check("styles", force=True)
         return web.json_response({"success": True})
     except Exception as e:
         return web.json_response({"error": str(e)}, status=500)
@@ -436,23 +735,18 @@ print("Character Editor API routes registered")
 
 
 # Tag editor endpoints
-@server.PromptServer.instance.routes.get('/tag_editor')
+@routes.get('/tag_editor')
 async def get_tags(request):
     """Get all tag presets"""
     try:
-        tags_file = CONFIG_DIR / "tags.jsonc"
-        if not tags_file.exists():
-            return web.json_response({})
-
-        content = tags_file.read_text(encoding='utf-8')
-        clean_content = strip_jsonc_comments(content)
-        tags = json.loads(clean_content)
+        tags = await single_flight(
+            ("config", "tags"), read_config, "tags")
         return web.json_response(tags)
     except Exception as e:
         return web.json_response({"error": str(e)}, status=500)
 
 
-@server.PromptServer.instance.routes.post('/tag_editor')
+@routes.post('/tag_editor')
 async def update_tags(request):
     """Update tag presets"""
     try:
@@ -460,6 +754,8 @@ async def update_tags(request):
         tags_file = CONFIG_DIR / "tags.jsonc"
         content = json.dumps(data, indent=4, ensure_ascii=False)
         tags_file.write_text(content, encoding='utf-8')
+        forget_flight(("config", "tags"))
+        CONFIG_WATCHER.check("tags", force=True)
         return web.json_response({"success": True})
     except Exception as e:
         return web.json_response({"error": str(e)}, status=500)
@@ -468,182 +764,303 @@ async def update_tags(request):
 print("Tag Editor API routes registered")
 
 
+@routes.get('/mudknight_static/{path:.*}')
+async def get_static_asset(request):
+    """
+    Serve a file from the web directory, pre-compressed with brotli or
+    gzip when the client accepts it. Requests carrying the current ETag in
+    `v`, as HTML pages link their files, are cached forever, others are
+    revalidated with If-None-Match.
+    """
+    try:
+        path = static_assets.resolve(request.match_info['path'])
+        if path is None:
+            return web.Response(status=404)
+
+        asset = await single_flight(
+            ("static_asset", str(path)), static_assets.get_asset, path)
+        etag = f'"{asset.etag}"'
+        cache_control = (
+            static_assets.IMMUTABLE_CACHE_CONTROL
+            if request.query.get('v') == asset.etag
+            else static_assets.REVALIDATE_CACHE_CONTROL
+        )
+        headers = {
+            "ETag": etag,
+            "Cache-Control": cache_control,
+            "Vary": "Accept-Encoding",
+        }
+
+        if etag in request.headers.get('If-None-Match', ''):
+            return web.Response(status=304, headers=headers)
+
+        encoding = static_assets.choose_encoding(
+            request.headers.get('Accept-Encoding'), asset)
+        if encoding is None:
+            return web.FileResponse(asset.path, headers={
+                **headers, "Content-Type": asset.content_type})
+
+        return web.FileResponse(asset.variants[encoding], headers={
+            **headers,
+            "Content-Type": asset.content_type,
+            "Content-Encoding": encoding,
+        })
+    except Exception as e:
+        print(f"Error serving static asset: {e}")
+        return web.json_response({"error": str(e)}, status=500)
+
+
+# Compress the web directory ahead of the first page load
+threading.Thread(target=static_assets.prebuild, daemon=True).start()
+
+
+@routes.get('/character_editor/metrics')
+async def get_route_metrics(request):
+    """
+    Get latency histograms, bytes in and out, and event loop blocking time
+    of every editor API route
+    """
+    try:
+        return web.json_response(routes.snapshot())
+    except Exception as e:
+        return web.json_response({"error": str(e)}, status=500)
+
+
+@routes.get('/detailer/cache_stats')
+async def get_detailer_cache_stats(request):
+    """Get the hits, misses and hit rate of the detailer's detection cache"""
+    try:
+        # Loaded with the nodes, only imported here once it is needed
+        from . import detailer
+        return web.json_response(detailer.detection_cache_stats())
+    except Exception as e:
+        return web.json_response({"error": str(e)}, status=500)
+
+
+@routes.get('/single_flight_stats')
+async def get_single_flight_stats(request):
+    """Get how many requests were served by a computation already running"""
+    try:
+        return web.json_response({
+            **single_flight_stats,
+            "inflight": len(inflight_requests),
+        })
+    except Exception as e:
+        return web.json_response({"error": str(e)}, status=500)
+
+
+@routes.get('/config_versions')
+async def get_config_versions(request):
+    """Get the current version of every watched config"""
+    try:
+        return web.json_response(CONFIG_WATCHER.versions())
+    except Exception as e:
+        return web.json_response({"error": str(e)}, status=500)
+
+
+@routes.post('/config_entries/{config}')
+async def get_config_entries(request):
+    """
+    Get some entries of a config, for clients that were told they changed.
+    Entries that no longer exist are returned as null.
+    """
+    try:
+        config = request.match_info['config']
+        if config not in CONFIG_FILES:
+            return web.json_response(
+                {"error": f"Unknown config: {config}"}, status=404)
+
+        data = await request.json()
+        names = data.get('names', [])
+        if not isinstance(names, list):
+            return web.json_response(
+                {"error": "names must be a list"}, status=400)
+
+        entries = await single_flight(
+            ("config", config), read_config, config)
+        return web.json_response({
+            "config": config,
+            "version": CONFIG_WATCHER.version(config),
+            "entries": {name: entries.get(name) for name in names},
+        })
+    except Exception as e:
+        return web.json_response({"error": str(e)}, status=500)
+
+
 print("LoRA and Embedding list API routes registered")
 
 
-# Preview image cache directory
-PREVIEW_CACHE_DIR = Path(__file__).parent / "config" / "preview_cache"
-PREVIEW_CACHE_DIR.mkdir(parents=True, exist_ok=True)
-PREVIEW_SIZE = 256  # Size for cached preview images
+# Index of the LoRA folders, refreshed from directory mtimes whenever the
+# list is requested. Previews are looked up in memory.
+LORA_INDEX = model_index.ModelDirectoryIndex("loras")
+_lora_list_cache = {}
 
 
 def get_lora_preview_path(lora_name_or_path):
-    """Get the preview image path for a LoRA"""
-    lora_file = None
-    
-    # First, try using folder_paths.get_full_path which handles subdirectories properly
-    # This is the most reliable method
-    try:
-        # Try with the path as-is (might already include extension)
-        full_path = folder_paths.get_full_path("loras", lora_name_or_path)
-        if full_path and os.path.exists(full_path):
-            lora_file = full_path
-    except:
-        pass
-    
-    # If that didn't work, try adding common extensions
-    if not lora_file:
-        for ext in ['.safetensors', '.ckpt', '.pt', '.bin']:
-            try:
-                # Try with extension appended
-                full_path = folder_paths.get_full_path("loras", lora_name_or_path + ext)
-                if full_path and os.path.exists(full_path):
-                    lora_file = full_path
-                    break
-            except:
-                continue
-    
-    # If still not found, try direct path search (fallback)
-    if not lora_file:
-        lora_paths = folder_paths.get_folder_paths("loras")
-        for lora_dir in lora_paths:
-            # Try as direct filename
-            for ext in ['.safetensors', '.ckpt', '.pt', '.bin']:
-                test_path = os.path.join(lora_dir, lora_name_or_path + ext)
-                if os.path.exists(test_path):
-                    lora_file = test_path
-                    break
-            if lora_file:
-                break
-    
-    if lora_file:
-        # Check for preview files in the same directory as the LoRA file
-        base_name = os.path.splitext(os.path.basename(lora_file))[0]
-        preview_dir = os.path.dirname(lora_file)
-        
-        # First check for .preview.* files
-        for ext in ['.preview.png', '.preview.jpeg', '.preview.jpg', '.preview.webp']:
-            preview_path = os.path.join(preview_dir, base_name + ext)
-            if os.path.exists(preview_path):
-                return preview_path
-        
-        # Also check for image files with same base name (without .preview. prefix)
-        # Common image extensions
-        for ext in ['.png', '.jpeg', '.jpg', '.webp', '.gif', '.bmp']:
-            preview_path = os.path.join(preview_dir, base_name + ext)
-            if os.path.exists(preview_path):
-                # Make sure it's not the LoRA file itself
-                if preview_path != lora_file:
-                    return preview_path
-    
-    return None
+    """Get the preview image path for a LoRA name or relative path"""
+    return LORA_INDEX.preview_path(lora_name_or_path)
 
 
-def get_embedding_preview_path(embedding_path):
-    """Get the preview image path for an embedding"""
-    embedding_paths = folder_paths.get_folder_paths("embeddings")
-    for emb_dir in embedding_paths:
-        # Try to find the embedding file
-        emb_file = None
-        for ext in ['.pt', '.safetensors', '.bin']:
-            test_path = os.path.join(emb_dir, embedding_path)
-            if os.path.exists(test_path):
-                emb_file = test_path
-                break
-        
-        if emb_file:
-            # Check for preview files
-            base_name = os.path.splitext(os.path.basename(emb_file))[0]
-            preview_dir = os.path.dirname(emb_file)
-            
-            # First check for .preview.* files
-            for ext in ['.preview.png', '.preview.jpeg', '.preview.jpg', '.preview.webp']:
-                preview_path = os.path.join(preview_dir, base_name + ext)
-                if os.path.exists(preview_path):
-                    return preview_path
-            
-            # Also check for image files with same base name (without .preview. prefix)
-            # Common image extensions
-            for ext in ['.png', '.jpeg', '.jpg', '.webp', '.gif', '.bmp']:
-                preview_path = os.path.join(preview_dir, base_name + ext)
-                if os.path.exists(preview_path):
-                    # Make sure it's not the embedding file itself
-                    if preview_path != emb_file:
-                        return preview_path
-    
-    return None
-
-
-def get_cached_preview_path(original_path, cache_key):
-    """Get or create a cached preview image"""
-    # Create a hash of the original path for cache filename
-    import hashlib
-    cache_hash = hashlib.md5(cache_key.encode()).hexdigest()
-    cache_path = PREVIEW_CACHE_DIR / f"{cache_hash}.jpg"
-    
-    # Check if cache exists and is newer than original
-    if cache_path.exists():
-        try:
-            if os.path.getmtime(cache_path) >= os.path.getmtime(original_path):
-                return cache_path
-        except:
-            pass
-    
-    # Create cached version
-    try:
-        img = Image.open(original_path)
-        img = img.convert('RGB')
-        
-        # Resize with center crop to square
-        width, height = img.size
-        if width > height:
-            left = (width - height) / 2
-            img = img.crop((left, 0, left + height, height))
-        else:
-            top = (height - width) / 2
-            img = img.crop((0, top, width, top + width))
-        
-        # Resize to preview size
-        img = img.resize((PREVIEW_SIZE, PREVIEW_SIZE), Image.Resampling.LANCZOS)
-        
-        # Save as JPEG
-        img.save(cache_path, 'JPEG', quality=85, optimize=True)
-        return cache_path
-    except Exception as e:
-        print(f"Error creating cached preview: {e}")
-        return original_path
+def preview_version(entry):
+    """
+    Get the content hash of a model's preview, so clients can request its
+    thumbnail by the immutable URL, or None without a readable preview
+    """
+    if entry.preview is None:
+        return None
+    try:
+        return thumbnails.source_version(entry.preview)
+    except OSError:
+        return None
+
+
+def build_lora_list():
+    """
+    Get the LoRA list and its serialized form, rebuilt only when the index
+    or the metadata catalog changes. Metadata of new files is read in the
+    background and shows up as null until then.
+
+    This is the only place the LoRA folders are checked for changes.
+    """
+    index_generation = LORA_INDEX.refresh()
+    models = LORA_INDEX.models()
+    if _lora_list_cache.get('index_generation') != index_generation:
+        model_catalog.LORA_CATALOG.schedule(
+            entry.full_path for entry in models)
+        _lora_list_cache['index_generation'] = index_generation
+
+    generation = (index_generation, model_catalog.LORA_CATALOG.generation)
+    if _lora_list_cache.get('generation') != generation:
+        lora_list = []
+        for entry in models:
+            metadata = model_catalog.LORA_CATALOG.get(entry.full_path) or {}
+            lora_list.append({
+                "name": entry.name,
+                "path": entry.path,
+                "hasPreview": entry.preview is not None,
+                "previewVersion": preview_version(entry),
+                "baseModel": metadata.get("baseModel"),
+                "triggerWords": metadata.get("triggerWords", []),
+                "rank": metadata.get("rank"),
+            })
+        _lora_list_cache['list'] = lora_list
+        _lora_list_cache['body'] = json.dumps(lora_list)
+        _lora_list_cache['generation'] = generation
+    return _lora_list_cache['list'], _lora_list_cache['body']
+
+
+def filter_lora_list(base_model=None, checkpoint=None):
+    """
+    Get the serialized LoRAs compatible with a base model family, or with
+    the base model of a checkpoint. LoRAs whose base model is unknown are
+    kept, since they may well be compatible.
+    """
+    lora_list, body = build_lora_list()
+    if checkpoint:
+        base_model = model_catalog.checkpoint_base_model(checkpoint)
+    if not base_model:
+        return body
+    return json.dumps([
+        lora for lora in lora_list
+        if lora["baseModel"] in (None, base_model)
+    ])
+
+
+# Index the LoRA metadata in the background from startup
+threading.Thread(target=build_lora_list, daemon=True).start()
+
 
+# Index of the embedding folders, refreshed from directory mtimes whenever
+# the list is requested. Previews are looked up in memory.
+EMBEDDING_INDEX = model_index.ModelDirectoryIndex(
+    "embeddings", extensions=('.pt', '.safetensors', '.bin'))
+_embedding_list_cache = {}
 
-@server.PromptServer.instance.routes.get('/lora_preview/{name}')
+
+def get_embedding_preview_path(embedding_path):
+    """Get the preview image path for an embedding's relative path"""
+    return EMBEDDING_INDEX.preview_path(embedding_path)
+
+
+def build_embedding_list():
+    """
+    Get the serialized embedding list, rebuilt only when the index changes.
+    Embeddings are listed once per name, sorted case-insensitively.
+    """
+    generation = EMBEDDING_INDEX.refresh()
+    if _embedding_list_cache.get('generation') != generation:
+        embeddings = [
+            {
+                "name": name,
+                "path": entry.path,
+                "hasPreview": entry.preview is not None,
+                "previewVersion": preview_version(entry)
+            }
+            for name, entry in EMBEDDING_INDEX.unique_names().items()
+        ]
+        embeddings.sort(key=lambda x: x["name"].lower())
+        _embedding_list_cache['body'] = json.dumps(embeddings)
+        _embedding_list_cache['generation'] = generation
+    return _embedding_list_cache['body']
+
+
+async def get_preview_thumbnail(resolve, name):
+    """
+    Resolve the preview image of a model and get its default size
+    thumbnail, or None if the model has no preview. Falls back to the
+    preview itself if the thumbnail cannot be rendered.
+    """
+    loop = asyncio.get_running_loop()
+    preview_path = await loop.run_in_executor(None, resolve, name)
+    if not preview_path:
+        return None
+
+    try:
+        version = await loop.run_in_executor(
+            None, thumbnails.source_version, preview_path)
+        return await asyncio.wrap_future(
+            thumbnails.request_thumbnail(preview_path, version))
+    except Exception as e:
+        print(f"Error creating thumbnail for {name}: {e}")
+        return preview_path
+
+
+def warm_up_previews():
+    """
+    Render thumbnails for every LoRA and embedding preview if warm-up is
+    enabled, and remove the old preview cache either way
+    """
+    if not thumbnails.WARM_UP:
+        thumbnails.remove_legacy_cache()
+        return
+    LORA_INDEX.refresh()
+    EMBEDDING_INDEX.refresh()
+    sources = [
+        entry.preview
+        for index in (LORA_INDEX, EMBEDDING_INDEX)
+        for entry in index.models()
+        if entry.preview
+    ]
+    print(f"Thumbnail warm-up started: {len(sources)} previews")
+    thumbnails.warm_up(sources)
+
+
+warm_up_timer = threading.Timer(thumbnails.WARM_UP_DELAY, warm_up_previews)
+warm_up_timer.daemon = True
+warm_up_timer.start()
+
+
+@routes.get('/lora_preview/{name}')
 async def get_lora_preview(request):
     """Get LoRA preview image"""
     try:
-        from urllib.parse import unquote
         name = unquote(request.match_info['name'])
-        # Try to find preview using the name
-        preview_path = get_lora_preview_path(name)
-        
-        # If not found, try to find the LoRA in the list and use its full path
-        if not preview_path or not os.path.exists(preview_path):
-            # Try to find the LoRA in the list to get its full path
-            try:
-                loras = folder_paths.get_filename_list("loras")
-                # Check if name matches any LoRA (by name or path)
-                for lora in loras:
-                    lora_name = os.path.splitext(lora)[0]
-                    if lora_name == name or lora == name:
-                        # Try with the full path
-                        preview_path = get_lora_preview_path(lora)
-                        if preview_path and os.path.exists(preview_path):
-                            break
-            except:
-                pass
-        
-        if not preview_path or not os.path.exists(preview_path):
+        cache_path = await single_flight(
+            ("lora_preview", name),
+            get_preview_thumbnail, get_lora_preview_path, name)
+
+        if not cache_path:
             return web.Response(status=404)
-        
-        # Use cached version if available
-        cache_path = get_cached_preview_path(preview_path, f"lora:{name}")
         return web.FileResponse(cache_path)
     except Exception as e:
         print(f"Error getting LoRA preview: {e}")
@@ -652,45 +1069,37 @@ async def get_lora_preview(request):
         return web.json_response({"error": str(e)}, status=500)
 
 
-@server.PromptServer.instance.routes.get('/embedding_preview/{path:.*}')
+@routes.get('/embedding_preview/{path:.*}')
 async def get_embedding_preview(request):
     """Get embedding preview image"""
     try:
         from urllib.parse import unquote
         path = unquote(request.match_info['path'])
-        preview_path = get_embedding_preview_path(path)
-        
-        if not preview_path or not os.path.exists(preview_path):
+        cache_path = await single_flight(
+            ("embedding_preview", path),
+            get_preview_thumbnail, get_embedding_preview_path, path)
+
+        if not cache_path:
             return web.Response(status=404)
-        
-        # Use cached version if available
-        cache_path = get_cached_preview_path(preview_path, f"embedding:{path}")
         return web.FileResponse(cache_path)
     except Exception as e:
         print(f"Error getting embedding preview: {e}")
         return web.json_response({"error": str(e)}, status=500)
 
 
-@server.PromptServer.instance.routes.get('/lora_list')
+@routes.get('/lora_list')
 async def get_lora_list(request):
-    """Get list of all available LoRAs"""
+    """
+    Get list of all available LoRAs. Filtered by base model family with
+    ?base_model=sdxl, or by the base model of ?checkpoint=<ckpt_name>.
+    """
     try:
-        loras = folder_paths.get_filename_list("loras")
-        # Return list of dicts with name, path, and hasPreview
-        lora_list = []
-        for lora in loras:
-            # Remove extension for name
-            name = os.path.splitext(lora)[0]
-            # Try both the name (without extension) and the full path for preview detection
-            # The full path might include subdirectories
-            has_preview = (get_lora_preview_path(name) is not None or 
-                          get_lora_preview_path(lora) is not None)
-            lora_list.append({
-                "name": name,
-                "path": lora,
-                "hasPreview": has_preview
-            })
-        return web.json_response(lora_list)
+        base_model = request.query.get('base_model', '').lower() or None
+        checkpoint = request.query.get('checkpoint') or None
+        body = await single_flight(
+            ("lora_list", base_model, checkpoint),
+            filter_lora_list, base_model, checkpoint)
+        return web.Response(text=body, content_type='application/json')
     except Exception as e:
         return web.json_response(
             {"error": str(e)},
@@ -698,51 +1107,286 @@ async def get_lora_list(request):
         )
 
 
-@server.PromptServer.instance.routes.get('/embedding_list')
+@routes.get('/embedding_list')
 async def get_embedding_list(request):
     """Get list of all available embeddings"""
     try:
-        # Get embedding paths
-        embedding_paths = folder_paths.get_folder_paths("embeddings")
-        embeddings = []
-
-        # Scan each embeddings folder
-        for emb_path in embedding_paths:
-            if not os.path.exists(emb_path):
-                continue
-
-            for root, dirs, files in os.walk(emb_path):
-                for file in files:
-                    # Common embedding extensions
-                    if file.lower().endswith(
-                        ('.pt', '.safetensors', '.bin')
-                    ):
-                        # Remove extension for cleaner names
-                        name = os.path.splitext(file)[0]
-                        # Get relative path from embedding root
-                        rel_path = os.path.relpath(
-                            os.path.join(root, file),
-                            emb_path
-                        )
-                        has_preview = get_embedding_preview_path(rel_path) is not None
-                        embeddings.append({
-                            "name": name,
-                            "path": rel_path,
-                            "hasPreview": has_preview
-                        })
-
-        # Remove duplicates and sort
-        unique_embeddings = {
-            emb["name"]: emb for emb in embeddings
-        }.values()
-        sorted_embeddings = sorted(
-            unique_embeddings,
-            key=lambda x: x["name"].lower()
-        )
-
-        return web.json_response(list(sorted_embeddings))
+        body = await single_flight(("embedding_list",), build_embedding_list)
+        return web.Response(text=body, content_type='application/json')
     except Exception as e:
         return web.json_response(
             {"error": str(e)},
             status=500
         )
+
+
+def search_tags(query, limit, categories, hide_aliases, fuzzy):
+    """Search the tag index, returning [] if the tag CSV is missing"""
+    index = tag_index.get_index()
+    if index is None:
+        return []
+    return index.search(query, limit, categories, hide_aliases, fuzzy)
+
+
+def lookup_tags(names):
+    """Look up tag names in the tag index"""
+    index = tag_index.get_index()
+    if index is None:
+        return {}
+    return index.lookup(names)
+
+
+# Load the tag index in the background so the first query doesn't wait
+threading.Thread(target=tag_index.get_index, daemon=True).start()
+
+
+@routes.get('/tag_autocomplete')
+async def get_tag_autocomplete(request):
+    """Get the most used tags matching a prefix, or near it in fuzzy mode"""
+    try:
+        query = request.query.get('q', '')
+        mode = request.query.get('mode', 'prefix')
+        if mode not in ('prefix', 'fuzzy'):
+            return web.json_response(
+                {"error": f"Unknown mode: {mode}"}, status=400)
+        try:
+            limit = int(request.query.get('limit', 20))
+            categories = {
+                int(category)
+                for category in request.query.get('category', '').split(',')
+                if category
+            }
+        except ValueError:
+            return web.json_response(
+                {"error": "Invalid limit or category"}, status=400)
+        hide_aliases = request.query.get('hide_aliases') in ('1', 'true')
+
+        loop = asyncio.get_running_loop()
+        results = await loop.run_in_executor(
+            None, search_tags, query, limit, categories, hide_aliases,
+            mode == 'fuzzy')
+        return web.json_response(results)
+    except Exception as e:
+        print(f"Error searching tags: {e}")
+        return web.json_response({"error": str(e)}, status=500)
+
+
+@routes.post('/tag_autocomplete/lookup')
+async def post_tag_lookup(request):
+    """Get the category and post count of a list of tag names"""
+    try:
+        data = await request.json()
+        names = data.get('names', [])
+        if not isinstance(names, list):
+            return web.json_response(
+                {"error": "names must be a list"}, status=400)
+
+        loop = asyncio.get_running_loop()
+        found = await loop.run_in_executor(
+            None, lookup_tags, [str(name) for name in names])
+        return web.json_response(found)
+    except Exception as e:
+        print(f"Error looking up tags: {e}")
+        return web.json_response({"error": str(e)}, status=500)
+
+
+def resolve_thumbnail_source(kind, name):
+    """Get the (source path, content hash) of a thumbnail, or None"""
+    source = get_thumbnail_source(kind, name)
+    if source is None:
+        return None
+    return source, thumbnails.source_version(source)
+
+
+def get_thumbnail_source(kind, name):
+    """Resolve the source image of a thumbnail, or None if missing"""
+    if kind == 'character':
+        path = get_image_path(name)
+    elif kind == 'style':
+        path = get_style_image_path(name)
+    elif kind == 'lora':
+        path = get_lora_preview_path(name)
+    elif kind == 'embedding':
+        path = get_embedding_preview_path(name)
+    else:
+        return None
+
+    if not path or not os.path.exists(path):
+        return None
+    return path
+
+
+@routes.get(
+    '/thumbnail/{kind}/{size}/{name:.*}'
+)
+async def get_thumbnail(request):
+    """
+    Get a square thumbnail for a character, style, LoRA or embedding.
+    Requests without the current content hash in `v` are redirected to
+    the hashed URL, which is served as immutable.
+    """
+    try:
+        kind = request.match_info['kind']
+        size = request.match_info['size']
+        if not size.isdigit() or int(size) not in thumbnails.THUMBNAIL_SIZES:
+            return web.json_response(
+                {"error": f"Unsupported thumbnail size: {size}"},
+                status=400
+            )
+        size = int(size)
+
+        # Character and style names are base64 encoded, model paths are
+        # URL encoded
+        if kind in ('character', 'style'):
+            name = decode_name(request.match_info['name'])
+        else:
+            name = unquote(request.match_info['name'])
+
+        resolved = await single_flight(
+            ("thumbnail_source", kind, name),
+            resolve_thumbnail_source, kind, name)
+        if resolved is None:
+            return web.Response(status=404)
+
+        source, version = resolved
+        fmt = thumbnails.normalize_format(request.query.get('fmt'))
+
+        if request.query.get('v') != version:
+            query = dict(request.query)
+            query['v'] = version
+            return web.Response(status=302, headers={
+                "Location": str(request.rel_url.with_query(query)),
+                "Cache-Control": "no-cache",
+            })
+
+        path = await asyncio.wrap_future(
+            thumbnails.request_thumbnail(source, version, size, fmt))
+        return web.FileResponse(path, headers={
+            "Content-Type": thumbnails.content_type(fmt),
+            "Cache-Control": thumbnails.IMMUTABLE_CACHE_CONTROL,
+        })
+    except Exception as e:
+        print(f"Error getting thumbnail: {e}")
+        return web.json_response({"error": str(e)}, status=500)
+
+
+def get_image_versions(images_dir):
+    """Map names to content hashes for every image in a directory"""
+    versions = {}
+    for image_path in images_dir.glob("*.jpg"):
+        try:
+            name = base64.urlsafe_b64decode(image_path.stem).decode('utf-8')
+        except Exception:
+            continue
+        versions[name] = thumbnails.source_version(image_path)
+    return versions
+
+
+@routes.get('/thumbnail_versions/{kind}')
+async def get_thumbnail_versions(request):
+    """Get the content hash of every character or style image"""
+    try:
+        kind = request.match_info['kind']
+        if kind == 'character':
+            images_dir = IMAGES_DIR
+        elif kind == 'style':
+            images_dir = STYLE_IMAGES_DIR
+        else:
+            return web.json_response(
+                {"error": f"Unknown image type: {kind}"},
+                status=400
+            )
+
+        versions = await single_flight(
+            ("thumbnail_versions", kind), get_image_versions, images_dir)
+        return web.json_response(versions)
+    except Exception as e:
+        return web.json_response({"error": str(e)}, status=500)
+
+
+def build_sprite(kind, names, size, fmt):
+    """Resolve sources and render the sprite sheet for a list of names"""
+    sources = []
+    missing = []
+    for name in names:
+        source = get_thumbnail_source(kind, name)
+        if source is None:
+            missing.append(name)
+            continue
+        sources.append((name, source, thumbnails.source_version(source)))
+
+    if not sources:
+        return None, missing
+
+    path, columns, rows = thumbnails.get_sprite(sources, size, fmt)
+    sprite = {
+        "url": f"/thumbnail_sprite/{path.name}",
+        "size": size,
+        "columns": columns,
+        "rows": rows,
+        "tiles": {
+            name: [index % columns, index // columns]
+            for index, (name, _, _) in enumerate(sources)
+        },
+    }
+    return sprite, missing
+
+
+@routes.post('/thumbnail_sprite')
+async def create_thumbnail_sprite(request):
+    """
+    Get one sprite sheet for a list of names, along with the tile position
+    of every name. Sheets are cached per set of names and image versions.
+    """
+    try:
+        data = await request.json()
+        kind = data.get('kind', 'character')
+        names = data.get('names') or []
+        size = data.get('size', thumbnails.DEFAULT_SIZE)
+        fmt = thumbnails.normalize_format(data.get('fmt'))
+
+        try:
+            size = int(size)
+        except (TypeError, ValueError):
+            pass
+
+        if size not in thumbnails.THUMBNAIL_SIZES:
+            return web.json_response(
+                {"error": f"Unsupported thumbnail size: {size}"},
+                status=400
+            )
+        if len(names) > thumbnails.SPRITE_MAX_TILES:
+            return web.json_response(
+                {"error": "Too many names for one sprite "
+                          f"(max {thumbnails.SPRITE_MAX_TILES})"},
+                status=400
+            )
+
+        loop = asyncio.get_running_loop()
+        sprite, missing = await loop.run_in_executor(
+            None, build_sprite, kind, names, size, fmt)
+        return web.json_response({"sprite": sprite, "missing": missing})
+    except Exception as e:
+        print(f"Error creating thumbnail sprite: {e}")
+        return web.json_response({"error": str(e)}, status=500)
+
+
+@routes.get('/thumbnail_sprite/{file}')
+async def get_thumbnail_sprite(request):
+    """Get a cached sprite sheet"""
+    try:
+        file_name = request.match_info['file']
+        path = thumbnails.THUMBNAIL_CACHE_DIR / file_name
+        if (not file_name.startswith('sprite_') or
+                path.parent != thumbnails.THUMBNAIL_CACHE_DIR or
+                not path.exists()):
+            return web.Response(status=404)
+
+        fmt = 'webp' if path.suffix == '.webp' else 'jpeg'
+        return web.FileResponse(path, headers={
+            "Content-Type": thumbnails.content_type(fmt),
+            "Cache-Control": thumbnails.IMMUTABLE_CACHE_CONTROL,
+        })
+    except Exception as e:
+        print(f"Error getting thumbnail sprite: {e}")
+        return web.json_response({"error": str(e)}, status=500)
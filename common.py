@@ -1,4 +1,6 @@
 import os
+import threading
+from collections import OrderedDict
 import folder_paths
 
 
@@ -112,6 +114,88 @@ def get_upscale_model_list():
     return ["none"] + sorted(models)
 
 
+# Functions called when ComfyUI unloads its models
+_unload_callbacks = []
+
+
+def on_unload_models(callback):
+    """
+    Call a function whenever ComfyUI unloads all models, as the "Unload
+    Models" button and the /free route do, so caches kept by these nodes
+    are released along with ComfyUI's own.
+    """
+    import comfy.model_management as mm
+
+    if not _unload_callbacks:
+        unload_all_models = mm.unload_all_models
+
+        def unload_all_models_and_caches(*args, **kwargs):
+            for unload in _unload_callbacks:
+                try:
+                    unload()
+                except Exception as e:
+                    print(f"Error releasing cached models: {e}")
+            return unload_all_models(*args, **kwargs)
+
+        mm.unload_all_models = unload_all_models_and_caches
+    _unload_callbacks.append(callback)
+
+
+# Number of upscale models kept loaded between uses
+UPSCALE_CACHE_SIZE = int(os.environ.get("MUDKNIGHT_UPSCALE_CACHE", 2))
+
+# Upscale models keyed by name, to (mtime, model), least recently used
+# first
+_upscale_models = OrderedDict()
+_upscale_models_lock = threading.Lock()
+
+
+def load_upscale_model(model_name):
+    """
+    Load an upscale model through a process-wide LRU cache.
+
+    The cache is keyed by name and validated by the file's mtime, so a
+    replaced model file is loaded again.
+    """
+    full_path = folder_paths.get_full_path("upscale_models", model_name)
+    if not full_path or not os.path.exists(full_path):
+        raise FileNotFoundError(f"Upscale model not found: {model_name}")
+    mtime = os.path.getmtime(full_path)
+
+    with _upscale_models_lock:
+        cached = _upscale_models.get(model_name)
+        if cached and cached[0] == mtime:
+            _upscale_models.move_to_end(model_name)
+            return cached[1]
+
+        loader = Node("UpscaleModelLoader")
+        upscale_model = loader.function(model_name)[0]
+        _upscale_models[model_name] = (mtime, upscale_model)
+        _upscale_models.move_to_end(model_name)
+        while len(_upscale_models) > max(UPSCALE_CACHE_SIZE, 1):
+            _upscale_models.popitem(last=False)
+        return upscale_model
+
+
+def clear_upscale_models():
+    """Drop every cached upscale model."""
+    with _upscale_models_lock:
+        _upscale_models.clear()
+
+
+# Cached upscale models are released with the models ComfyUI unloads
+on_unload_models(clear_upscale_models)
+
+
+def upscale_with_model(upscale_model, image):
+    """
+    Upscale an image with a model from load_upscale_model. Cached models
+    stay in RAM, ComfyUI moves them to the GPU for the upscale only.
+    """
+    upscale_node = Node("ImageUpscaleWithModel")
+    return upscale_node.function(upscale_model, image)[0]
+
+
 class Node:
     """Wrapper for ComfyUI nodes to simplify function calls."""
 
@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Change tracking for the JSONC config files.
+
+A daemon thread polls the files and diffs their top-level entries, so edits
+made through the API, in another tab or by hand are all reported the same
+way: as a new version number and the names of the entries that changed.
+"""
+
+import hashlib
+import json
+import threading
+
+
+# Seconds between polls of the config files
+POLL_INTERVAL = 1.0
+
+
+def entry_digest(value):
+    """Get a digest of an entry's value, independent of key order."""
+    payload = json.dumps(value, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()
+
+
+class ConfigWatcher:
+    """
+    Watch config files for changes to their top-level entries.
+
+    Args:
+        files: Dict of config name to file path
+        load: Callable that parses a config file into a dict
+        on_change: Callable taking (config, version, entries), called from
+            the polling thread or from whoever called check()
+    """
+
+    def __init__(self, files, load, on_change, interval=POLL_INTERVAL):
+        self.files = files
+        self.load = load
+        self.on_change = on_change
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        # Config name to (stamp, entry digests, version)
+        self._state = {}
+
+    def _stamp(self, path):
+        try:
+            stat = path.stat()
+        except OSError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    def _check(self, name, force):
+        path = self.files[name]
+        stamp = self._stamp(path)
+        previous = self._state.get(name)
+        if previous is not None and previous[0] == stamp and not force:
+            return None
+
+        try:
+            data = self.load(path) if stamp is not None else {}
+        except Exception as e:
+            # Probably caught halfway through a write, try again next poll
+            print(f"Config watcher: could not read {path.name}: {e}")
+            return None
+        if not isinstance(data, dict):
+            data = {}
+        digests = {key: entry_digest(value) for key, value in data.items()}
+
+        if previous is None:
+            self._state[name] = (stamp, digests, 0)
+            return None
+
+        _, old_digests, version = previous
+        changed = sorted(
+            key for key in old_digests.keys() | digests.keys()
+            if old_digests.get(key) != digests.get(key)
+        )
+        if changed:
+            version += 1
+        self._state[name] = (stamp, digests, version)
+        return (name, version, changed) if changed else None
+
+    def check(self, name=None, force=False):
+        """
+        Check one config, or all of them, and report the changes.
+
+        Args:
+            name: Config to check, or None for all
+            force: Re-read even if the file size and mtime look unchanged,
+                for callers that know they just wrote the file
+
+        Returns:
+            List of (config, version, entries) tuples that were reported
+        """
+        names = [name] if name is not None else list(self.files)
+        with self._lock:
+            changes = [self._check(config, force) for config in names]
+            changes = [change for change in changes if change is not None]
+
+        for config, version, entries in changes:
+            try:
+                self.on_change(config, version, entries)
+            except Exception as e:
+                print(f"Config watcher: error reporting {config}: {e}")
+        return changes
+
+    def versions(self):
+        """Get the current version of every config."""
+        with self._lock:
+            return {name: state[2] for name, state in self._state.items()}
+
+    def version(self, name):
+        """Get the current version of a config."""
+        with self._lock:
+            state = self._state.get(name)
+            return state[2] if state else 0
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.check()
+
+    def start(self):
+        """Take the initial snapshot and start polling in the background."""
+        self.check()
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="config-watcher", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop polling."""
+        self._stop.set()
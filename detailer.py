@@ -5,10 +5,19 @@ Custom ComfyUI node for face/object detection and detailing.
 Combines bbox detection, cropping, upscaling, and inpainting into a single
 node.
 """
+import functools
+import hashlib
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 import comfy.samplers
 import nodes
 import torch
 from . import common
+from . import region_planner
 
 UPSCALE_METHODS = [
     "lanczos", "bilinear", "bicubic", "area", "nearest-exact"
@@ -16,6 +25,26 @@ UPSCALE_METHODS = [
 
 upscale_model_list = common.get_upscale_model_list()
 
+# Crops are sampled at about this many megapixels
+TARGET_MEGAPIXELS = 1.0
+
+# Adaptive resolution never samples below this many megapixels, models
+# lose coherence on smaller images
+MIN_MEGAPIXELS = 0.25
+
+# Scaled steps never drop below this fraction of the steps
+MIN_STEP_SCALE = 0.5
+
+# Batched crops are snapped to multiples of this many pixels, so crops of
+# similar aspect ratio end up in the same bucket
+BUCKET_STEP = 64
+
+# Largest number of crops sampled in one batch
+MAX_BATCH_SIZE = 8
+
+# Prepare and finish regions on a worker thread while others sample
+PIPELINE_REGIONS = os.environ.get("MUDKNIGHT_DETAILER_PIPELINE", "1") == "1"
+
 CORE_INPUTS = {
     # Core inputs
     "image": ("IMAGE",),
@@ -79,6 +108,61 @@ DETAILER_INPUTS = {
                     "64-128 = recommended for better blending")}),
 }
 
+# Optional, so prompts saved before these existed still validate. The
+# defaults keep the original behavior.
+REGION_INPUTS = {
+    "batch_regions": ("BOOLEAN", {
+        "default": False,
+        "tooltip": ("Sample similarly shaped regions together in one "
+                    "batch. Much faster with many regions, but the "
+                    "noise differs from sampling them one at a time")}),
+    "region_merge": (region_planner.MERGE_MODES, {
+        "default": "none",
+        "tooltip": ("How overlapping detections are combined before "
+                    "sampling: union samples them as one region, nms "
+                    "keeps the most confident one")}),
+    "merge_iou": ("FLOAT", {
+        "default": 0.3, "min": 0.0, "max": 1.0, "step": 0.01,
+        "tooltip": ("Minimum overlap (intersection over union) of two "
+                    "detections to combine them. 0 = any overlap")}),
+    "max_upscale": ("FLOAT", {
+        "default": 0.0, "min": 0.0, "max": 16.0, "step": 0.5,
+        "tooltip": ("Sample each region at most this many times its "
+                    "size (but at least 0.25MP), instead of always at "
+                    "1MP. 0 = always 1MP")}),
+    "scale_steps": ("BOOLEAN", {
+        "default": False,
+        "tooltip": ("With max_upscale, use fewer steps for regions "
+                    "that are upscaled less, down to half the steps")}),
+}
+
+BUDGET_INPUTS = {
+    # Limits on the regions sampled per image, 0 = no limit. Regions are
+    # ranked by confidence x area and the lowest ranked ones are skipped.
+    "max_regions": ("INT", {
+        "default": 0, "min": 0, "max": 1000,
+        "tooltip": "Most regions to sample, 0 = no limit"}),
+    "top_k": ("INT", {
+        "default": 0, "min": 0, "max": 1000,
+        "tooltip": ("Only consider the k most confident detections, "
+                    "0 = all")}),
+    "min_area": ("INT", {
+        "default": 0, "min": 0, "max": 67108864, "step": 64,
+        "tooltip": "Skip regions smaller than this many pixels"}),
+    "max_area": ("INT", {
+        "default": 0, "min": 0, "max": 67108864, "step": 64,
+        "tooltip": ("Skip regions larger than this many pixels, "
+                    "0 = no limit")}),
+    "megapixel_budget": ("FLOAT", {
+        "default": 0.0, "min": 0.0, "max": 1000.0, "step": 0.5,
+        "tooltip": ("Most megapixels to sample in total, "
+                    "0 = no limit")}),
+    "time_budget": ("FLOAT", {
+        "default": 0.0, "min": 0.0, "max": 3600.0, "step": 1.0,
+        "tooltip": ("Stop sampling new regions after this many seconds, "
+                    "0 = no limit")}),
+}
+
 
 def crop_image_by_mask(image, mask, padding=0, upscale_factor=1):
     """
@@ -107,43 +191,261 @@ def crop_image_by_mask(image, mask, padding=0, upscale_factor=1):
     return crop, mask[:, y_min:y_max, x_min:x_max], bbox
 
 
+def seg_mask_bounds(seg, image_width, image_height):
+    """
+    Get the (x_min, y_min, x_max, y_max) pixel bounds of a SEG's mask in
+    image coordinates, or None if the mask is empty.
+
+    This is the area SegsToCombinedMask would mark for the SEG alone,
+    found from its crop-sized mask instead of a full-size one.
+    """
+    x1, y1, x2, y2 = (int(v) for v in seg.crop_region)
+    cropped_mask = seg.cropped_mask
+    if cropped_mask is None:
+        x1, y1, x2, y2 = (int(v) for v in seg.bbox)
+        cropped_mask = torch.ones((y2 - y1, x2 - x1))
+    cropped_mask = torch.as_tensor(cropped_mask).float()
+    if cropped_mask.dim() == 3:
+        cropped_mask = cropped_mask[0]
+
+    # Parts of the crop region outside the image are dropped
+    width = min(x2, image_width) - x1
+    height = min(y2, image_height) - y1
+    left = max(0, -x1)
+    top = max(0, -y1)
+    # Values that round down to 0 in the 8-bit combined mask don't count
+    marked = cropped_mask[top:height, left:width] * 255 >= 1
+
+    rows = torch.nonzero(marked.any(dim=1))
+    cols = torch.nonzero(marked.any(dim=0))
+    if rows.numel() == 0:
+        return None
+    return (x1 + left + cols[0].item(), y1 + top + rows[0].item(),
+            x1 + left + cols[-1].item(), y1 + top + rows[-1].item())
+
+
+def seg_crop_box(seg, image_width, image_height, padding=0):
+    """
+    Get the crop box of a SEG: the bounds of its mask plus padding, as
+    (x_min, y_min, x_max, y_max) with max exclusive.
+
+    Same crop as crop_image_by_mask on the SEG's combined mask, without
+    building or scanning a full-size mask.
+    """
+    bounds = seg_mask_bounds(seg, image_width, image_height)
+    if bounds is None:
+        return (0, 0, image_width, image_height)
+
+    x_min, y_min, x_max, y_max = bounds
+    return (max(0, x_min - padding), max(0, y_min - padding),
+            min(image_width, x_max + padding),
+            min(image_height, y_max + padding))
+
+
+def crop_image_by_box(image, box):
+    """Crops an image to a box, returning the crop and its bbox."""
+    x_min, y_min, x_max, y_max = box
+    crop = image[:, y_min:y_max, x_min:x_max, :]
+    return crop, (x_min, y_min, x_max - x_min, y_max - y_min)
+
+
+def group_regions(keys, batch_regions):
+    """
+    Group regions that are sampled in one batch, by their scaled shape
+    and step count.
+
+    Returns:
+        Lists of region indices, in the order of keys
+    """
+    if not batch_regions:
+        return [[i] for i in range(len(keys))]
+    buckets = {}
+    for i, key in enumerate(keys):
+        buckets.setdefault(tuple(key), []).append(i)
+    return [
+        indices[start:start + MAX_BATCH_SIZE]
+        for indices in buckets.values()
+        for start in range(0, len(indices), MAX_BATCH_SIZE)
+    ]
+
+
+@functools.lru_cache(maxsize=64)
+def feather_ramp(size, feather_pix):
+    """
+    Create the 1D blending ramp of one side of a crop on the CPU, fading
+    to 0 over feather_pix pixels at both ends.
+
+    The ramp is shared between calls and must not be modified.
+    """
+    ramp = torch.ones(size, dtype=torch.float64)
+    if feather_pix > 0:
+        edge = torch.arange(feather_pix, dtype=torch.float64)
+        edge /= feather_pix
+        ramp[:feather_pix] = edge
+        ramp[size - feather_pix:] = edge.flip(0)
+    return ramp.to(torch.float32)
+
+
+def feather_mask(h, w, feather, device):
+    """
+    Create the blending mask of an h x w crop on a device, fading to 0
+    over feather / 2 of its shorter side at every edge.
+
+    Only the ramps of each side are cached, on the CPU.
+    """
+    feather_pix = int(min(w, h) * (feather / 2)) if feather > 0 else 0
+    ramp_h = feather_ramp(h, feather_pix).to(device)
+    ramp_w = feather_ramp(w, feather_pix).to(device)
+    return ramp_h.view(1, h, 1, 1) * ramp_w.view(1, 1, w, 1)
+
+
 def uncrop_image_by_bbox(
-    full_img, crop_img, bbox, feather=0.0, use_square=True
+    full_img, crop_img, bbox, feather=0.0, use_square=True, in_place=False
 ):
     """
     Composites a cropped image back into the original full image.
+
+    With in_place, full_img is modified instead of copied.
     """
     x, y, w, h = bbox
-    target = full_img.clone()
+    target = full_img if in_place else full_img.clone()
 
     # Ensure crop matches expected bbox size (handles scaling mismatches)
     if crop_img.shape[1] != h or crop_img.shape[2] != w:
-        import nodes
         scaler = nodes.ImageScale()
         crop_img = scaler.upscale(
             crop_img, "bicubic", w, h, "disabled"
         )[0]
 
-    # Create feather mask
-    mask = torch.ones((1, h, w, 1), device=full_img.device)
-    if feather > 0:
-        feather_pix = int(min(w, h) * (feather / 2))
-        if feather_pix > 0:
-            for i in range(feather_pix):
-                v = i / feather_pix
-                mask[:, i, :, :] *= v
-                mask[:, -(i + 1), :, :] *= v
-                mask[:, :, i, :] *= v
-                mask[:, :, -(i + 1), :] *= v
-
-    # Composite
+    mask = feather_mask(h, w, feather, full_img.device)
+
+    # Composite, only touching the region
     original_region = target[:, y:y+h, x:x+w, :]
     blended = crop_img * mask + original_region * (1 - mask)
-    target[:, y:y+h, x:x+w, :] = blended
+    original_region.copy_(blended)
 
     return target
 
 
+# Number of detection models kept loaded between runs
+DETECTOR_CACHE_SIZE = int(os.environ.get("MUDKNIGHT_DETECTOR_CACHE", 4))
+
+# Bbox detectors keyed by model name, least recently used first
+_detectors = OrderedDict()
+_detectors_lock = threading.Lock()
+
+
+def load_detector(model_name):
+    """Get the bbox detector of an Ultralytics model, loading it once."""
+    with _detectors_lock:
+        if model_name in _detectors:
+            _detectors.move_to_end(model_name)
+            return _detectors[model_name]
+
+        ultralytics_provider = common.Node("UltralyticsDetectorProvider")
+        detector = ultralytics_provider.function(model_name)[0]
+        _detectors[model_name] = detector
+        while len(_detectors) > max(DETECTOR_CACHE_SIZE, 1):
+            _detectors.popitem(last=False)
+        return detector
+
+
+def evict_detector(model_name=None):
+    """
+    Drop a cached detector and the detections made with it, or all of
+    them if no name is given.
+    """
+    with _detectors_lock:
+        if model_name is None:
+            _detectors.clear()
+        else:
+            _detectors.pop(model_name, None)
+    with _detections_lock:
+        for key in list(_detections):
+            if model_name is None or model_name in key[1:3]:
+                del _detections[key]
+
+
+# Detectors are released with the models ComfyUI unloads
+common.on_unload_models(evict_detector)
+
+
+# Number of detection results kept, so sampling changes skip detection
+DETECTION_CACHE_SIZE = int(
+    os.environ.get("MUDKNIGHT_DETECTION_CACHE", 16))
+
+# SEGS keyed by (image hash, model, fallback model, threshold), least
+# recently used first
+_detections = OrderedDict()
+_detections_lock = threading.Lock()
+_detection_stats = {"hits": 0, "misses": 0}
+
+
+def image_hash(image):
+    """Hash the content, shape and dtype of an image tensor."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(f"{tuple(image.shape)} {image.dtype}".encode())
+    data = image.detach().contiguous().cpu().view(torch.uint8)
+    digest.update(data.numpy())
+    return digest.hexdigest()
+
+
+def detection_cache_stats():
+    """Get the hits, misses and hit rate of the detection cache."""
+    with _detections_lock:
+        hits = _detection_stats["hits"]
+        misses = _detection_stats["misses"]
+        size = len(_detections)
+    total = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": hits / total if total else 0.0,
+        "size": size,
+    }
+
+
+def detect_segs(image, bbox_model, fallback_model, threshold):
+    """
+    Detect SEGS with the bbox model, or the fallback model if the bbox
+    model finds nothing. Results are cached by image content, so runs
+    that only change sampling settings skip detection.
+    """
+    key = (image_hash(image), bbox_model, fallback_model, threshold)
+    with _detections_lock:
+        segs = _detections.get(key)
+        if segs is not None:
+            _detections.move_to_end(key)
+            _detection_stats["hits"] += 1
+        else:
+            _detection_stats["misses"] += 1
+    if segs is not None:
+        return segs
+
+    # Get the primary bbox detector
+    bbox_detector = load_detector(bbox_model)
+
+    # (using default values for dilation, crop_factor, drop_size)
+    bbox_detector_node = common.Node("BboxDetectorSEGS")
+    segs = bbox_detector_node.function(
+        bbox_detector, image, threshold, 10, 3.0, 10, "all"
+    )[0]
+
+    # If no detections and fallback is available, try fallback. It
+    # is only loaded when needed.
+    if (not segs or len(segs[1]) == 0) and fallback_model != "none":
+        bbox_fallback = load_detector(fallback_model)
+        segs = bbox_detector_node.function(
+            bbox_fallback, image, threshold, 10, 3.0, 10, "all"
+        )[0]
+
+    with _detections_lock:
+        _detections[key] = segs
+        while len(_detections) > max(DETECTION_CACHE_SIZE, 1):
+            _detections.popitem(last=False)
+    return segs
+
+
 def get_ultralytics_model_list():
     """Get list of available Ultralytics models."""
     try:
@@ -160,106 +462,329 @@ def get_ultralytics_model_list():
     return ["bbox/face_yolov8m.pt"]
 
 
+def target_shape(height, width, megapixels=TARGET_MEGAPIXELS,
+                 step=BUCKET_STEP):
+    """
+    Get the (height, width) a crop is sampled at: about megapixels in
+    total, snapped to multiples of step so similar crops share a bucket.
+    """
+    scale = math.sqrt(megapixels * 1024 * 1024 / (height * width))
+    return (max(step, round(height * scale / step) * step),
+            max(step, round(width * scale / step) * step))
+
+
+def region_megapixels(height, width, max_upscale=0.0):
+    """
+    Get the megapixels a crop is sampled at. With max_upscale, small
+    crops are upscaled at most that much instead of to TARGET_MEGAPIXELS.
+    """
+    if not max_upscale:
+        return TARGET_MEGAPIXELS
+    megapixels = height * width * max_upscale ** 2 / (1024 * 1024)
+    return min(TARGET_MEGAPIXELS, max(MIN_MEGAPIXELS, megapixels))
+
+
+def region_steps(steps, height, width, megapixels, max_upscale=0.0):
+    """
+    Scale the steps of a crop by how much it is upscaled relative to
+    max_upscale, since a crop that is barely upscaled has little detail
+    to add.
+    """
+    if not max_upscale:
+        return steps
+    upscale = math.sqrt(megapixels * 1024 * 1024 / (height * width))
+    scale = max(MIN_STEP_SCALE, min(1.0, upscale / max_upscale))
+    return max(1, round(steps * scale))
+
+
+def region_sampling(height, width, steps, max_upscale=0.0,
+                    scale_steps=False):
+    """Get the (megapixels, steps) a crop is sampled with."""
+    megapixels = region_megapixels(height, width, max_upscale)
+    if scale_steps:
+        steps = region_steps(steps, height, width, megapixels, max_upscale)
+    return megapixels, steps
+
+
+def inset_noise_mask(height, width, context_padding_pixels, device):
+    """Create a noise mask that only samples the center of a crop."""
+    # Can't exceed half the dimension
+    inset_x = min(context_padding_pixels, width // 2)
+    inset_y = min(context_padding_pixels, height // 2)
+
+    inset_mask = torch.zeros(
+        (1, height, width), dtype=torch.float32, device=device)
+    inset_mask[
+        :,
+        inset_y:height - inset_y,
+        inset_x:width - inset_x
+    ] = 1.0
+    return inset_mask
+
+
+def sample_batch(
+        scaled_images, model, vae,
+        positive, negative, seed, steps, cfg, sampler, scheduler,
+        denoise, context_padding_pixels, device):
+    """
+    Encode, sample and decode same-sized crops as one latent batch.
+
+    Returns:
+        List of decoded images, one per crop
+    """
+    batch = torch.cat(scaled_images, dim=0)
+
+    # Encode to latent
+    vae_encode = nodes.VAEEncode()
+    latent = vae_encode.encode(vae, batch)[0]
+
+    # Apply inset latent noise masks if context padding > 0, one per
+    # region so each keeps its own sampled area
+    if context_padding_pixels > 0:
+        noise_mask = torch.cat([
+            inset_noise_mask(
+                image.shape[1], image.shape[2],
+                context_padding_pixels, device)
+            for image in scaled_images
+        ], dim=0)
+        set_mask_node = common.Node("SetLatentNoiseMask")
+        latent = set_mask_node.function(latent, noise_mask)[0]
+
+    sampled_latent = common.sample_latent(
+        model, positive, negative, seed, sampler,
+        scheduler, steps, cfg, denoise, latent)
+
+    # Decode latent
+    vae_decode = nodes.VAEDecode()
+    decoded = vae_decode.decode(vae, sampled_latent)[0]
+    return list(decoded.split(1, dim=0))
+
+
+class RegionWorker:
+    """
+    Runs detailer tasks on one thread, in the order they are submitted,
+    with the grad and inference mode of the thread that created it.
+    Without PIPELINE_REGIONS, tasks run right away on the calling thread.
+    """
+
+    def __init__(self):
+        self.grad_enabled = torch.is_grad_enabled()
+        self.inference_mode = torch.is_inference_mode_enabled()
+        self.executor = None
+        if PIPELINE_REGIONS:
+            self.executor = ThreadPoolExecutor(
+                max_workers=1, thread_name_prefix="detailer")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+
+    def _run(self, func, *args):
+        with torch.inference_mode(self.inference_mode), \
+                torch.set_grad_enabled(self.grad_enabled):
+            return func(*args)
+
+    def submit(self, func, *args):
+        """Run func(*args), returning a Future of its result."""
+        if self.executor is not None:
+            return self.executor.submit(self._run, func, *args)
+        future = Future()
+        try:
+            future.set_result(func(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+
+
 def process_segs(
         image, model, vae,
         positive, negative, seed, steps, cfg, sampler, scheduler,
         denoise, upscale_method, upscale_model, feather,
-        edge_erosion, context_padding_pixels, segs):
-    """Process segments with optional context padding via inset mask."""
-    processed_crops = []
-    eroded_crops = []
-    bboxes = []
-
-    # Iterate through all detected segments
-    for seg in segs[1]:
-        # Create a temporary SEGS with just this segment
-        temp_segs = (segs[0], [seg])
-
-        # Step 2: Convert single SEG to mask
-        mask_node = common.Node("SegsToCombinedMask")
-        mask = mask_node.function(temp_segs)[0]
-
-        # Step 3: Crop image from mask
-        crop_image, _, bbox = crop_image_by_mask(image, mask, padding=10)
-
-        if upscale_model != "none":
-            # Step 4: Upscale cropped image with model
-            upscale_model_loader_node = common.Node("UpscaleModelLoader")
-            upscale_model_obj = upscale_model_loader_node.function(
-                    upscale_model)[0]
-
-            upscale_node = common.Node("ImageUpscaleWithModel")
-            upscaled_image = upscale_node.function(
-                    upscale_model_obj, crop_image)[0]
-        else:
-            upscaled_image = crop_image
-
-        # Step 5: Scale cropped image
-        scale_node = common.Node("ImageScaleToTotalPixels")
-        scaled_image = scale_node.function(
-                upscaled_image, upscale_method, 1, 1)[0]
-
-        # Step 6: Encode to latent
-        vae_encode = nodes.VAEEncode()
-        latent = vae_encode.encode(vae, scaled_image)[0]
-
-        # Step 6.5: Apply inset latent noise mask if context padding > 0
-        if context_padding_pixels > 0:
-            # Get dimensions of scaled image
-            img_height = scaled_image.shape[1]
-            img_width = scaled_image.shape[2]
-
-            # Calculate inset amount (can't exceed half the dimension)
-            inset_x = min(context_padding_pixels, img_width // 2)
-            inset_y = min(context_padding_pixels, img_height // 2)
-
-            # Create inset mask - only the center region gets sampled
-            inset_mask = torch.zeros(
-                (1, img_height, img_width),
-                dtype=torch.float32,
-                device=image.device
-            )
-            inset_mask[
-                :,
-                inset_y:img_height - inset_y,
-                inset_x:img_width - inset_x
-            ] = 1.0
-
-            # Set the noise mask on the latent
-            set_mask_node = common.Node("SetLatentNoiseMask")
-            latent = set_mask_node.function(latent, inset_mask)[0]
-
-        # Step 7: KSampler - Get sampler object
-        sampled_latent = common.sample_latent(
-            model, positive, negative, seed, sampler,
-            scheduler, steps, cfg, denoise, latent)
-
-        # Step 8: Decode latent
-        vae_decode = nodes.VAEDecode()
-        decoded_image = vae_decode.decode(vae, sampled_latent)[0]
-
-        # Step 9: Get original crop size
-        orig_height = crop_image.shape[1]
-        orig_width = crop_image.shape[2]
-
-        # Step 10: Scale back to original crop size
-        image_scale = nodes.ImageScale()
-        resized_image = image_scale.upscale(
-            decoded_image, upscale_method,
-            orig_width, orig_height, "disabled"
-        )[0]
+        edge_erosion, context_padding_pixels, segs, batch_regions=False,
+        region_merge="none", merge_iou=0.3, budget=None, max_upscale=0.0,
+        scale_steps=False):
+    """
+    Process segments with optional context padding via inset mask.
 
-        # Step 10.5: Create eroded mask to remove edge artifacts
-        bbox_inset_and_crop = common.Node("BBoxInsetAndCrop")
-        eroded_image, eroded_bbox = bbox_inset_and_crop.function(
-                resized_image, bbox, edge_erosion)
+    Overlapping SEGs are merged according to region_merge and merge_iou
+    first, and regions beyond the BUDGET_INPUTS limits in budget are
+    skipped, see region_planner. Crops are sampled at 1MP, or at most
+    max_upscale times their size, see region_megapixels. With
+    batch_regions, crops are scaled to a bucketed shape and each bucket
+    is sampled in one batch instead of one sampler call per crop.
 
-        # Store the processed crop, bbox, and mask
-        processed_crops.append(resized_image)
-        eroded_crops.append(eroded_image)
-        bboxes.append(eroded_bbox)
+    While a group samples, a worker thread scales the crops of the next
+    group and scales back, erodes and composites the previous one. The
+    output is the same as doing it all in order.
 
-    return (processed_crops, eroded_crops, bboxes)
+    Returns:
+        (processed_crops, eroded_crops, eroded_bboxes, final_image)
+    """
+    start_time = time.monotonic()
+    budget = dict(budget or {})
+    time_budget = budget.pop("time_budget", 0)
+
+    # Loaded once for all segments, and cached between runs
+    upscale_model_obj = None
+    if upscale_model != "none":
+        upscale_model_obj = common.load_upscale_model(upscale_model)
+
+    # Steps 2-3: Find the crop of every SEG and merge overlapping ones
+    image_height, image_width = image.shape[1], image.shape[2]
+    seg_boxes = [
+        seg_crop_box(seg, image_width, image_height, padding=10)
+        for seg in segs[1]
+    ]
+    scores = [float(seg.confidence) for seg in segs[1]]
+    boxes, scores, report = region_planner.plan_regions(
+        seg_boxes, scores, region_merge, merge_iou, budget,
+        bool(time_budget),
+        lambda box: region_megapixels(
+            box[3] - box[1], box[2] - box[0], max_upscale))
+
+    def sampling_key(box):
+        x1, y1, x2, y2 = box
+        megapixels, region_step_count = region_sampling(
+            y2 - y1, x2 - x1, steps, max_upscale, scale_steps)
+        return (*target_shape(y2 - y1, x2 - x1, megapixels),
+                region_step_count)
+
+    # Group crops that are sampled together, in planned order. The
+    # scaled shapes follow from the boxes, so this needs no cropping.
+    groups = group_regions(
+        [sampling_key(box) for box in boxes], batch_regions)
+
+    if batch_regions:
+        report["sampler_calls_in"] = len(group_regions(
+            [sampling_key(box) for box in seg_boxes], True))
+        report["sampler_calls_out"] = len(groups)
+
+    count = len(boxes)
+    crops = [None] * count
+    bboxes = [None] * count
+    scaled_images = [None] * count
+    region_step_counts = [None] * count
+    processed_crops = [None] * count
+    eroded_crops = [None] * count
+    eroded_bboxes = [None] * count
+    final_image = image.clone()
+    next_composite = 0
+
+    def upscale_group(indices):
+        """Crop, and upscale with the model if any. Main thread only,
+        since the model upscale manages GPU memory."""
+        for i in indices:
+            crops[i], bboxes[i] = crop_image_by_box(image, boxes[i])
+        if upscale_model_obj is None:
+            return [crops[i] for i in indices]
+        # Step 4: Upscale cropped image with model
+        return [common.upscale_with_model(upscale_model_obj, crops[i])
+                for i in indices]
+
+    def scale_group(indices, upscaled_images):
+        for i, upscaled_image in zip(indices, upscaled_images):
+            # Step 5: Scale cropped image
+            crop_height, crop_width = crops[i].shape[1], crops[i].shape[2]
+            megapixels, region_step_counts[i] = region_sampling(
+                crop_height, crop_width, steps, max_upscale, scale_steps)
+            if batch_regions:
+                height, width = target_shape(
+                    crop_height, crop_width, megapixels)
+                image_scale = nodes.ImageScale()
+                scaled_images[i] = image_scale.upscale(
+                    upscaled_image, upscale_method, width, height,
+                    "disabled"
+                )[0]
+            else:
+                scale_node = common.Node("ImageScaleToTotalPixels")
+                scaled_images[i] = scale_node.function(
+                        upscaled_image, upscale_method, megapixels, 1)[0]
+
+    def composite_ready(flush=False):
+        """Composite finished regions in planned order. With flush, the
+        regions that were never sampled are skipped."""
+        nonlocal next_composite
+        while next_composite < count:
+            i = next_composite
+            if eroded_crops[i] is not None:
+                uncrop_image_by_bbox(
+                    final_image, eroded_crops[i], eroded_bboxes[i],
+                    feather=feather, in_place=True)
+            elif not flush:
+                break
+            next_composite += 1
+
+    def finish_group(indices, decoded_images):
+        for i, decoded_image in zip(indices, decoded_images):
+            # Step 9: Get original crop size
+            orig_height = crops[i].shape[1]
+            orig_width = crops[i].shape[2]
+
+            # Step 10: Scale back to original crop size
+            image_scale = nodes.ImageScale()
+            resized_image = image_scale.upscale(
+                decoded_image, upscale_method,
+                orig_width, orig_height, "disabled"
+            )[0]
+
+            # Step 10.5: Create eroded mask to remove edge artifacts
+            bbox_inset_and_crop = common.Node("BBoxInsetAndCrop")
+            eroded_image, eroded_bbox = bbox_inset_and_crop.function(
+                    resized_image, bboxes[i], edge_erosion)
+
+            # Store the processed crop, bbox, and mask
+            processed_crops[i] = resized_image
+            eroded_crops[i] = eroded_image
+            eroded_bboxes[i] = eroded_bbox
+
+        # Step 11: Uncrop the processed regions back onto the image
+        composite_ready()
+
+    # Steps 6-8: Encode, sample and decode each group, most important
+    # regions first, until the time budget runs out
+    with RegionWorker() as worker:
+        futures = []
+        if groups:
+            prepared = worker.submit(
+                scale_group, groups[0], upscale_group(groups[0]))
+        for n, indices in enumerate(groups):
+            prepared.result()
+            elapsed = time.monotonic() - start_time
+            if n > 0 and time_budget and elapsed >= time_budget:
+                skipped = sum(len(rest) for rest in groups[n:])
+                report["regions_out"] -= skipped
+                report["regions_skipped"] += skipped
+                report["sampler_calls_out"] = n
+                break
+
+            # Prepare the next group while this one samples
+            if n + 1 < len(groups):
+                prepared = worker.submit(
+                    scale_group, groups[n + 1],
+                    upscale_group(groups[n + 1]))
+
+            decoded = sample_batch(
+                [scaled_images[i] for i in indices], model, vae,
+                positive, negative, seed, region_step_counts[indices[0]],
+                cfg, sampler, scheduler,
+                denoise, context_padding_pixels, image.device)
+            futures.append(worker.submit(finish_group, indices, decoded))
+
+        for future in futures:
+            future.result()
+    composite_ready(flush=True)
+
+    if report["regions_in"] != report["regions_out"]:
+        print(f"FastDetailer: {region_planner.format_report(report)}")
+
+    done = [i for i in range(count) if eroded_crops[i] is not None]
+    return ([processed_crops[i] for i in done],
+            [eroded_crops[i] for i in done],
+            [eroded_bboxes[i] for i in done],
+            final_image)
 
 
 class DetailerNode:
@@ -286,6 +811,12 @@ class DetailerNode:
                 # Detection parameters
                 **DETAILER_INPUTS,
             },
+            "optional": {
+                # Region planning parameters
+                **REGION_INPUTS,
+                # Budget parameters
+                **BUDGET_INPUTS,
+            },
             "hidden": {"extra_pnginfo": "EXTRA_PNGINFO"},
         }
 
@@ -299,48 +830,30 @@ class DetailerNode:
     def process(self, bbox_model, fallback_model, image, model, vae,
                 positive, negative, seed, steps, cfg, sampler, scheduler,
                 denoise, upscale_method, upscale_model, threshold, feather,
-                edge_erosion, context_padding, extra_pnginfo=None):
+                edge_erosion, context_padding, batch_regions=False,
+                region_merge="none", merge_iou=0.3, max_upscale=0.0,
+                scale_steps=False, extra_pnginfo=None, **budget):
         """Main processing function."""
 
         # Create placeholder for early returns
         placeholder = torch.zeros((1, 1, 1, 3), dtype=image.dtype,
                                   device=image.device)
 
-        # Create the primary bbox detector
-        ultralytics_provider = common.Node("UltralyticsDetectorProvider")
-        bbox_detector = ultralytics_provider.function(bbox_model)[0]
-
-        # Create fallback detector if not "none"
-        bbox_fallback = None
-        if fallback_model != "none":
-            fallback_provider = common.Node("UltralyticsDetectorProvider")
-            bbox_fallback = fallback_provider(fallback_model)[0]
-
-        # Step 1: Detect bounding boxes
-        # (using default values for dilation, crop_factor, drop_size)
-        bbox_detector_node = common.Node("BboxDetectorSEGS")
-        segs_result = bbox_detector_node.function(
-            bbox_detector, image, threshold, 10, 3.0, 10, "all"
-        )
-        segs = segs_result[0]
-
-        # If no detections and fallback is available, try fallback
-        if (not segs or len(segs[1]) == 0) and bbox_fallback is not None:
-            segs_result = bbox_detector_node.function(
-                bbox_fallback, image, threshold, 10, 3.0, 10, "all"
-            )
-            segs = segs_result[0]
+        # Step 1: Detect bounding boxes, with the fallback model if
+        # needed
+        segs = detect_segs(image, bbox_model, fallback_model, threshold)
 
         # If still no detections, return original image
         if not segs or len(segs[1]) == 0:
             return (image, placeholder)
 
         # Store the processed crop, bbox, and mask for later compositing
-        processed_crops, eroded_crops, bboxes = process_segs(
+        processed_crops, eroded_crops, bboxes, final_image = process_segs(
             image, model, vae,
             positive, negative, seed, steps, cfg, sampler, scheduler,
             denoise, upscale_method, upscale_model, feather,
-            edge_erosion, context_padding, segs)
+            edge_erosion, context_padding, segs, batch_regions,
+            region_merge, merge_iou, budget, max_upscale, scale_steps)
 
         if not processed_crops:
             return (image, placeholder)
@@ -370,17 +883,6 @@ class DetailerNode:
         else:
             eroded_samples_batch = image[:0]
 
-        # Step 11: Uncrop all processed regions back onto the original image
-        final_image = image
-
-        for eroded_image, bbox in zip(
-                eroded_crops, bboxes):
-            # Parameters: original_image, crop_image, bbox, border_blending,
-            # use_square_mask, optional_mask
-            final_image = uncrop_image_by_bbox(
-                final_image, eroded_image, bbox, feather=feather
-            )
-
         return common.return_preview(
             (final_image, eroded_samples_batch,),
             eroded_samples_batch,
@@ -407,6 +909,12 @@ class MaskDetailerNode:
                 # Detection parameters
                 **DETAILER_INPUTS,
             },
+            "optional": {
+                # Region planning parameters
+                **REGION_INPUTS,
+                # Budget parameters
+                **BUDGET_INPUTS,
+            },
             "hidden": {"extra_pnginfo": "EXTRA_PNGINFO"},
         }
 
@@ -420,7 +928,9 @@ class MaskDetailerNode:
     def process(self, image, mask, model, vae,
                 positive, negative, seed, steps, cfg, sampler, scheduler,
                 denoise, upscale_method, upscale_model, threshold, feather,
-                edge_erosion, context_padding, extra_pnginfo=None):
+                edge_erosion, context_padding, batch_regions=False,
+                region_merge="none", merge_iou=0.3, max_upscale=0.0,
+                scale_steps=False, extra_pnginfo=None, **budget):
         """Main processing function."""
 
         # Generate SEGS from mask
@@ -431,11 +941,16 @@ class MaskDetailerNode:
         if not segs or len(segs[1]) == 0:
             return (image, None)
 
-        processed_crops, eroded_crops, bboxes = process_segs(
+        processed_crops, eroded_crops, bboxes, final_image = process_segs(
             image, model, vae,
             positive, negative, seed, steps, cfg, sampler, scheduler,
             denoise, upscale_method, upscale_model, feather,
-            edge_erosion, context_padding, segs)
+            edge_erosion, context_padding, segs, batch_regions,
+            region_merge, merge_iou, budget, max_upscale, scale_steps)
+
+        # Every region may have been skipped for the budget
+        if not processed_crops:
+            return (image, None)
 
         # Pad all crops to the same size so they can be batched
         if len(processed_crops) > 0:
@@ -462,17 +977,6 @@ class MaskDetailerNode:
         else:
             eroded_samples_batch = None
 
-        # Step 11: Uncrop all processed regions back onto the original image
-        final_image = image
-
-        for eroded_image, bbox in zip(
-                eroded_crops, bboxes):
-            # Parameters: original_image, crop_image, bbox, border_blending,
-            # use_square_mask, optional_mask
-            final_image = uncrop_image_by_bbox(
-                final_image, eroded_image, bbox, feather=feather
-            )
-
         return common.return_preview(
             (final_image, eroded_samples_batch,),
             eroded_samples_batch,
@@ -502,6 +1006,12 @@ class DetailerPipeNode(DetailerNode):
                 # Detection parameters
                 **DETAILER_INPUTS,
             },
+            "optional": {
+                # Region planning parameters
+                **REGION_INPUTS,
+                # Budget parameters
+                **BUDGET_INPUTS,
+            },
             "hidden": {"extra_pnginfo": "EXTRA_PNGINFO"},
         }
 
@@ -515,7 +1025,10 @@ class DetailerPipeNode(DetailerNode):
     def process_pipe(self, bbox_model, fallback_model, full_pipe, steps, cfg,
                      sampler, scheduler, denoise, upscale_method,
                      upscale_model, threshold, feather, edge_erosion,
-                     context_padding, extra_pnginfo=None):
+                     context_padding, batch_regions=False,
+                     region_merge="none", merge_iou=0.3,
+                     max_upscale=0.0, scale_steps=False,
+                     extra_pnginfo=None, **budget):
         """Process using full_pipe input and return updated pipe."""
         # Extract values from pipe
         image = full_pipe.get("image")
@@ -542,7 +1055,10 @@ class DetailerPipeNode(DetailerNode):
             bbox_model, fallback_model, image, model_checkpoint, vae,
             positive, negative, seed, steps, cfg, sampler, scheduler,
             denoise, upscale_method, upscale_model, threshold, feather,
-            edge_erosion, context_padding
+            edge_erosion, context_padding,
+            batch_regions=batch_regions, region_merge=region_merge,
+            merge_iou=merge_iou, max_upscale=max_upscale,
+            scale_steps=scale_steps, **budget
         )
 
         # Handle both dict (with preview) and tuple (no preview) returns
@@ -582,6 +1098,10 @@ class MaskDetailerPipeNode(MaskDetailerNode):
             },
             "optional": {
                 "image": ("IMAGE",),
+                # Region planning parameters
+                **REGION_INPUTS,
+                # Budget parameters
+                **BUDGET_INPUTS,
             },
             "hidden": {"extra_pnginfo": "EXTRA_PNGINFO"},
         }
@@ -596,7 +1116,9 @@ class MaskDetailerPipeNode(MaskDetailerNode):
     def process_pipe(self, full_pipe, mask, steps, cfg, sampler,
                      scheduler, denoise, upscale_method, upscale_model,
                      threshold, feather, edge_erosion, context_padding,
-                     image=None, extra_pnginfo=None):
+                     batch_regions=False, region_merge="none",
+                     merge_iou=0.3, max_upscale=0.0, scale_steps=False,
+                     image=None, extra_pnginfo=None, **budget):
         """Process using full_pipe input and return updated pipe."""
         # Extract values from pipe
         if image is None:
@@ -624,7 +1146,10 @@ class MaskDetailerPipeNode(MaskDetailerNode):
             image, mask, model, vae,
             positive, negative, seed, steps, cfg, sampler, scheduler,
             denoise, upscale_method, upscale_model, threshold, feather,
-            context_padding, edge_erosion
+            context_padding, edge_erosion,
+            batch_regions=batch_regions, region_merge=region_merge,
+            merge_iou=merge_iou, max_upscale=max_upscale,
+            scale_steps=scale_steps, **budget
         )
 
         # Handle both dict (with preview) and tuple (no preview) returns
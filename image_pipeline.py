@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+Shared image processing for uploads and thumbnails.
+
+Every image is decoded once, at the smallest scale the format allows: JPEG
+decodes straight to 1/2, 1/4 or 1/8 size through draft mode, and the crop
+and resize happen in a single resample with the crop box. EXIF orientation
+is applied to the small result, which is the same as applying it first
+since a centered square crop does not move under rotation.
+"""
+
+import os
+import threading
+from io import BytesIO
+from PIL import Image
+
+
+# Size of the square images stored for uploaded characters and styles
+UPLOAD_SIZE = 256
+
+# JPEG encoder settings; optimize saves a few percent at a large CPU cost
+JPEG_QUALITY = int(os.environ.get("MUDKNIGHT_JPEG_QUALITY", 85))
+JPEG_OPTIMIZE = os.environ.get("MUDKNIGHT_JPEG_OPTIMIZE", "0") == "1"
+
+# Downscale by integer factors first when the image is this many times
+# larger than the target, see Image.resize
+REDUCING_GAP = 3.0
+
+# EXIF orientation to the transpose that undoes it
+ORIENTATION_TRANSPOSE = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+EXIF_ORIENTATION = 0x0112
+
+
+def square_crop_box(width, height):
+    """Get the centered square crop box for an image size."""
+    if width > height:
+        left = (width - height) / 2
+        return (left, 0, left + height, height)
+    top = (height - width) / 2
+    return (0, top, width, top + width)
+
+
+def square_thumbnail(source, size):
+    """
+    Decode an image into a size x size RGB center crop.
+
+    Args:
+        source: Path or binary file object
+        size: Edge length in pixels
+    """
+    with Image.open(source) as img:
+        orientation = img.getexif().get(EXIF_ORIENTATION)
+
+        # Only JPEG supports this, other formats ignore it. The drafted
+        # image still has both sides of at least size pixels.
+        img.draft('RGB', (size, size))
+
+        # Palette and bilevel images only resize with NEAREST
+        if img.mode not in ('RGB', 'L'):
+            img = img.convert('RGB')
+
+        img = img.resize(
+            (size, size), Image.Resampling.LANCZOS,
+            box=square_crop_box(*img.size), reducing_gap=REDUCING_GAP)
+
+    if orientation in ORIENTATION_TRANSPOSE:
+        img = img.transpose(ORIENTATION_TRANSPOSE[orientation])
+    return img.convert('RGB')
+
+
+def save_image(img, path, pil_format="JPEG", **options):
+    """
+    Save an image through a temporary file, so readers never see partial
+    files. JPEGs use the configured encoder settings by default.
+    """
+    if pil_format == "JPEG":
+        options = {"quality": JPEG_QUALITY, "optimize": JPEG_OPTIMIZE,
+                   **options}
+    tmp_path = path.with_name(f"{path.name}.{threading.get_ident()}.tmp")
+    img.save(tmp_path, pil_format, **options)
+    os.replace(tmp_path, path)
+    return path
+
+
+def process_upload(image_bytes, path, size=UPLOAD_SIZE):
+    """Store an uploaded image as a square JPEG at path."""
+    img = square_thumbnail(BytesIO(image_bytes), size)
+    return save_image(img, path)
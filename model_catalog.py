@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+Persistent catalog of model metadata read from safetensors headers.
+
+A safetensors file starts with a JSON header describing every tensor plus
+optional training metadata, so the base model, trigger words and rank of
+a LoRA can be found without reading any weights. Results are kept in
+config/model_catalog, keyed by path and validated by (size, mtime).
+"""
+
+import json
+import os
+import struct
+import threading
+from collections import Counter
+from pathlib import Path
+import folder_paths
+
+
+CATALOG_DIR = Path(__file__).parent / "config" / "model_catalog"
+
+# Headers larger than this are not safetensors files we want to parse
+MAX_HEADER_SIZE = 64 * 1024 * 1024
+
+# Number of trigger words taken from the training tag frequencies
+MAX_TRIGGER_WORDS = 5
+
+# Bump when the extracted fields change, so old catalogs are rebuilt
+CATALOG_VERSION = 1
+
+# Substrings of metadata values, checked in order, to base model family
+BASE_MODEL_NAMES = (
+    ("flux", "flux"),
+    ("sd3", "sd3"),
+    ("stable-diffusion-v3", "sd3"),
+    ("sdxl", "sdxl"),
+    ("stable-diffusion-xl", "sdxl"),
+    ("sd_v2", "sd2"),
+    ("sd2", "sd2"),
+    ("stable-diffusion-v2", "sd2"),
+    ("sd_v1", "sd1"),
+    ("sd1", "sd1"),
+    ("stable-diffusion-v1", "sd1"),
+)
+
+# Tensor name prefixes, checked in order, to base model family
+BASE_MODEL_KEYS = (
+    ("double_blocks.", "flux"),
+    ("model.diffusion_model.double_blocks.", "flux"),
+    ("lora_unet_double_blocks_", "flux"),
+    ("transformer.transformer_blocks.", "flux"),
+    ("joint_blocks.", "sd3"),
+    ("model.diffusion_model.joint_blocks.", "sd3"),
+    ("lora_unet_joint_blocks_", "sd3"),
+    ("conditioner.embedders.1.", "sdxl"),
+    ("lora_te2_", "sdxl"),
+    ("lora_te1_", "sdxl"),
+    ("cond_stage_model.model.", "sd2"),
+    ("cond_stage_model.transformer.", "sd1"),
+)
+
+# Width of the text encoder MLP input tells SD1 (768) from SD2 (1024)
+TEXT_ENCODER_KEY = (
+    "lora_te_text_model_encoder_layers_0_mlp_fc1.lora_down.weight")
+TEXT_ENCODER_WIDTHS = {768: "sd1", 1024: "sd2"}
+
+
+def read_safetensors_header(path):
+    """
+    Read the JSON header of a safetensors file without touching the tensors.
+
+    Returns:
+        Header dict, with training metadata under "__metadata__"
+    """
+    with open(path, 'rb') as f:
+        prefix = f.read(8)
+        if len(prefix) != 8:
+            raise ValueError("File too short")
+        size = struct.unpack('<Q', prefix)[0]
+        if size > MAX_HEADER_SIZE:
+            raise ValueError(f"Header too large: {size} bytes")
+        header = json.loads(f.read(size))
+    if not isinstance(header, dict):
+        raise ValueError("Header is not an object")
+    return header
+
+
+def base_model_from_header(header):
+    """Get the base model family (sd1, sd2, sdxl, sd3, flux) or None."""
+    metadata = header.get("__metadata__") or {}
+    for field in ("modelspec.architecture", "ss_base_model_version"):
+        value = str(metadata.get(field, "")).lower()
+        for name, family in BASE_MODEL_NAMES:
+            if name in value:
+                return family
+
+    for key in header:
+        for prefix, family in BASE_MODEL_KEYS:
+            if key.startswith(prefix):
+                return family
+
+    tensor = header.get(TEXT_ENCODER_KEY)
+    if isinstance(tensor, dict):
+        shape = tensor.get("shape") or []
+        if len(shape) == 2:
+            return TEXT_ENCODER_WIDTHS.get(shape[1])
+    if metadata.get("ss_v2") == "True":
+        return "sd2"
+    return None
+
+
+def trigger_words_from_header(header):
+    """Get the trigger words of a LoRA, most frequent training tags first."""
+    metadata = header.get("__metadata__") or {}
+    words = []
+
+    phrase = metadata.get("modelspec.trigger_phrase")
+    if phrase:
+        words.extend(word.strip() for word in phrase.split(',')
+                     if word.strip())
+
+    try:
+        frequencies = json.loads(metadata.get("ss_tag_frequency") or "{}")
+    except json.JSONDecodeError:
+        frequencies = {}
+    counts = Counter()
+    if isinstance(frequencies, dict):
+        for tags in frequencies.values():
+            if isinstance(tags, dict):
+                for tag, count in tags.items():
+                    if isinstance(count, int):
+                        counts[tag.strip()] += count
+    for tag, _ in counts.most_common(MAX_TRIGGER_WORDS):
+        if tag and tag not in words:
+            words.append(tag)
+    return words[:MAX_TRIGGER_WORDS]
+
+
+def rank_from_header(header):
+    """Get the rank of a LoRA, or None for other models."""
+    metadata = header.get("__metadata__") or {}
+    try:
+        return int(metadata["ss_network_dim"])
+    except (KeyError, TypeError, ValueError):
+        pass
+
+    # The down projection has shape (rank, in_features)
+    ranks = Counter()
+    for key, tensor in header.items():
+        if not key.endswith((".lora_down.weight", ".lora_A.weight")):
+            continue
+        shape = tensor.get("shape") if isinstance(tensor, dict) else None
+        if shape:
+            ranks[shape[0]] += 1
+    return ranks.most_common(1)[0][0] if ranks else None
+
+
+def describe(path):
+    """Extract the catalog fields of a model file."""
+    if not str(path).lower().endswith('.safetensors'):
+        return {"baseModel": None, "triggerWords": [], "rank": None}
+    header = read_safetensors_header(path)
+    return {
+        "baseModel": base_model_from_header(header),
+        "triggerWords": trigger_words_from_header(header),
+        "rank": rank_from_header(header),
+    }
+
+
+class ModelCatalog:
+    """
+    Metadata of the model files in one folder, persisted between runs.
+
+    Lookups read the header of unknown files on the spot, update() indexes
+    a whole list of files, normally from a background thread.
+    """
+
+    def __init__(self, name):
+        self.path = CATALOG_DIR / f"{name}.json"
+        self.generation = 0
+        self._lock = threading.Lock()
+        self._entries = None
+        self._thread = None
+        self._pending = None
+
+    def _load(self):
+        if self._entries is not None:
+            return
+        self._entries = {}
+        try:
+            data = json.loads(self.path.read_text(encoding='utf-8'))
+            if data.get("version") == CATALOG_VERSION:
+                self._entries = data.get("entries", {})
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"Error loading model catalog {self.path.name}: {e}")
+
+    def _save(self):
+        CATALOG_DIR.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            content = json.dumps(
+                {"version": CATALOG_VERSION, "entries": self._entries})
+        tmp_path = self.path.with_name(
+            f"{self.path.name}.{threading.get_ident()}.tmp")
+        tmp_path.write_text(content, encoding='utf-8')
+        os.replace(tmp_path, self.path)
+
+    def _lookup(self, full_path):
+        """Get (entry, changed) for a file, reading its header if needed."""
+        stat = os.stat(full_path)
+        with self._lock:
+            self._load()
+            entry = self._entries.get(full_path)
+        if (entry is not None and entry["size"] == stat.st_size and
+                entry["mtime"] == stat.st_mtime_ns):
+            return entry, False
+
+        try:
+            fields = describe(full_path)
+        except Exception as e:
+            print(f"Error reading metadata of {full_path}: {e}")
+            fields = {"baseModel": None, "triggerWords": [], "rank": None}
+        entry = {"size": stat.st_size, "mtime": stat.st_mtime_ns, **fields}
+        with self._lock:
+            self._entries[full_path] = entry
+            self.generation += 1
+        return entry, True
+
+    def get(self, full_path):
+        """Get the metadata of a file, or None if it was not indexed yet."""
+        with self._lock:
+            self._load()
+            return self._entries.get(full_path)
+
+    def lookup(self, full_path):
+        """Get the metadata of a file, reading its header if needed."""
+        entry, changed = self._lookup(full_path)
+        if changed:
+            self._save()
+        return entry
+
+    def update(self, full_paths):
+        """Index a list of files and drop the ones that are gone."""
+        changed = False
+        for full_path in full_paths:
+            try:
+                changed |= self._lookup(full_path)[1]
+            except OSError:
+                continue
+
+        with self._lock:
+            stale = self._entries.keys() - set(full_paths)
+            for full_path in stale:
+                del self._entries[full_path]
+            if stale:
+                self.generation += 1
+        if changed or stale:
+            self._save()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                full_paths, self._pending = self._pending, None
+                if full_paths is None:
+                    self._thread = None
+                    return
+            try:
+                self.update(full_paths)
+            except Exception as e:
+                print(f"Error updating model catalog {self.path.name}: {e}")
+
+    def schedule(self, full_paths):
+        """Index a list of files in the background."""
+        with self._lock:
+            self._pending = list(full_paths)
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="model-catalog", daemon=True)
+                self._thread.start()
+
+
+LORA_CATALOG = ModelCatalog("loras")
+CHECKPOINT_CATALOG = ModelCatalog("checkpoints")
+
+
+def checkpoint_base_model(ckpt_name):
+    """Get the base model family of a checkpoint, or None if unknown."""
+    if not ckpt_name:
+        return None
+    full_path = folder_paths.get_full_path("checkpoints", ckpt_name)
+    if not full_path:
+        return None
+    try:
+        return CHECKPOINT_CATALOG.lookup(full_path)["baseModel"]
+    except OSError:
+        return None
+
+
+def lora_base_model(full_path):
+    """Get the base model family of a LoRA, or None if unknown."""
+    try:
+        return LORA_CATALOG.lookup(full_path)["baseModel"]
+    except OSError:
+        return None
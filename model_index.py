@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+In-memory index of model folders and the preview images stored next to
+the model files, so list and preview endpoints don't probe the disk.
+"""
+
+import os
+import threading
+from collections import namedtuple
+import folder_paths
+
+
+# Preview images are looked up in this order next to the model file
+PREVIEW_EXTENSIONS = (
+    '.preview.png', '.preview.jpeg', '.preview.jpg', '.preview.webp',
+    '.png', '.jpeg', '.jpg', '.webp', '.gif', '.bmp',
+)
+
+ModelEntry = namedtuple(
+    "ModelEntry", ["name", "path", "full_path", "preview"])
+
+# Scanned state of one directory
+_DirRecord = namedtuple(
+    "_DirRecord", ["mtime", "root", "rel_dir", "files", "subdirs"])
+
+
+def find_preview(files, model_file):
+    """
+    Find the preview image for a model file among its sibling files.
+
+    Args:
+        files: Set of file names in the model's directory
+        model_file: File name of the model
+
+    Returns:
+        File name of the preview, or None
+    """
+    base_name = os.path.splitext(model_file)[0]
+    for ext in PREVIEW_EXTENSIONS:
+        preview = base_name + ext
+        if preview in files and preview != model_file:
+            return preview
+    return None
+
+
+class ModelDirectoryIndex:
+    """
+    Index of the model files in a folder_paths folder.
+
+    Every directory is listed once with os.scandir. Refreshing only stats
+    the known directories and rescans those whose mtime changed, since
+    adding, removing or renaming a file updates its directory's mtime.
+
+    Lookups answer from memory and never touch the disk, apart from the
+    first scan. Call refresh() where the disk should be checked, like
+    once per list request.
+    """
+
+    def __init__(self, folder_name, extensions=None):
+        self.folder_name = folder_name
+        self.extensions = extensions
+        self.generation = 0
+        self._scanned = False
+        self._lock = threading.Lock()
+        self._roots = []
+        self._dirs = {}
+        self._models = []
+        self._lookup = {}
+        self._by_stem = {}
+
+    def _model_extensions(self):
+        if self.extensions is not None:
+            return tuple(self.extensions)
+        try:
+            extensions = folder_paths.folder_names_and_paths[
+                self.folder_name][1]
+        except (KeyError, IndexError):
+            extensions = folder_paths.supported_pt_extensions
+        return tuple(ext.lower() for ext in extensions)
+
+    def _scan_dir(self, path, mtime, root, rel_dir):
+        files = set()
+        subdirs = []
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir():
+                        subdirs.append(entry.name)
+                    elif entry.is_file():
+                        files.add(entry.name)
+                except OSError:
+                    continue
+        return _DirRecord(mtime, root, rel_dir, frozenset(files),
+                          sorted(subdirs))
+
+    def _refresh_root(self, root, dirs, seen):
+        changed = False
+        stack = [(root, "")]
+        while stack:
+            path, rel_dir = stack.pop()
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+
+            # Guard against symlink loops
+            inode = (stat.st_dev, stat.st_ino)
+            if inode in seen:
+                continue
+            seen.add(inode)
+
+            record = self._dirs.get(path)
+            if (record is None or record.mtime != stat.st_mtime_ns or
+                    record.root != root):
+                try:
+                    record = self._scan_dir(
+                        path, stat.st_mtime_ns, root, rel_dir)
+                except OSError:
+                    continue
+                changed = True
+            dirs[path] = record
+
+            for subdir in reversed(record.subdirs):
+                stack.append((
+                    os.path.join(path, subdir),
+                    os.path.join(rel_dir, subdir) if rel_dir else subdir))
+        return changed
+
+    def _rebuild(self, dirs):
+        extensions = self._model_extensions()
+        models = []
+        lookup = {}
+
+        # Roots are visited in order so the first root wins on duplicates,
+        # matching folder_paths.get_full_path
+        for root in self._roots:
+            for path, record in dirs.items():
+                if record.root != root:
+                    continue
+                for file_name in record.files:
+                    if (extensions and not
+                            file_name.lower().endswith(extensions)):
+                        continue
+
+                    rel_path = (os.path.join(record.rel_dir, file_name)
+                                if record.rel_dir else file_name)
+                    if rel_path in lookup:
+                        continue
+
+                    preview = find_preview(record.files, file_name)
+                    entry = ModelEntry(
+                        name=os.path.splitext(rel_path)[0],
+                        path=rel_path,
+                        full_path=os.path.join(path, file_name),
+                        preview=(os.path.join(path, preview)
+                                 if preview else None),
+                    )
+                    models.append(entry)
+                    lookup[rel_path] = entry
+
+        # Files that share a name resolve to the shallowest one, then to
+        # the first root, which is where ComfyUI looks for `name` first
+        by_stem = {}
+        for entry in sorted(models, key=lambda entry: (
+                entry.path.count(os.sep), self._root_order(entry),
+                entry.path)):
+            stem = os.path.basename(entry.name)
+            by_stem.setdefault(stem, entry)
+
+        models.sort(key=lambda entry: entry.path)
+        for entry in models:
+            lookup.setdefault(entry.name, entry)
+
+        self._models = models
+        self._lookup = lookup
+        self._by_stem = by_stem
+
+    def _root_order(self, entry):
+        for index, root in enumerate(self._roots):
+            if entry.full_path.startswith(root + os.sep):
+                return index
+        return len(self._roots)
+
+    def refresh(self):
+        """
+        Bring the index up to date with the disk.
+
+        Returns:
+            Generation number, which changes whenever the contents change
+        """
+        with self._lock:
+            roots = [
+                os.path.abspath(path) for path in
+                folder_paths.get_folder_paths(self.folder_name)
+            ]
+            changed = roots != self._roots
+            self._roots = roots
+
+            dirs = {}
+            seen = set()
+            for root in roots:
+                if self._refresh_root(root, dirs, seen):
+                    changed = True
+
+            # Directories that were removed
+            if dirs.keys() != self._dirs.keys():
+                changed = True
+            self._dirs = dirs
+
+            if changed:
+                self._rebuild(dirs)
+                self.generation += 1
+            self._scanned = True
+            return self.generation
+
+    def _ensure_scanned(self):
+        if not self._scanned:
+            self.refresh()
+
+    def models(self):
+        """Get all model entries, sorted by relative path."""
+        self._ensure_scanned()
+        return self._models
+
+    def unique_names(self):
+        """
+        Get one entry per file name without extension, with duplicates
+        across subfolders and roots resolved.
+
+        Returns:
+            Dict of file name without extension to model entry
+        """
+        self._ensure_scanned()
+        return self._by_stem
+
+    def get(self, name_or_path):
+        """Find a model by relative path, with or without extension."""
+        self._ensure_scanned()
+        return self._lookup.get(name_or_path)
+
+    def preview_path(self, name_or_path):
+        """
+        Get the preview image path for a model, or None. This is a single
+        dict lookup, the disk is only checked by refresh().
+        """
+        self._ensure_scanned()
+        entry = self._lookup.get(name_or_path)
+        return entry.preview if entry else None
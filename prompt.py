@@ -8,6 +8,7 @@ import folder_paths
 import comfy.sd
 import comfy.utils
 from . import common
+from . import model_catalog
 
 
 def parse_lora_syntax(lora_string):
@@ -49,10 +50,11 @@ def parse_lora_syntax(lora_string):
     return lora_list
 
 
-def apply_loras(model, clip, lora_list):
+def apply_loras(model, clip, lora_list, base_model=None):
     """
     Apply a list of LoRAs to model and clip, automatically finding
-    files in subdirectories.
+    files in subdirectories. Warns about LoRAs trained for another base
+    model family than base_model, when both are known.
     """
     if not lora_list:
         return model, clip
@@ -85,6 +87,14 @@ def apply_loras(model, clip, lora_list):
             if lora_path is None:
                 continue
 
+            # Only the header is read, the catalog keeps the result
+            lora_base_model = model_catalog.lora_base_model(lora_path)
+            if base_model and lora_base_model and \
+                    lora_base_model != base_model:
+                print(f"Warning: LoRA '{lora_name}' was trained for "
+                      f"{lora_base_model}, but the checkpoint is "
+                      f"{base_model}.")
+
             lora = comfy.utils.load_torch_file(lora_path, safe_load=True)
 
             # Apply LoRA to model and clip
@@ -585,7 +595,8 @@ class PromptConditioningNode:
 
         # Parse and apply LoRAs directly
         lora_list = parse_lora_syntax(combined_loras)
-        model_out, clip_out = apply_loras(model, clip, lora_list)
+        base_model = model_catalog.checkpoint_base_model(ckpt_name)
+        model_out, clip_out = apply_loras(model, clip, lora_list, base_model)
 
         # Create updated pipe
         new_pipe = full_pipe.copy()
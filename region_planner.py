@@ -0,0 +1,197 @@
+#!/usr/bin/env python3
+"""
+Planning of the regions the detailer samples.
+
+Detectors, and the fallback path in particular, often return overlapping
+boxes for the same face or eye. Sampling each of them re-samples the same
+pixels and composites them on top of each other, so overlapping boxes are
+merged into their union, or reduced to the best scoring one, first.
+
+Crowded images can also return dozens of detections, each sampled at
+about 1MP, so a budget limits which regions are sampled at all. Regions
+are ranked by confidence x area and the lowest ranked ones are skipped.
+
+Boxes are (x_min, y_min, x_max, y_max) in pixels, max exclusive.
+"""
+
+MERGE_MODES = ["union", "nms", "none"]
+
+
+def box_area(box):
+    """Get the area of a box in pixels."""
+    return max(0, box[2] - box[0]) * max(0, box[3] - box[1])
+
+
+def box_iou(a, b):
+    """Get the intersection over union of two boxes."""
+    intersection = box_area((max(a[0], b[0]), max(a[1], b[1]),
+                             min(a[2], b[2]), min(a[3], b[3])))
+    if intersection == 0:
+        return 0.0
+    return intersection / (box_area(a) + box_area(b) - intersection)
+
+
+def box_union(a, b):
+    """Get the smallest box containing both boxes."""
+    return (min(a[0], b[0]), min(a[1], b[1]),
+            max(a[2], b[2]), max(a[3], b[3]))
+
+
+def overlaps(a, b, iou):
+    """
+    Check whether two boxes intersect by at least iou. Boxes that don't
+    intersect never overlap, even with an iou of 0.
+    """
+    overlap = box_iou(a, b)
+    return overlap > 0 and overlap >= iou
+
+
+def merge_union(boxes, scores, iou):
+    """
+    Replace every group of boxes overlapping by at least iou with their
+    union, until no two boxes overlap that much.
+
+    Returns:
+        (boxes, scores), a merged box keeps the best score of its group
+    """
+    boxes = list(boxes)
+    scores = list(scores)
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(boxes)):
+            for j in range(i + 1, len(boxes)):
+                if overlaps(boxes[i], boxes[j], iou):
+                    boxes[i] = box_union(boxes[i], boxes[j])
+                    scores[i] = max(scores[i], scores[j])
+                    del boxes[j], scores[j]
+                    merged = True
+                    break
+            if merged:
+                break
+    return boxes, scores
+
+
+def nms(boxes, scores, iou):
+    """
+    Non-maximum suppression: keep the best scoring boxes and drop any box
+    overlapping a kept one by at least iou.
+
+    Returns:
+        (boxes, scores) of the kept boxes, in their original order
+    """
+    order = sorted(range(len(boxes)), key=lambda i: -scores[i])
+    kept = []
+    for i in order:
+        if not any(overlaps(boxes[i], boxes[k], iou) for k in kept):
+            kept.append(i)
+    kept.sort()
+    return [boxes[i] for i in kept], [scores[i] for i in kept]
+
+
+def apply_budget(boxes, scores, max_regions=0, min_area=0, max_area=0,
+                 top_k=0, megapixel_budget=0.0, region_cost=None,
+                 prioritize=False):
+    """
+    Select the regions worth sampling. Limits of 0 are disabled, and
+    without any limit or prioritize the regions are returned as they are.
+
+    Args:
+        boxes: Region boxes
+        scores: Detection confidences
+        max_regions: Most regions to sample
+        min_area: Smallest region area in pixels
+        max_area: Largest region area in pixels
+        top_k: Only consider the top_k most confident regions
+        megapixel_budget: Most megapixels to sample in total
+        region_cost: Function of a box to the megapixels it is sampled
+            at, 1 by default
+        prioritize: Order the regions even without limits, for budgets
+            applied while sampling
+
+    Returns:
+        (boxes, scores), highest confidence x area first
+    """
+    if not (prioritize or max_regions or min_area or max_area or top_k or
+            megapixel_budget):
+        return list(boxes), list(scores)
+
+    indices = [
+        i for i, box in enumerate(boxes)
+        if box_area(box) >= min_area and
+        (not max_area or box_area(box) <= max_area)
+    ]
+    if top_k:
+        indices = sorted(indices, key=lambda i: -scores[i])[:top_k]
+    # Stable, so ties keep detection order
+    indices.sort(key=lambda i: -scores[i] * box_area(boxes[i]))
+    if max_regions:
+        indices = indices[:max_regions]
+
+    if megapixel_budget:
+        kept = []
+        total = 0.0
+        for i in indices:
+            cost = region_cost(boxes[i]) if region_cost else 1.0
+            # The first region is always sampled
+            if kept and total + cost > megapixel_budget:
+                continue
+            kept.append(i)
+            total += cost
+        indices = kept
+
+    return [boxes[i] for i in indices], [scores[i] for i in indices]
+
+
+def plan_regions(boxes, scores, mode="none", iou=0.3, budget=None,
+                 prioritize=False, region_cost=None):
+    """
+    Merge overlapping detection boxes before sampling.
+
+    Args:
+        boxes: Crop boxes, one per detection
+        scores: Detection confidences
+        mode: One of MERGE_MODES
+        iou: Minimum intersection over union to merge two boxes
+        budget: Keyword arguments of apply_budget
+        prioritize: See apply_budget
+        region_cost: See apply_budget
+
+    Returns:
+        (boxes, scores, report), boxes in the order of apply_budget;
+        report counts the regions, sampler calls and crop pixels before
+        and after planning, and the regions skipped for the budget
+    """
+    planned, planned_scores = list(boxes), list(scores)
+    if mode == "union":
+        planned, planned_scores = merge_union(planned, planned_scores, iou)
+    elif mode == "nms":
+        planned, planned_scores = nms(planned, planned_scores, iou)
+    merged = len(planned)
+    planned, planned_scores = apply_budget(
+        planned, planned_scores, region_cost=region_cost,
+        prioritize=prioritize, **(budget or {}))
+
+    # One sampler call per region, unless the caller batches them
+    report = {
+        "regions_in": len(boxes),
+        "regions_out": len(planned),
+        "regions_skipped": merged - len(planned),
+        "sampler_calls_in": len(boxes),
+        "sampler_calls_out": len(planned),
+        "pixels_in": sum(box_area(box) for box in boxes),
+        "pixels_out": sum(box_area(box) for box in planned),
+    }
+    return planned, planned_scores, report
+
+
+def format_report(report):
+    """Describe what planning saved, for the console."""
+    saved_calls = report["sampler_calls_in"] - report["sampler_calls_out"]
+    saved_pixels = report["pixels_in"] - report["pixels_out"]
+    text = (f"{report['regions_in']} regions planned as "
+            f"{report['regions_out']}, saving {saved_calls} sampler "
+            f"calls and {saved_pixels / 1e6:.2f} MP of crops")
+    if report["regions_skipped"]:
+        text += f", {report['regions_skipped']} skipped for the budget"
+    return text
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+"""
+Latency, traffic and event loop health metrics for the editor API routes.
+
+Routes are registered through InstrumentedRoutes instead of the server's
+route table directly, so every handler is timed without touching the rest
+of the ComfyUI app. A background task samples event loop lag: a sleep that
+wakes up late means something held the loop. A request can only be the
+cause if it ran for at least as long as the lag, so the lag is charged to
+the routes with such a request during that sample, or counted as
+unattributed when there is none.
+"""
+
+import asyncio
+import bisect
+import functools
+import os
+import time
+from aiohttp import web
+
+
+# Upper bounds of the latency histogram buckets, in milliseconds
+LATENCY_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+
+# Seconds between event loop lag samples
+LAG_INTERVAL = 0.05
+
+# Lag below this many milliseconds is scheduling noise, not blocking
+LAG_THRESHOLD = 5
+
+
+class Histogram:
+    """Counts of values in LATENCY_BUCKETS, plus sum and max."""
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def to_dict(self):
+        count = sum(self.counts)
+        buckets = {f"le_{bound}": n
+                   for bound, n in zip(LATENCY_BUCKETS, self.counts)}
+        buckets["inf"] = self.counts[-1]
+        return {
+            "count": count,
+            "mean_ms": round(self.total / count, 3) if count else 0,
+            "max_ms": round(self.max, 3),
+            "buckets": buckets,
+        }
+
+
+class RouteStats:
+    """Metrics of one route."""
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.errors = 0
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.blocked_ms = 0.0
+        self.active = 0
+
+    def to_dict(self):
+        return {
+            "latency": self.latency.to_dict(),
+            "errors": self.errors,
+            "bytes_in": self.bytes_in,
+            "bytes_out": self.bytes_out,
+            "blocked_ms": round(self.blocked_ms, 3),
+            "active": self.active,
+        }
+
+
+def response_size(response):
+    """Get the number of body bytes a response will send, if known."""
+    if response.content_length is not None:
+        return response.content_length
+    if isinstance(response, web.FileResponse):
+        # Only known once sent, the file size is close enough
+        try:
+            return os.path.getsize(response._path)
+        except (AttributeError, OSError):
+            return 0
+    return getattr(response, 'body_length', 0) or 0
+
+
+class InstrumentedRoutes:
+    """
+    Drop-in for an aiohttp RouteTableDef that times every handler.
+
+    Args:
+        routes: The route table to register the wrapped handlers on
+    """
+
+    def __init__(self, routes):
+        self.routes = routes
+        self.stats = {}
+        self.loop_lag = Histogram()
+        self.unattributed_ms = 0.0
+        self.started = time.time()
+        self._sampler = None
+        # Requests in flight, to their start time
+        self._inflight = {}
+        # Longest request per route that finished during the current sample
+        self._window = {}
+
+    def _ensure_sampler(self):
+        if self._sampler is None:
+            self._sampler = asyncio.get_running_loop().create_task(
+                self._sample_lag())
+
+    async def _sample_lag(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            self._window = {}
+            start = loop.time()
+            await asyncio.sleep(LAG_INTERVAL)
+            lag = (loop.time() - start - LAG_INTERVAL) * 1000
+            self.loop_lag.add(max(lag, 0.0))
+            if lag < LAG_THRESHOLD:
+                continue
+
+            now = time.perf_counter()
+            blamed = {
+                name for name, duration in self._window.items()
+                if duration >= lag
+            }
+            blamed.update(
+                name for name, started in self._inflight.values()
+                if (now - started) * 1000 >= lag
+            )
+            if not blamed:
+                self.unattributed_ms += lag
+            for name in blamed:
+                self.stats[name].blocked_ms += lag
+
+    def _wrap(self, method, path, handler):
+        name = f"{method} {path}"
+        stats = self.stats.setdefault(name, RouteStats())
+
+        @functools.wraps(handler)
+        async def instrumented(request):
+            self._ensure_sampler()
+            stats.active += 1
+            start = time.perf_counter()
+            key = object()
+            self._inflight[key] = (name, start)
+            status = 500
+            try:
+                response = await handler(request)
+                status = response.status
+                stats.bytes_out += response_size(response)
+                return response
+            except web.HTTPException as e:
+                status = e.status
+                raise
+            finally:
+                del self._inflight[key]
+                stats.active -= 1
+                duration = (time.perf_counter() - start) * 1000
+                stats.latency.add(duration)
+                self._window[name] = max(self._window.get(name, 0), duration)
+                stats.bytes_in += getattr(
+                    request.content, 'total_bytes', 0)
+                if status >= 500:
+                    stats.errors += 1
+
+        return instrumented
+
+    def route(self, method, path, **kwargs):
+        def decorator(handler):
+            wrapped = self._wrap(method, path, handler)
+            self.routes.route(method, path, **kwargs)(wrapped)
+            return handler
+        return decorator
+
+    def get(self, path, **kwargs):
+        return self.route('GET', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.route('POST', path, **kwargs)
+
+    def put(self, path, **kwargs):
+        return self.route('PUT', path, **kwargs)
+
+    def patch(self, path, **kwargs):
+        return self.route('PATCH', path, **kwargs)
+
+    def delete(self, path, **kwargs):
+        return self.route('DELETE', path, **kwargs)
+
+    def snapshot(self):
+        """Get every metric as a JSON-serializable dict."""
+        return {
+            "since": self.started,
+            "routes": {
+                name: stats.to_dict()
+                for name, stats in sorted(self.stats.items())
+            },
+            "loop": {
+                "lag": self.loop_lag.to_dict(),
+                "unattributed_ms": round(self.unattributed_ms, 3),
+                "sample_interval_ms": LAG_INTERVAL * 1000,
+            },
+        }
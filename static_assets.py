@@ -0,0 +1,239 @@
+#!/usr/bin/env python3
+"""
+Pre-compressed delivery of the files in the web directory.
+
+Compressible files get gzip and, when the brotli package is installed,
+brotli variants written once to config/static_cache. Variants are named
+after the hash of the source content, so they are rebuilt whenever the
+source changes and old ones can be dropped.
+
+HTML pages are served with their references to other files in the web
+directory rewritten to versioned URLs (?v=<etag>), so the browser caches
+those files for good and only revalidates the page itself.
+"""
+
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+from collections import namedtuple
+from pathlib import Path
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+WEB_DIR = Path(__file__).parent / "web"
+STATIC_CACHE_DIR = Path(__file__).parent / "config" / "static_cache"
+
+# Extensions worth compressing, images and fonts are compressed already
+COMPRESSIBLE = {'.js', '.css', '.html', '.csv', '.json', '.svg', '.txt'}
+
+# Files below this size are served as they are
+MIN_COMPRESS_SIZE = 1024
+
+# Files the pages no longer load, only compressed if requested. The tag
+# CSV is searched on the server instead.
+PREBUILD_EXCLUDE = {'danbooru.csv'}
+
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+
+# Preferred encodings first: (Content-Encoding, variant file extension)
+ENCODINGS = (("br", "br"), ("gzip", "gz"))
+
+# Versioned URLs (?v=<etag>), as written into HTML pages, never change
+# what they point to, others are revalidated with the ETag on every load
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE_CONTROL = "no-cache"
+
+# Relative src and href attributes of HTML pages
+REFERENCE_PATTERN = re.compile(rb'((?:src|href)=")([^"?#:]+)(")')
+
+Asset = namedtuple(
+    "Asset", ["path", "etag", "content_type", "variants"])
+
+# Assets keyed by path and validated by the (size, mtime) of the file and
+# of the files an HTML page references
+_assets = {}
+_assets_lock = threading.Lock()
+
+
+def resolve(rel_path):
+    """Get the path of a file in the web directory, or None."""
+    try:
+        path = (WEB_DIR / rel_path).resolve()
+        path.relative_to(WEB_DIR.resolve())
+    except (OSError, ValueError):
+        return None
+    return path if path.is_file() else None
+
+
+def compress(data, encoding):
+    """Compress data with a Content-Encoding."""
+    if encoding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    # mtime=0 keeps the output identical for identical input
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def _build_variants(data, etag):
+    variants = {}
+    STATIC_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    for encoding, ext in ENCODINGS:
+        if encoding == "br" and brotli is None:
+            continue
+        variant_path = STATIC_CACHE_DIR / f"{etag}.{ext}"
+        if not variant_path.exists():
+            compressed = compress(data, encoding)
+            # Not worth it if it barely shrinks
+            if len(compressed) >= len(data) * 0.9:
+                continue
+            tmp_path = variant_path.with_name(
+                f"{variant_path.name}.{threading.get_ident()}.tmp")
+            tmp_path.write_bytes(compressed)
+            os.replace(tmp_path, variant_path)
+        variants[encoding] = variant_path
+    return variants
+
+
+def file_stamp(path):
+    """Get the (size, mtime) of a file."""
+    stat = path.stat()
+    return stat.st_size, stat.st_mtime_ns
+
+
+def version_references(path, data):
+    """
+    Rewrite the references of an HTML page to files in the web directory
+    as versioned URLs.
+
+    Returns:
+        (data, paths), paths being the referenced files
+    """
+    paths = []
+
+    def versioned(match):
+        target = resolve(path.parent.relative_to(WEB_DIR.resolve()) /
+                         match.group(2).decode('utf-8'))
+        if target is None:
+            return match.group(0)
+        paths.append(target)
+        etag = get_asset(target).etag.encode('ascii')
+        return b"%s%s?v=%s%s" % (
+            match.group(1), match.group(2), etag, match.group(3))
+
+    return REFERENCE_PATTERN.sub(versioned, data), paths
+
+
+def _write_rendered(data, etag, suffix):
+    STATIC_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    rendered_path = STATIC_CACHE_DIR / f"{etag}{suffix}"
+    if not rendered_path.exists():
+        tmp_path = rendered_path.with_name(
+            f"{rendered_path.name}.{threading.get_ident()}.tmp")
+        tmp_path.write_bytes(data)
+        os.replace(tmp_path, rendered_path)
+    return rendered_path
+
+
+def get_asset(path):
+    """
+    Get a file's ETag and compressed variants, building the variants if
+    the file, or a file an HTML page references, is new or changed.
+    """
+    with _assets_lock:
+        cached = _assets.get(path)
+    if cached:
+        try:
+            current = [file_stamp(p) for p in (path, *cached[2])]
+        except OSError:
+            current = None
+        if current == cached[0]:
+            return cached[1]
+
+    stamp = file_stamp(path)
+    data = path.read_bytes()
+    dependencies = []
+    if path.suffix.lower() == '.html':
+        data, dependencies = version_references(path, data)
+    etag = hashlib.sha1(data).hexdigest()[:16]
+    served_path = path
+    if dependencies:
+        served_path = _write_rendered(data, etag, path.suffix)
+    variants = {}
+    compressible = path.suffix.lower() in COMPRESSIBLE
+    if compressible and len(data) >= MIN_COMPRESS_SIZE:
+        variants = _build_variants(data, etag)
+
+    content_type = mimetypes.guess_type(path.name)[0]
+    if path.suffix.lower() == '.js':
+        content_type = "application/javascript"
+    asset = Asset(served_path, etag,
+                  content_type or "application/octet-stream", variants)
+    stamps = [stamp] + [file_stamp(p) for p in dependencies]
+    with _assets_lock:
+        _assets[path] = (stamps, asset, dependencies)
+    return asset
+
+
+def choose_encoding(accept_encoding, asset):
+    """Pick the best variant the client accepts, or None for identity."""
+    accepted = set()
+    for part in (accept_encoding or "").split(','):
+        coding, _, params = part.partition(';')
+        params = params.replace(' ', '')
+        quality = 1.0
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                pass
+        if quality > 0:
+            accepted.add(coding.strip().lower())
+
+    for encoding, _ in ENCODINGS:
+        if encoding in asset.variants and (
+                encoding in accepted or '*' in accepted):
+            return encoding
+    return None
+
+
+def prebuild():
+    """Build the variants of the files in the web directory."""
+    built = 0
+    for root, _, files in os.walk(WEB_DIR):
+        for file_name in files:
+            if file_name in PREBUILD_EXCLUDE:
+                continue
+            try:
+                path = (Path(root) / file_name).resolve()
+                if get_asset(path).variants:
+                    built += 1
+            except OSError as e:
+                print(f"Error compressing {file_name}: {e}")
+    print(f"Static assets: {built} compressed files ready")
+    remove_stale_variants()
+
+
+def remove_stale_variants():
+    """Remove variants and pages whose source has changed since."""
+    with _assets_lock:
+        current = {
+            cached_path.name
+            for _, asset, _ in _assets.values()
+            for cached_path in (asset.path, *asset.variants.values())
+        }
+    if not STATIC_CACHE_DIR.exists():
+        return
+    for variant_path in STATIC_CACHE_DIR.iterdir():
+        if variant_path.suffix == '.tmp' or variant_path.name in current:
+            continue
+        try:
+            variant_path.unlink()
+        except OSError:
+            pass
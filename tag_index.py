@@ -0,0 +1,603 @@
+#!/usr/bin/env python3
+"""
+Danbooru tag index for autocomplete.
+
+The tag CSV is compiled into a compact binary dictionary under
+config/tag_cache, which is memory-mapped so loading takes milliseconds and
+lookups read the file in place. A prefix lookup is a pair of bisections over
+a sorted key table followed by a top-k selection by post count. A trigram
+index over the start of every name, keyed by trigram and position, backs a
+typo-tolerant fuzzy mode.
+
+The dictionary is rebuilt automatically when the CSV changes, and can be
+built ahead of time with:
+
+    python tag_index.py [danbooru.csv] [output.bin]
+"""
+
+import csv
+import heapq
+import mmap
+import os
+import struct
+import sys
+import threading
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from pathlib import Path
+
+
+TAG_CSV = Path(__file__).parent / "web" / "danbooru.csv"
+TAG_CACHE_DIR = Path(__file__).parent / "config" / "tag_cache"
+
+# Categories that are never suggested
+EXCLUDED_CATEGORIES = {2}
+
+# Upper bound on the number of results of one query
+MAX_LIMIT = 100
+
+# Fuzzy search compares the query with the start of names, using trigrams of
+# the first FUZZY_PREFIX bytes of each name padded with FUZZY_PAD
+FUZZY_PREFIX = 24
+FUZZY_PAD = b"\x02\x02"
+FUZZY_MIN_QUERY = 5
+# Queries at least this long may match with two edits when one finds nothing
+FUZZY_LONG_QUERY = 12
+# Candidates verified per query, most used first
+FUZZY_MAX_CANDIDATES = 2000
+
+# Binary dictionary layout, all integers in native byte order:
+#   header
+#   u32 counts[tag_count]              post count of each tag
+#   u32 tag_names[tag_count]           name id of each tag
+#   u32 name_tags[name_count]          tag id of each name, aliases included
+#   u32 name_offsets[name_count + 1]   byte offsets of names in the pool
+#   u32 key_names[key_count]           name id of each key, sorted by key
+#   u32 key_offsets[key_count]         byte offset in the pool where a key
+#                                      starts, keys run to the end of a name
+#   u32 trigram_keys[trigram_count]    sorted trigram << 8 | position
+#   u32 trigram_offsets[trigram_count + 1]  ranges in postings
+#   u32 postings[posting_count]        name ids of each key, ascending
+#   u8  categories[tag_count]          padded to 4 bytes
+#   u8  pool[pool_size]                UTF-8 names, lowercase
+MAGIC = b"MKTAGDB\0"
+FORMAT_VERSION = 4
+BYTE_ORDER_MARK = 0x01020304
+HEADER = struct.Struct("=8sIIQqIIIIII")
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def normalize(text):
+    """Normalize a tag or query the way tags are written in the CSV."""
+    return text.strip().replace('\\', '').lower().replace(' ', '_')
+
+
+def parse_aliases(field):
+    """Split the alias column into alias names."""
+    return [
+        alias.strip().lstrip('/')
+        for alias in field.split(',')
+        if alias.strip().lstrip('/')
+    ]
+
+
+def word_starts(key):
+    """
+    Get the positions where a search may start inside a key: the start of
+    the key and the start of every word after an underscore, skipping an
+    opening parenthesis, so "hair" finds "long_hair" and "fate" finds
+    "saber_(fate)".
+    """
+    starts = [0]
+    for i, char in enumerate(key):
+        if char == '_' and i + 1 < len(key):
+            start = i + 1
+            if key[start] == '(' and start + 1 < len(key):
+                start += 1
+            starts.append(start)
+    return starts
+
+
+def trigrams(key):
+    """
+    Get the trigrams of the start of a UTF-8 key as (position, trigram)
+    pairs, with the three bytes of a trigram packed in an integer.
+    """
+    padded = FUZZY_PAD + key[:FUZZY_PREFIX]
+    return [
+        (i, padded[i] << 16 | padded[i + 1] << 8 | padded[i + 2])
+        for i in range(len(padded) - 2)
+    ]
+
+
+def prefix_distance(query, name, bound):
+    """
+    Get the edit distance between a query and the closest prefix of a name,
+    counting a swap of adjacent characters as one edit, or bound + 1 once
+    it is known to exceed bound.
+
+    The common start is skipped, then each kind of edit at the first
+    difference is tried with one edit less, so small bounds stay cheap.
+    """
+    if name.startswith(query):
+        return 0
+    worst = bound + 1
+    if bound == 0:
+        return worst
+
+    k = 0
+    size = min(len(query), len(name))
+    while k < size and query[k] == name[k]:
+        k += 1
+    if k == len(name):
+        # The rest of the query can only be deleted
+        return min(len(query) - k, worst)
+
+    rest = query[k + 1:]
+    best = min(
+        prefix_distance(rest, name[k + 1:], bound - 1),
+        prefix_distance(rest, name[k:], bound - 1),
+        prefix_distance(query[k:], name[k + 1:], bound - 1))
+    if (k + 1 < size and query[k] == name[k + 1] and
+            query[k + 1] == name[k]):
+        best = min(best, prefix_distance(
+            query[k + 2:], name[k + 2:], bound - 1))
+    return min(best + 1, worst)
+
+
+def csv_stamp(csv_path):
+    """Get the (size, mtime) of the CSV that a dictionary is built from."""
+    stat = os.stat(csv_path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def cache_path(stamp):
+    """
+    Get the dictionary path for a CSV version. Each version gets its own
+    file so a new one never replaces a file that is still mapped.
+    """
+    return TAG_CACHE_DIR / f"danbooru_{stamp[0]}_{stamp[1]}.bin"
+
+
+def read_csv(csv_path):
+    """Read the tag CSV into (tag, category, count, aliases) rows."""
+    rows = []
+    with open(csv_path, newline='', encoding='utf-8') as f:
+        for row in csv.reader(f):
+            if len(row) < 3 or not row[0].strip():
+                continue
+            try:
+                category = int(row[1])
+            except ValueError:
+                category = 0
+            if category in EXCLUDED_CATEGORIES:
+                continue
+            try:
+                count = int(row[2])
+            except ValueError:
+                count = 0
+            tag = row[0].strip().lower()
+            aliases = parse_aliases(row[3]) if len(row) > 3 else []
+            # The CSV lists some aliases twice, or repeats the tag itself
+            aliases = list(dict.fromkeys(
+                alias.lower() for alias in aliases
+                if alias.lower() != tag))
+            rows.append((tag, category, count, aliases))
+    return rows
+
+
+def build_dictionary(csv_path, out_path):
+    """Compile the tag CSV into a binary dictionary at out_path."""
+    stamp = csv_stamp(csv_path)
+    rows = read_csv(csv_path)
+
+    # Names are numbered by descending post count of their tag, each tag
+    # just before its aliases, so ranking matches compares name ids
+    rows.sort(key=lambda row: -row[2])
+
+    counts = array('I')
+    categories = array('B')
+    tag_names = array('I')
+    name_tags = array('I')
+    name_offsets = array('I', [0])
+    pool = bytearray()
+    keys = []
+    postings = {}
+    for tag_id, (tag, category, count, aliases) in enumerate(rows):
+        counts.append(count)
+        categories.append(category)
+        tag_names.append(len(name_tags))
+        for name in [tag] + aliases:
+            name_id = len(name_tags)
+            name_tags.append(tag_id)
+            encoded = name.encode('utf-8')
+            for start in word_starts(name):
+                offset = len(name[:start].encode('utf-8'))
+                keys.append((encoded[offset:], name_id, len(pool) + offset))
+            for position, trigram in trigrams(encoded):
+                postings.setdefault(
+                    trigram << 8 | position, array('I')).append(name_id)
+            pool += encoded
+            name_offsets.append(len(pool))
+
+    # Byte order of UTF-8 matches code point order
+    keys.sort()
+    key_names = array('I', (name_id for _, name_id, _ in keys))
+    key_offsets = array('I', (offset for _, _, offset in keys))
+
+    # Names are visited in order, so every posting list is ascending
+    trigram_keys = array('I', sorted(postings))
+    trigram_offsets = array('I', [0])
+    posting_lists = array('I')
+    for trigram in trigram_keys:
+        posting_lists.extend(postings[trigram])
+        trigram_offsets.append(len(posting_lists))
+
+    header = HEADER.pack(
+        MAGIC, FORMAT_VERSION, BYTE_ORDER_MARK, stamp[0], stamp[1],
+        len(rows), len(name_tags), len(keys), len(trigram_keys),
+        len(posting_lists), len(pool))
+
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = out_path.with_name(f"{out_path.name}.tmp")
+    with open(tmp_path, 'wb') as f:
+        f.write(header)
+        for section in (counts, tag_names, name_tags, name_offsets,
+                        key_names, key_offsets, trigram_keys,
+                        trigram_offsets, posting_lists):
+            f.write(section.tobytes())
+        f.write(categories.tobytes())
+        f.write(b"\0" * (-len(categories) % 4))
+        f.write(pool)
+    os.replace(tmp_path, out_path)
+    return out_path
+
+
+class TagIndex:
+    """
+    Prefix index over tags and their aliases, read in place from a
+    memory-mapped binary dictionary.
+    """
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        buffer = memoryview(self._mmap)
+
+        (magic, version, byte_order, csv_size, csv_mtime, tag_count,
+         name_count, key_count, trigram_count, posting_count,
+         pool_size) = HEADER.unpack_from(buffer)
+        if (magic != MAGIC or version != FORMAT_VERSION or
+                byte_order != BYTE_ORDER_MARK):
+            buffer.release()
+            self._mmap.close()
+            raise ValueError(f"Unsupported tag dictionary: {path}")
+        self.stamp = (csv_size, csv_mtime)
+        self.tag_count = tag_count
+        self.name_count = name_count
+
+        offset = HEADER.size
+
+        def section(fmt, length, size):
+            nonlocal offset
+            view = buffer[offset:offset + length * size].cast(fmt)
+            offset += length * size
+            return view
+
+        self.counts = section('I', tag_count, 4)
+        self.tag_names = section('I', tag_count, 4)
+        self.name_tags = section('I', name_count, 4)
+        self.name_offsets = section('I', name_count + 1, 4)
+        self.key_names = section('I', key_count, 4)
+        self.key_offsets = section('I', key_count, 4)
+        self.trigram_keys = section('I', trigram_count, 4)
+        self.trigram_offsets = section('I', trigram_count + 1, 4)
+        self.postings = section('I', posting_count, 4)
+        self.categories = section('B', tag_count + (-tag_count % 4), 1)
+        self.pool = section('B', pool_size, 1)
+
+    def name(self, name_id):
+        """Get a tag or alias name."""
+        return str(self.pool[self.name_offsets[name_id]:
+                             self.name_offsets[name_id + 1]], 'utf-8')
+
+    def is_alias(self, name_id):
+        """Check whether a name is an alias rather than a tag."""
+        return self.tag_names[self.name_tags[name_id]] != name_id
+
+    def _key(self, i):
+        return bytes(self.pool[self.key_offsets[i]:
+                               self.name_offsets[self.key_names[i] + 1]])
+
+    def _bisect(self, target, lo=0):
+        hi = len(self.key_names)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < target:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _prefix_range(self, prefix):
+        # 0xff never occurs in UTF-8, so it sorts after every key
+        lo = self._bisect(prefix)
+        return lo, self._bisect(prefix + b'\xff', lo)
+
+    def _row(self, name_id):
+        tag_id = self.name_tags[name_id]
+        row = {
+            "tag": self.name(name_id),
+            "category": self.categories[tag_id],
+            "count": self.counts[tag_id],
+            "isAlias": self.is_alias(name_id),
+        }
+        if row["isAlias"]:
+            row["aliasFor"] = self.name(self.tag_names[tag_id])
+        return row
+
+    def _filter(self, matches, categories, hide_aliases):
+        if categories:
+            matches = {
+                name_id for name_id in matches
+                if self.categories[self.name_tags[name_id]] in categories
+            }
+
+        if hide_aliases:
+            matched_tags = {
+                self.name_tags[name_id] for name_id in matches
+                if not self.is_alias(name_id)
+            }
+            matches = {
+                name_id for name_id in matches
+                if not self.is_alias(name_id) or
+                self.name_tags[name_id] not in matched_tags
+            }
+        return matches
+
+    def _posting_lists(self, trigram, position, bound):
+        # Insertions and deletions shift a trigram by up to bound positions
+        lists = []
+        for shifted in range(max(0, position - bound), position + bound + 1):
+            key = trigram << 8 | shifted
+            i = bisect_left(self.trigram_keys, key)
+            if i < len(self.trigram_keys) and self.trigram_keys[i] == key:
+                lists.append(self.postings[
+                    self.trigram_offsets[i]:self.trigram_offsets[i + 1]])
+        return lists
+
+    def _swapped_matches(self, query):
+        # Names that start with the query after swapping two characters
+        found = set()
+        for i in range(len(query) - 1):
+            if query[i] == query[i + 1]:
+                continue
+            swapped = (query[:i] + query[i + 1:i + 2] + query[i:i + 1] +
+                       query[i + 2:])
+            lo, hi = self._prefix_range(swapped)
+            for k in range(lo, hi):
+                name_id = self.key_names[k]
+                if self.key_offsets[k] == self.name_offsets[name_id]:
+                    found.add(name_id)
+        return found
+
+    def fuzzy_candidates(self, query, bound):
+        """
+        Get the names whose start may be within bound edits of the query.
+
+        An insertion, deletion or substitution changes at most three
+        trigrams and shifts the others by at most one position, so a match
+        has at least len(grams) - 3 * bound of the query trigrams within
+        bound positions of where the query has them. It must therefore
+        appear for one of the 3 * bound + 1 rarest trigrams. Those are
+        counted in full. The common ones are only probed for the remaining
+        candidates, which are dropped as soon as they can no longer reach
+        the threshold.
+
+        A swap of adjacent characters changes four trigrams. With a single
+        edit, swaps are looked up directly in the key table instead, which
+        keeps the threshold useful for short queries; with more edits each
+        one is counted as four.
+        """
+        grams = sorted(
+            (self._posting_lists(trigram, position, bound)
+             for position, trigram in trigrams(query)),
+            key=lambda lists: sum(map(len, lists)))
+        changed = 3 if bound == 1 else 4 * bound
+        needed = max(1, len(grams) - changed)
+        probe = len(grams) - needed + 1
+
+        counts = Counter()
+        for lists in grams[:probe]:
+            counts.update(set().union(*lists))
+
+        for position in range(probe, len(grams)):
+            remaining = len(grams) - position
+            counts = {
+                name_id: count for name_id, count in counts.items()
+                if count + remaining >= needed
+            }
+            lists = grams[position]
+            if sum(map(len, lists)) <= len(counts) * len(lists):
+                # Short lists are cheaper to scan than to bisect
+                for name_id in set().union(*lists).intersection(counts):
+                    counts[name_id] += 1
+                continue
+            for name_id in counts:
+                for posting_list in lists:
+                    i = bisect_left(posting_list, name_id)
+                    if i < len(posting_list) and posting_list[i] == name_id:
+                        counts[name_id] += 1
+                        break
+        found = {name_id for name_id, count in counts.items()
+                 if count >= needed}
+        if bound == 1:
+            found |= self._swapped_matches(query)
+        return found
+
+    def search(self, query, limit=20, categories=None, hide_aliases=False,
+               fuzzy=False):
+        """
+        Find the most used tags and aliases that match a query.
+
+        A name matches when the query is a prefix of the name or of one of
+        its words. In fuzzy mode, remaining results are filled with names
+        whose start is within one or two edits of the query, ranked by
+        edit distance and then by post count.
+
+        Args:
+            query: Text typed by the user
+            limit: Maximum number of results
+            categories: Optional collection of categories to keep
+            hide_aliases: Leave out aliases whose tag also matches
+            fuzzy: Also return near misses
+
+        Returns:
+            List of result dicts, best first
+        """
+        query = normalize(query)
+        if not query:
+            return []
+        limit = max(1, min(limit, MAX_LIMIT))
+
+        lo, hi = self._prefix_range(query.encode('utf-8'))
+        matches = self._filter(
+            set(self.key_names[lo:hi]), categories, hide_aliases)
+        best = heapq.nsmallest(limit, matches)
+
+        if fuzzy and len(best) < limit and len(query) >= FUZZY_MIN_QUERY:
+            best += self._fuzzy_search(
+                query, limit - len(best), categories, hide_aliases, matches)
+        return [self._row(name_id) for name_id in best]
+
+    def _fuzzy_search(self, query, limit, categories, hide_aliases, exclude):
+        encoded = query.encode('utf-8')
+        bounds = (1, 2) if len(query) >= FUZZY_LONG_QUERY else (1,)
+        for bound in bounds:
+            candidates = self._filter(
+                self.fuzzy_candidates(encoded, bound) - exclude,
+                categories, hide_aliases)
+            found = self._verify(encoded, candidates, bound, limit)
+            if found:
+                return found
+        return []
+
+    def _verify(self, query, candidates, bound, limit):
+        # Names are numbered by popularity, and prefix matches are already
+        # taken, so the first names found at distance 1 are the best ones
+        found = []
+        closest = 0
+        for name_id in sorted(candidates)[:FUZZY_MAX_CANDIDATES]:
+            start = self.name_offsets[name_id]
+            end = min(self.name_offsets[name_id + 1],
+                      start + len(query) + bound)
+            if end - start < len(query) - bound:
+                continue
+            distance = prefix_distance(
+                query, bytes(self.pool[start:end]), bound)
+            if distance <= bound:
+                found.append((distance, name_id))
+                closest += distance == 1
+                if closest >= limit:
+                    break
+        found.sort()
+        return [name_id for _, name_id in found[:limit]]
+
+    def find(self, name):
+        """
+        Find the tag id of an exact tag or alias name, preferring a tag
+        over an alias of another tag. Returns None if unknown.
+        """
+        key = normalize(name).encode('utf-8')
+        if not key:
+            return None
+        found = None
+        i = self._bisect(key)
+        while i < len(self.key_names) and self._key(i) == key:
+            name_id = self.key_names[i]
+            # Only keys that cover the whole name are exact matches
+            if self.key_offsets[i] == self.name_offsets[name_id]:
+                if not self.is_alias(name_id):
+                    return self.name_tags[name_id]
+                if found is None:
+                    found = self.name_tags[name_id]
+            i += 1
+        return found
+
+    def lookup(self, names):
+        """
+        Get the category and post count of exact tag names.
+
+        Returns:
+            Dict of requested name to {"category", "count"}, for the names
+            that are known tags or aliases
+        """
+        found = {}
+        for name in names:
+            tag_id = self.find(name)
+            if tag_id is not None:
+                found[name] = {
+                    "category": self.categories[tag_id],
+                    "count": self.counts[tag_id],
+                }
+        return found
+
+
+def remove_stale_dictionaries(keep):
+    """Delete dictionaries built from older versions of the CSV."""
+    for path in TAG_CACHE_DIR.glob("danbooru_*.bin"):
+        if path != keep:
+            try:
+                path.unlink()
+            except OSError:
+                # Still mapped by another process on some platforms
+                pass
+
+
+def load_index(csv_path=TAG_CSV):
+    """Load the dictionary for the current CSV, building it if needed."""
+    stamp = csv_stamp(csv_path)
+    path = cache_path(stamp)
+    if path.exists():
+        try:
+            index = TagIndex(path)
+            if index.stamp == stamp:
+                return index
+        except (ValueError, OSError) as e:
+            print(f"Rebuilding tag dictionary: {e}")
+
+    print(f"Building tag dictionary from {Path(csv_path).name}")
+    build_dictionary(csv_path, path)
+    remove_stale_dictionaries(path)
+    return TagIndex(path)
+
+
+def get_index():
+    """
+    Get the shared tag index, loading it on first use and again whenever
+    the CSV changes. Returns None if the CSV is missing.
+    """
+    global _index
+    try:
+        stamp = csv_stamp(TAG_CSV)
+    except OSError:
+        return None
+
+    with _index_lock:
+        if _index is None or _index.stamp != stamp:
+            _index = load_index()
+            print(f"Loaded {_index.name_count} tags and aliases "
+                  f"from {TAG_CSV.name}")
+        return _index
+
+
+if __name__ == "__main__":
+    source = Path(sys.argv[1]) if len(sys.argv) > 1 else TAG_CSV
+    target = (Path(sys.argv[2]) if len(sys.argv) > 2
+              else cache_path(csv_stamp(source)))
+    build_dictionary(source, target)
+    print(f"Wrote {target} ({target.stat().st_size} bytes)")
@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+"""
+Thumbnail service for character, style, LoRA and embedding previews.
+
+Square variants are generated lazily at a fixed set of sizes and stored
+under a name derived from a hash of the source image content, so a URL that
+carries the hash can be cached by the browser forever.
+"""
+
+import hashlib
+import json
+import math
+import os
+import shutil
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from PIL import Image, features
+from . import image_pipeline
+
+
+THUMBNAIL_CACHE_DIR = Path(__file__).parent / "config" / "thumbnail_cache"
+THUMBNAIL_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+
+# Cache of the name-keyed previews this service replaced
+LEGACY_CACHE_DIR = Path(__file__).parent / "config" / "preview_cache"
+
+# Sizes generated for every source image
+THUMBNAIL_SIZES = (64, 128, 256)
+DEFAULT_SIZE = 256
+
+# Output formats: (PIL format, file extension, content type, save options)
+FORMATS = {
+    "jpeg": ("JPEG", "jpg", "image/jpeg", {"quality": 85}),
+    "webp": ("WEBP", "webp", "image/webp", {"quality": 80, "method": 4}),
+}
+WEBP_SUPPORTED = features.check("webp")
+
+# Upper bound on the number of tiles in one sprite sheet
+SPRITE_MAX_TILES = 64
+
+# Content-hashed URLs never change what they point to
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+# Number of threads that decode and resize source images
+THUMBNAIL_WORKERS = int(os.environ.get("MUDKNIGHT_THUMBNAIL_WORKERS", 2))
+
+# Disk budget of the cache, least recently used files are evicted first
+THUMBNAIL_CACHE_BUDGET = int(
+    float(os.environ.get("MUDKNIGHT_THUMBNAIL_CACHE_MB", 512)) * 1024 * 1024)
+
+# Optionally render previews for the whole LoRA and embedding library in
+# the background, some time after startup
+WARM_UP = os.environ.get("MUDKNIGHT_THUMBNAIL_WARMUP", "0") == "1"
+WARM_UP_DELAY = 30
+WARM_UP_SIZES = (128, 256)
+WARM_UP_FORMAT = "webp"
+
+# Source hashes, keyed by path and validated by (size, mtime)
+_versions = {}
+_versions_lock = threading.Lock()
+
+# Renders in progress, so concurrent requests share one render
+_executor = ThreadPoolExecutor(
+    max_workers=THUMBNAIL_WORKERS, thread_name_prefix="thumbnails")
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+# Cached files in least recently used order, loaded on first use
+_lru = None
+_lru_bytes = 0
+_lru_lock = threading.Lock()
+
+
+def normalize_format(fmt):
+    """Return a supported output format, falling back to JPEG."""
+    fmt = (fmt or "jpeg").lower()
+    if fmt == "jpg":
+        fmt = "jpeg"
+    if fmt not in FORMATS or (fmt == "webp" and not WEBP_SUPPORTED):
+        return "jpeg"
+    return fmt
+
+
+def content_type(fmt):
+    """Return the content type for an output format."""
+    return FORMATS[normalize_format(fmt)][2]
+
+
+def source_version(source_path):
+    """
+    Return a short hash of the source image content.
+
+    The hash is only recomputed when the file size or mtime changes.
+    """
+    stat = os.stat(source_path)
+    key = str(source_path)
+    stamp = (stat.st_size, stat.st_mtime_ns)
+
+    with _versions_lock:
+        cached = _versions.get(key)
+    if cached and cached[0] == stamp:
+        return cached[1]
+
+    digest = hashlib.sha1()
+    with open(source_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    version = digest.hexdigest()[:16]
+
+    with _versions_lock:
+        _versions[key] = (stamp, version)
+    return version
+
+
+def thumbnail_path(version, size, fmt="jpeg"):
+    """Get the cache path of a thumbnail variant."""
+    ext = FORMATS[normalize_format(fmt)][1]
+    return THUMBNAIL_CACHE_DIR / f"{version}_{size}.{ext}"
+
+
+def render_thumbnail(source_path, out_path, size, fmt="jpeg"):
+    """Center crop and resize a source image and save it to out_path."""
+    pil_format, _, _, options = FORMATS[normalize_format(fmt)]
+    img = image_pipeline.square_thumbnail(source_path, size)
+    return image_pipeline.save_image(img, out_path, pil_format, **options)
+
+
+def _load_lru():
+    global _lru, _lru_bytes
+    if _lru is not None:
+        return
+
+    files = []
+    for entry in os.scandir(THUMBNAIL_CACHE_DIR):
+        if entry.name.endswith('.tmp') or not entry.is_file():
+            continue
+        stat = entry.stat()
+        files.append((stat.st_mtime, Path(entry.path), stat.st_size))
+
+    _lru = OrderedDict()
+    _lru_bytes = 0
+    for _, path, size in sorted(files):
+        _lru[path] = size
+        _lru_bytes += size
+
+
+def _evict():
+    global _lru_bytes
+    # The most recent file is the one just written or served, keep it
+    while _lru_bytes > THUMBNAIL_CACHE_BUDGET and len(_lru) > 1:
+        path, size = _lru.popitem(last=False)
+        _lru_bytes -= size
+        try:
+            path.unlink()
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            print(f"Error evicting thumbnail {path.name}: {e}")
+
+
+def record_file(path):
+    """Add a newly written file to the cache budget, evicting old files."""
+    global _lru_bytes
+    size = path.stat().st_size
+    with _lru_lock:
+        _load_lru()
+        _lru_bytes += size - _lru.pop(path, 0)
+        _lru[path] = size
+        _evict()
+
+
+def touch(path):
+    """Mark a cached file as recently used."""
+    with _lru_lock:
+        _load_lru()
+        if path in _lru:
+            _lru.move_to_end(path)
+    # The mtime keeps the order across restarts
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def cache_usage():
+    """Get the number of bytes used by the cache."""
+    with _lru_lock:
+        _load_lru()
+        return _lru_bytes
+
+
+def _render_variant(source_path, path, size, fmt):
+    if not path.exists():
+        render_thumbnail(source_path, path, size, fmt)
+        record_file(path)
+    return path
+
+
+def _forget_inflight(path):
+    with _inflight_lock:
+        _inflight.pop(path, None)
+
+
+def _log_failure(future):
+    if future.exception() is not None:
+        print(f"Error creating thumbnail: {future.exception()}")
+
+
+def submit_thumbnail(source_path, version, size=DEFAULT_SIZE, fmt="jpeg"):
+    """
+    Get a future for the path of a thumbnail variant.
+
+    Missing variants are rendered on the worker pool, and concurrent
+    requests for the same variant share a single render.
+    """
+    fmt = normalize_format(fmt)
+    path = thumbnail_path(version, size, fmt)
+    if path.exists():
+        touch(path)
+        future = Future()
+        future.set_result(path)
+        return future
+
+    with _inflight_lock:
+        future = _inflight.get(path)
+        if future is None:
+            future = _executor.submit(
+                _render_variant, source_path, path, size, fmt)
+            _inflight[path] = future
+            created = True
+        else:
+            created = False
+
+    # Registered outside the lock, the callback runs at once if done
+    if created:
+        future.add_done_callback(lambda _: _forget_inflight(path))
+    return future
+
+
+def request_thumbnail(source_path, version, size=DEFAULT_SIZE, fmt="jpeg"):
+    """
+    Get a future for the path of a thumbnail variant, and queue the other
+    sizes for the same source in the background.
+    """
+    future = submit_thumbnail(source_path, version, size, fmt)
+    schedule_variants(source_path, version, fmt)
+    return future
+
+
+def get_thumbnail(source_path, version, size=DEFAULT_SIZE, fmt="jpeg"):
+    """Get the path of a thumbnail variant, waiting for it to render."""
+    return request_thumbnail(source_path, version, size, fmt).result()
+
+
+def schedule_variants(source_path, version, fmt="jpeg"):
+    """Queue generation of every missing size for a source image."""
+    for size in THUMBNAIL_SIZES:
+        if not thumbnail_path(version, size, fmt).exists():
+            future = submit_thumbnail(source_path, version, size, fmt)
+            future.add_done_callback(_log_failure)
+
+
+def remove_legacy_cache():
+    """Delete the old preview cache, which nothing reads any more."""
+    if LEGACY_CACHE_DIR.exists():
+        shutil.rmtree(LEGACY_CACHE_DIR, ignore_errors=True)
+        print("Removed the old preview cache")
+
+
+def warm_up(sources, sizes=WARM_UP_SIZES, fmt=WARM_UP_FORMAT):
+    """
+    Render thumbnails for a list of source images, one at a time so that
+    requests are not starved. Stops once the cache is nearly full, since
+    going on would only evict what was just rendered.
+    """
+    remove_legacy_cache()
+    rendered = 0
+    for source_path in sources:
+        if cache_usage() >= THUMBNAIL_CACHE_BUDGET * 0.9:
+            print("Thumbnail warm-up stopped: cache budget reached")
+            break
+        try:
+            version = source_version(source_path)
+            for size in sizes:
+                submit_thumbnail(source_path, version, size, fmt).result()
+            rendered += 1
+        except Exception as e:
+            print(f"Error warming up thumbnail for {source_path}: {e}")
+    print(f"Thumbnail warm-up finished: {rendered} previews")
+
+
+def sprite_key(entries, size, fmt="jpeg"):
+    """
+    Get the cache key of a sprite sheet.
+
+    Args:
+        entries: Ordered list of (name, version) tuples
+        size: Tile size in pixels
+        fmt: Output format
+    """
+    payload = json.dumps(
+        [size, normalize_format(fmt), entries], ensure_ascii=False)
+    return hashlib.sha1(payload.encode('utf-8')).hexdigest()[:16]
+
+
+def sprite_path(key, fmt="jpeg"):
+    """Get the cache path of a sprite sheet."""
+    ext = FORMATS[normalize_format(fmt)][1]
+    return THUMBNAIL_CACHE_DIR / f"sprite_{key}.{ext}"
+
+
+def sprite_layout(count):
+    """Get the (columns, rows) of a sprite sheet with count tiles."""
+    columns = max(1, math.ceil(math.sqrt(count)))
+    rows = max(1, math.ceil(count / columns))
+    return columns, rows
+
+
+def get_sprite(sources, size=DEFAULT_SIZE, fmt="jpeg"):
+    """
+    Get the path of a sprite sheet, rendering it if needed.
+
+    Args:
+        sources: Ordered list of (name, source_path, version) tuples
+        size: Tile size in pixels
+        fmt: Output format
+
+    Returns:
+        Tuple of (path, columns, rows); tile i is at column i % columns
+        and row i // columns
+    """
+    fmt = normalize_format(fmt)
+    key = sprite_key(
+        [(name, version) for name, _, version in sources], size, fmt)
+    path = sprite_path(key, fmt)
+    columns, rows = sprite_layout(len(sources))
+    if path.exists():
+        touch(path)
+        return path, columns, rows
+
+    # Tiles come from the regular thumbnail cache, only in the tile size
+    tiles = [
+        submit_thumbnail(source_path, version, size, fmt)
+        for _, source_path, version in sources
+    ]
+    sheet = Image.new('RGB', (columns * size, rows * size))
+    for index, future in enumerate(tiles):
+        with Image.open(future.result()) as tile:
+            sheet.paste(
+                tile.convert('RGB'),
+                ((index % columns) * size, (index // columns) * size))
+
+    pil_format, _, _, options = FORMATS[fmt]
+    image_pipeline.save_image(sheet, path, pil_format, **options)
+    record_file(path)
+    return path, columns, rows
@@ -1,13 +1,7 @@
 #!/usr/bin/env python3
 import folder_paths
-from comfy_extras.nodes_upscale_model import (
-    ImageUpscaleWithModel,
-    UpscaleModelLoader,
-)
 from nodes import ImageScale
-import comfy.utils
-# import comfy.model_management as mm
-import os
+from . import common
 
 
 class CombinedUpscaleNode:
@@ -17,9 +11,7 @@ class CombinedUpscaleNode:
     """
 
     def __init__(self):
-        self.upscale_with_model = ImageUpscaleWithModel()
         self.image_scale = ImageScale()
-        self.model_loader = UpscaleModelLoader()
 
     @classmethod
     def INPUT_TYPES(cls):
@@ -61,15 +53,11 @@ class CombinedUpscaleNode:
         original_height = image.shape[1]
         original_width = image.shape[2]
 
-        # Load the upscale model
-        upscale_model = self.model_loader.load_model(
-            upscale_model_name
-        )[0]
+        # Load the upscale model, shared with the other nodes
+        upscale_model = common.load_upscale_model(upscale_model_name)
 
         # Apply model-based upscaling
-        upscaled_image = self.upscale_with_model.upscale(
-            upscale_model, image
-        )[0]
+        upscaled_image = common.upscale_with_model(upscale_model, image)
 
         # Calculate target dimensions based on scale_factor
         target_width = int(original_width * scale_factor)
@@ -87,37 +75,8 @@ class CombinedUpscaleNode:
         return (upscaled_image,)
 
     def load_upscale_model(self, model_name):
-        """Load an upscale model from the models directory."""
-        model_path = folder_paths.get_full_path(
-            "upscale_models", model_name
-        )
-
-        if not os.path.exists(model_path):
-            raise FileNotFoundError(
-                f"Upscale model not found: {model_path}"
-            )
-
-        sd = comfy.utils.load_torch_file(
-            model_path, safe_load=True
-        )
-
-        if "module.layers.0.residual_group.blocks.0.norm1.weight" in sd:
-            sd = comfy.utils.state_dict_prefix_replace(
-                sd, {"module.": ""}
-            )
-
-        out = comfy.utils.model_management.load_models_gpu(
-            [comfy.sd.LDSR(sd)]
-        )
-
-        if "body.0.rdb1.conv1.weight" in sd:
-            import comfy_extras.nodes_upscale_model as nodes_upscale
-
-            out = nodes_upscale.UpscaleModelLoader().load_model(
-                model_name
-            )[0]
-
-        return out
+        """Load an upscale model from the shared model cache."""
+        return common.load_upscale_model(model_name)
 
 
 NODE_CLASS_MAPPINGS = {
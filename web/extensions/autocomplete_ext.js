@@ -1,4 +1,5 @@
 import { app } from "/scripts/app.js";
+import { api as comfyApi } from "/scripts/api.js";
 import { autocompleteState } from 
     "/extensions/comfyui-mudknight-utils/modules/state.js";
 import * as api from 
@@ -7,6 +8,12 @@ import {
     setupAutocomplete, 
     initAutocomplete 
 } from "/extensions/comfyui-mudknight-utils/modules/autocomplete.js";
+import {
+    CONFIG_CHANGED_EVENT,
+    initConfigVersions,
+    handleConfigChange,
+    resyncConfigs
+} from "/extensions/comfyui-mudknight-utils/modules/sync.js";
 
 const link = document.createElement("link");
 link.rel = "stylesheet";
@@ -65,13 +72,20 @@ app.registerExtension({
             hideAliases
         );
 
-        const tags = await api.loadAutocompleteTags();
-        autocompleteState.tags = tags;
+        // Keep presets current when characters or tags change anywhere
+        await initConfigVersions();
+        comfyApi.addEventListener(CONFIG_CHANGED_EVENT, ({ detail }) => {
+            handleConfigChange(detail);
+        });
+        comfyApi.addEventListener("reconnected", () => {
+            resyncConfigs();
+        });
 
+        // Tags are searched on the server as the user types
         const [characterPresets, tagPresets, loras, embeds] = 
             await Promise.all([
-                api.loadCharacterPresets(tags),
-                api.loadTagPresets(tags),
+                api.loadCharacterPresets(),
+                api.loadTagPresets(),
                 api.loadLoras(),
                 api.loadEmbeddings()
             ]);
@@ -80,11 +94,22 @@ app.registerExtension({
         autocompleteState.tagPresets = tagPresets;
         autocompleteState.loras = loras;
         autocompleteState.embeddings = embeds;
+        autocompleteState.activeCheckpoint = () => this.activeCheckpoint();
 
         // Setup MutationObserver for Vue nodes (Nodes 2.0)
         this.setupVueNodeObserver();
     },
 
+    activeCheckpoint() {
+        // Checkpoint of the first loader that is not muted or bypassed
+        for (const node of app.graph?._nodes ?? []) {
+            if (node.mode !== 0) continue;
+            const widget = node.widgets?.find(w => w.name === "ckpt_name");
+            if (widget?.value) return widget.value;
+        }
+        return null;
+    },
+
     setupVueNodeObserver() {
         const processedTextareas = new WeakSet();
 
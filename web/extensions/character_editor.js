@@ -25,8 +25,8 @@ app.registerExtension({
             editorButton.appendChild(icon);
 
             editorButton.onclick = () => {
-                const url = "/extensions/comfyui-mudknight-utils/" +
-                    "character_editor.html";
+                // Served pre-compressed, along with everything it loads
+                const url = "/mudknight_static/character_editor.html";
                 window.open(
                     url,
                     "PresetManager",
@@ -1,5 +1,10 @@
 import { state } from './state.js';
-import { encodeName } from './utils.js';
+import { encodeName, getSortedNames } from './utils.js';
+
+// Grid images are fetched as sprite sheets of this many tiles. Chunks are
+// taken from all names with images, so they stay cached while filtering.
+const SPRITE_CHUNK_SIZE = 64;
+const spriteRequests = new Map();
 
 export async function loadCharacters() {
 	const response = await fetch('/character_editor');
@@ -33,110 +38,50 @@ export async function loadTags() {
 	throw new Error('Failed to load tags');
 }
 
-export async function loadAutocompleteTags() {
-	try {
-		const response = await fetch(
-			'/extensions/comfyui-mudknight-utils/danbooru.csv'
-		);
-		if (!response.ok) {
-			console.log('Danbooru CSV not found');
-			return [];
-		}
-
-		const text = await response.text();
-		const lines = text.split('\n');
-
-		const tags = [];
-
-		for (const line of lines) {
-			if (!line.trim()) continue;
-
-			// Parse CSV line handling quotes
-			const parts = parseCsvLine(line);
-			if (parts.length < 3) continue;
-
-			const tag = parts[0].trim();
-			const category = parseInt(parts[1]) || 0;
-			const count = parseInt(parts[2]) || 0;
-			const aliasField = parts[3] || '';
-
-			// Skip category 2 (unused)
-			if (category === 2) continue;
-
-			// Add main tag
-			tags.push({
-				tag: tag,
-				category: category,
-				count: count,
-				isAlias: false
-			});
-
-			// Parse and add aliases
-			if (aliasField) {
-				const aliases = parseAliases(aliasField);
-				for (const alias of aliases) {
-					tags.push({
-						tag: alias,
-						category: category,
-						count: count,
-						isAlias: true,
-						aliasFor: tag
-					});
-				}
-			}
-		}
-
-		// Sort by count (descending)
-		tags.sort((a, b) => b.count - a.count);
-
-		console.log(`Loaded ${tags.length} tags from Danbooru CSV`);
-		return tags;
-	} catch (error) {
-		console.error('Error loading Danbooru tags:', error);
-		return [];
+export async function searchTags(query, options = {}) {
+	const params = new URLSearchParams({
+		q: query,
+		limit: options.limit || 20,
+		mode: options.mode || 'prefix'
+	});
+	if (options.hideAliases) {
+		params.set('hide_aliases', '1');
+	}
+	const response = await fetch(`/tag_autocomplete?${params}`, {
+		signal: options.signal
+	});
+	if (response.ok) {
+		return await response.json();
 	}
+	throw new Error('Failed to search tags');
 }
 
-function parseCsvLine(line) {
-	const parts = [];
-	let current = '';
-	let inQuotes = false;
-
-	for (let i = 0; i < line.length; i++) {
-		const char = line[i];
-
-		if (char === '"') {
-			inQuotes = !inQuotes;
-		} else if (char === ',' && !inQuotes) {
-			parts.push(current);
-			current = '';
-		} else {
-			current += char;
+async function lookupTags(names) {
+	try {
+		const response = await fetch('/tag_autocomplete/lookup', {
+			method: 'POST',
+			headers: { 'Content-Type': 'application/json' },
+			body: JSON.stringify({ names })
+		});
+		if (response.ok) {
+			return await response.json();
 		}
+	} catch (error) {
+		console.error('Error looking up tags:', error);
 	}
-
-	if (current) {
-		parts.push(current);
-	}
-
-	return parts;
+	return {};
 }
 
-function parseAliases(aliasField) {
-	if (!aliasField) return [];
-
-	// Remove quotes and leading/trailing slashes
-	let cleaned = aliasField.replace(/^["\/]+|["\/]+$/g, '');
-
-	// Split by comma
-	const aliases = cleaned.split(',')
-		.map(a => a.trim())
-		.filter(a => a.length > 0);
-
-	return aliases;
+function normalizeTagName(name) {
+	// Normalize: strip backslashes, trim, lowercase,
+	// replace spaces with underscores
+	return name.trim()
+		.replace(/\\/g, '')  // Remove backslashes
+		.toLowerCase()
+		.replace(/ /g, '_');
 }
 
-export async function loadCharacterPresets(danbooruTags) {
+export async function loadCharacterPresets() {
 	try {
 		const response = await fetch('/character_editor');
 		if (!response.ok) {
@@ -144,57 +89,7 @@ export async function loadCharacterPresets(danbooruTags) {
 			return [];
 		}
 		const characters = await response.json();
-		
-		// Create tag lookup map for faster searching
-		const tagMap = new Map();
-		danbooruTags.forEach(tag => {
-			tagMap.set(tag.tag.toLowerCase(), tag);
-		});
-		
-		// First, collect all character data
-		const presetData = [];
-		for (const [name, data] of Object.entries(characters)) {
-			// Normalize: strip backslashes, trim, lowercase, 
-			// replace spaces with underscores
-			const nameLower = name.trim()
-				.replace(/\\/g, '')  // Remove backslashes
-				.toLowerCase()
-				.replace(/ /g, '_');
-			const danbooruTag = tagMap.get(nameLower);
-			
-			// Inherit properties from danbooru if exists,
-			// otherwise default to character category
-			const category = danbooruTag ? danbooruTag.category : 4;
-			const count = danbooruTag ? danbooruTag.count : 0;
-			
-			presetData.push({
-				name: name,
-				nameLower: nameLower,
-				category: category,
-				count: count
-			});
-		}
-		
-		// Check all images in parallel
-		const imageChecks = presetData.map(item => 
-			checkCharacterImage(item.name).then(hasImage => ({
-				...item,
-				hasImage: hasImage
-			}))
-		);
-		const presetsWithImages = await Promise.all(imageChecks);
-		
-		// Build final presets array
-		const presets = presetsWithImages.map(item => ({
-			tag: item.nameLower,
-			category: item.category,
-			count: item.count,
-			isAlias: false,
-			isPreset: true,
-			presetType: 'character',
-			characterName: item.name,  // Store original name for image lookup
-			hasImage: item.hasImage
-		}));
+		const presets = await buildCharacterPresets(Object.keys(characters));
 		
 		console.log(`Loaded ${presets.length} character presets`);
 		return presets;
@@ -204,16 +99,58 @@ export async function loadCharacterPresets(danbooruTags) {
 	}
 }
 
-async function checkCharacterImage(name) {
+export async function buildCharacterPresets(names) {
+	const danbooruTags = await lookupTags(names);
+	
+	// First, collect all character data
+	const presetData = [];
+	for (const name of names) {
+		const nameLower = normalizeTagName(name);
+		const danbooruTag = danbooruTags[name];
+		
+		// Inherit properties from danbooru if exists,
+		// otherwise default to character category
+		const category = danbooruTag ? danbooruTag.category : 4;
+		const count = danbooruTag ? danbooruTag.count : 0;
+		
+		presetData.push({
+			name: name,
+			nameLower: nameLower,
+			category: category,
+			count: count
+		});
+	}
+	
+	// Image versions for every character that has an image
+	const versions = await loadImageVersions('character');
+	
+	// Build final presets array
+	return presetData.map(item => ({
+		tag: item.nameLower,
+		category: item.category,
+		count: item.count,
+		isAlias: false,
+		isPreset: true,
+		presetType: 'character',
+		characterName: item.name,  // Store original name for image lookup
+		hasImage: Boolean(versions[item.name]),
+		imageVersion: versions[item.name]
+	}));
+}
+
+async function loadImageVersions(type) {
 	try {
-		const response = await fetch(`/character_editor/image/${encodeName(name)}`);
-		return response.ok;
+		const response = await fetch(`/thumbnail_versions/${type}`);
+		if (response.ok) {
+			return await response.json();
+		}
 	} catch (error) {
-		return false;
+		console.error(`Error loading ${type} image versions:`, error);
 	}
+	return {};
 }
 
-export async function loadTagPresets(danbooruTags) {
+export async function loadTagPresets() {
 	try {
 		const response = await fetch('/tag_editor');
 		if (!response.ok) {
@@ -221,37 +158,7 @@ export async function loadTagPresets(danbooruTags) {
 			return [];
 		}
 		const tags = await response.json();
-		
-		// Create tag lookup map for faster searching
-		const tagMap = new Map();
-		danbooruTags.forEach(tag => {
-			tagMap.set(tag.tag.toLowerCase(), tag);
-		});
-		
-		const presets = [];
-		for (const name of Object.keys(tags)) {
-			// Normalize: strip backslashes, trim, lowercase,
-			// replace spaces with underscores
-			const nameLower = name.trim()
-				.replace(/\\/g, '')  // Remove backslashes
-				.toLowerCase()
-				.replace(/ /g, '_');
-			const danbooruTag = tagMap.get(nameLower);
-			
-			// Inherit properties from danbooru if exists,
-			// otherwise default to general category
-			const category = danbooruTag ? danbooruTag.category : 0;
-			const count = danbooruTag ? danbooruTag.count : 0;
-			
-			presets.push({
-				tag: nameLower,
-				category: category,
-				count: count,
-				isAlias: false,
-				isPreset: true,
-				presetType: 'tag'
-			});
-		}
+		const presets = await buildTagPresets(Object.keys(tags));
 		
 		console.log(`Loaded ${presets.length} tag presets`);
 		return presets;
@@ -261,6 +168,52 @@ export async function loadTagPresets(danbooruTags) {
 	}
 }
 
+export async function buildTagPresets(names) {
+	const danbooruTags = await lookupTags(names);
+	
+	const presets = [];
+	for (const name of names) {
+		const nameLower = normalizeTagName(name);
+		const danbooruTag = danbooruTags[name];
+		
+		// Inherit properties from danbooru if exists,
+		// otherwise default to general category
+		const category = danbooruTag ? danbooruTag.category : 0;
+		const count = danbooruTag ? danbooruTag.count : 0;
+		
+		presets.push({
+			tag: nameLower,
+			category: category,
+			count: count,
+			isAlias: false,
+			isPreset: true,
+			presetType: 'tag',
+			tagName: name  // Store original name for change tracking
+		});
+	}
+	return presets;
+}
+
+export async function loadConfigVersions() {
+	const response = await fetch('/config_versions');
+	if (response.ok) {
+		return await response.json();
+	}
+	throw new Error('Failed to load config versions');
+}
+
+export async function loadConfigEntries(config, names) {
+	const response = await fetch(`/config_entries/${config}`, {
+		method: 'POST',
+		headers: { 'Content-Type': 'application/json' },
+		body: JSON.stringify({ names })
+	});
+	if (response.ok) {
+		return await response.json();
+	}
+	throw new Error(`Failed to load ${config} entries`);
+}
+
 export async function saveCharacters(characters) {
 	const response = await fetch('/character_editor', {
 		method: 'POST',
@@ -330,21 +283,87 @@ export async function checkImages(type) {
 		character: state.characterImages,
 		style: state.styleImages
 	};
-	const endpoint = type === 'character' ? 
-		'/character_editor/image/' : '/style_editor/image/';
+	const versions = await loadImageVersions(type);
 
+	// Store the content hash, so image URLs change only with the image
 	for (const name of Object.keys(dataMap[type])) {
-		const response = await fetch(
-			`${endpoint}${encodeName(name)}`
-		);
-		imageMap[type][name] = response.ok;
+		imageMap[type][name] = versions[name] || false;
 	}
 }
 
-export function getImageUrl(name, type = 'character') {
-	const endpoint = type === 'character' ? 
-		'/character_editor/image/' : '/style_editor/image/';
-	return `${endpoint}${encodeName(name)}?t=${Date.now()}`;
+export function getThumbnailUrl(kind, encodedName, size, version) {
+	const query = typeof version === 'string' ? `&v=${version}` : '';
+	return `/thumbnail/${kind}/${size}/${encodedName}?fmt=webp${query}`;
+}
+
+export function getImageUrl(name, type = 'character', size = 256) {
+	const imageMap = type === 'character' ?
+		state.characterImages : state.styleImages;
+	return getThumbnailUrl(type, encodeName(name), size, imageMap[name]);
+}
+
+async function requestSprite(type, names) {
+	try {
+		const response = await fetch('/thumbnail_sprite', {
+			method: 'POST',
+			headers: { 'Content-Type': 'application/json' },
+			body: JSON.stringify({
+				kind: type,
+				names: names,
+				size: 256,
+				fmt: 'webp'
+			})
+		});
+		if (response.ok) {
+			const result = await response.json();
+			return result.sprite;
+		}
+	} catch (error) {
+		console.error('Error loading sprite:', error);
+	}
+	return null;
+}
+
+export async function loadSprites(type) {
+	const imageMap = type === 'character' ?
+		state.characterImages : state.styleImages;
+	const names = getSortedNames(imageMap).filter(name => imageMap[name]);
+
+	const keys = new Set();
+	const requests = [];
+	for (let i = 0; i < names.length; i += SPRITE_CHUNK_SIZE) {
+		const chunk = names.slice(i, i + SPRITE_CHUNK_SIZE);
+		const key = JSON.stringify(
+			[type, chunk.map(name => [name, imageMap[name]])]
+		);
+		if (!spriteRequests.has(key)) {
+			spriteRequests.set(key, requestSprite(type, chunk));
+		}
+		keys.add(key);
+		requests.push(spriteRequests.get(key));
+	}
+
+	// Forget sprites for chunks that no longer exist
+	for (const key of spriteRequests.keys()) {
+		if (key.startsWith(`["${type}"`) && !keys.has(key)) {
+			spriteRequests.delete(key);
+		}
+	}
+
+	const tiles = {};
+	for (const sprite of await Promise.all(requests)) {
+		if (!sprite) continue;
+		for (const [name, [column, row]] of Object.entries(sprite.tiles)) {
+			tiles[name] = {
+				url: sprite.url,
+				column: column,
+				row: row,
+				columns: sprite.columns,
+				rows: sprite.rows
+			};
+		}
+	}
+	return tiles;
 }
 
 export async function uploadImage(file, name, type = 'character') {
@@ -368,10 +387,12 @@ export async function uploadImage(file, name, type = 'character') {
 				);
 
 				if (response.ok) {
+					const result = await response.json();
+					const version = result.version || true;
 					if (type === 'character') {
-						state.characterImages[name] = true;
+						state.characterImages[name] = version;
 					} else {
-						state.styleImages[name] = true;
+						state.styleImages[name] = version;
 					}
 					resolve(true);
 				} else {
@@ -407,9 +428,12 @@ export async function deleteImage(name, type = 'character') {
 	throw new Error('Failed to delete image');
 }
 
-export async function loadLoras() {
+export async function loadLoras(checkpoint = null) {
+	// With a checkpoint, only LoRAs for its base model are listed
+	const query = checkpoint ?
+		`?checkpoint=${encodeURIComponent(checkpoint)}` : '';
 	try {
-		const response = await fetch('/lora_list');
+		const response = await fetch(`/lora_list${query}`);
 		if (!response.ok) {
 			console.log('Failed to load LoRA list');
 			return [];
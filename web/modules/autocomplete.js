@@ -1,5 +1,13 @@
 import { autocompleteState } from './state.js';
-import { getImageUrl } from './api.js';
+import { getThumbnailUrl, loadLoras, searchTags } from './api.js';
+import { encodeName } from './utils.js';
+
+// Tag searches run on the server, only the latest request is rendered
+let tagRequestId = 0;
+let tagRequestController = null;
+
+// Only the latest LoRA list request is kept
+let loraRequestId = 0;
 
 // Shared thumbnail element for autocomplete
 let sharedThumbnail = null;
@@ -15,15 +23,16 @@ function getOrCreateThumbnail() {
 	return sharedThumbnail;
 }
 
-function getPreviewUrl(nameOrPath, type) {
+function getPreviewUrl(nameOrPath, type, version) {
+	// Thumbnails are shown at 128px, use the larger variant on HiDPI
+	const size = window.devicePixelRatio > 1 ? 256 : 128;
 	if (type === 'character') {
-		return getImageUrl(nameOrPath, 'character');
-	} else if (type === 'lora') {
-		// URL encode the name for the API
-		return `/lora_preview/${encodeURIComponent(nameOrPath)}?t=${Date.now()}`;
-	} else if (type === 'embedding') {
-		// URL encode the path for the API
-		return `/embedding_preview/${encodeURIComponent(nameOrPath)}?t=${Date.now()}`;
+		return getThumbnailUrl(
+			'character', encodeName(nameOrPath), size, version);
+	} else if (type === 'lora' || type === 'embedding') {
+		// URL encode the name or path for the API
+		return getThumbnailUrl(
+			type, encodeURIComponent(nameOrPath), size, version);
 	}
 	return null;
 }
@@ -70,7 +79,8 @@ function showThumbnailForElement(element, nameOrPath, previewType, immediate = f
 	}
 	
 	const thumbnail = getOrCreateThumbnail();
-	const previewUrl = getPreviewUrl(nameOrPath, previewType);
+	const previewUrl = getPreviewUrl(
+		nameOrPath, previewType, element.dataset.previewVersion);
 	
 	if (!previewUrl) {
 		currentPreviewKey = null;
@@ -202,7 +212,7 @@ function showAutocomplete(input, context) {
 		return;
 	}
 
-	const { type, searchTerm, start } = context;
+	const { type, searchTerm } = context;
 
 	// For LoRA and embedding, show immediately after typing prefix
 	// For tags, require at least 2 characters
@@ -218,11 +228,15 @@ function showAutocomplete(input, context) {
 		return;
 	}
 
+	// Any pending tag search is now stale
+	cancelTagSearch();
+
 	autocompleteState.contextType = type;
 	let filtered = [];
 
 	// Filter based on context type
 	if (type === 'lora') {
+		refreshLorasForCheckpoint(input);
 		const searchLower = searchTerm.toLowerCase();
 		filtered = autocompleteState.loras
 			.filter(item => 
@@ -236,7 +250,9 @@ function showAutocomplete(input, context) {
 				type: 'lora',
 				hasPreview: item.hasPreview || false,
 				previewName: item.name,
-				previewPath: item.path  // Store full path as fallback
+				previewPath: item.path,  // Store full path as fallback
+				previewVersion: item.previewVersion,
+				baseModel: item.baseModel
 			}));
 	} else if (type === 'embedding') {
 		const searchLower = searchTerm.toLowerCase();
@@ -251,106 +267,146 @@ function showAutocomplete(input, context) {
 				value: item.name,
 				type: 'embedding',
 				hasPreview: item.hasPreview || false,
-				previewPath: item.path
+				previewPath: item.path,
+				previewVersion: item.previewVersion
 			}));
 	} else {
-		// Tag search with category, alias, and preset support
-		// Replace spaces with underscores for matching
-		const searchLower = searchTerm.toLowerCase().replace(/ /g, '_');
-		
-		// Create a map to merge presets with regular tags
-		// Presets replace regular tags when they have the same name
-		const tagMap = new Map();
-		
-		// First, add all regular tags
-		autocompleteState.tags.forEach(tag => {
-			const key = tag.tag.toLowerCase().trim();
-			tagMap.set(key, tag);
-		});
-		
-		// Then, override with character presets
-		autocompleteState.characterPresets.forEach(preset => {
-			const key = preset.tag.toLowerCase().trim();
-			tagMap.set(key, preset);
+		showTagAutocomplete(input, context);
+		return;
+	}
+
+	renderAutocomplete(input, context, filtered);
+}
+
+async function refreshLorasForCheckpoint(input) {
+	// Reload the LoRA list when the active loader's checkpoint changes,
+	// so only LoRAs for its base model are suggested
+	const checkpoint = autocompleteState.activeCheckpoint ?
+		autocompleteState.activeCheckpoint() || null : null;
+	if (checkpoint === autocompleteState.lorasCheckpoint) return;
+	autocompleteState.lorasCheckpoint = checkpoint;
+
+	const requestId = ++loraRequestId;
+	const loras = await loadLoras(checkpoint);
+	if (requestId !== loraRequestId) return;
+	autocompleteState.loras = loras;
+
+	// Redraw the open list with the filtered LoRAs
+	if (autocompleteState.activeElement === input &&
+		autocompleteState.contextType === 'lora') {
+		showAutocomplete(input, detectContext(input));
+	}
+}
+
+function cancelTagSearch() {
+	tagRequestId++;
+	if (tagRequestController) {
+		tagRequestController.abort();
+		tagRequestController = null;
+	}
+}
+
+function matchesTagQuery(tag, query) {
+	// Same rule as the server index: the query starts the tag or one of
+	// its words
+	return tag.startsWith(query) ||
+		tag.includes('_' + query) ||
+		tag.includes('_(' + query);
+}
+
+async function showTagAutocomplete(input, context) {
+	// Tag search with category, alias, and preset support
+	// Replace spaces with underscores for matching
+	const searchLower = context.searchTerm.toLowerCase().replace(/ /g, '_');
+
+	const requestId = tagRequestId;
+	const controller = new AbortController();
+	tagRequestController = controller;
+
+	let tags = [];
+	try {
+		tags = await searchTags(searchLower, {
+			limit: 20,
+			// Near misses fill the list when few tags start with the query
+			mode: 'fuzzy',
+			hideAliases: autocompleteState.hideAliasesWithMain,
+			signal: controller.signal
 		});
-		
-		// Finally, override with tag presets
-		autocompleteState.tagPresets.forEach(preset => {
-			const key = preset.tag.toLowerCase().trim();
+	} catch (error) {
+		if (error.name !== 'AbortError') {
+			console.error('Error searching tags:', error);
+		}
+	}
+
+	// A newer keystroke or another context has taken over
+	if (requestId !== tagRequestId) {
+		return;
+	}
+	tagRequestController = null;
+
+	// Create a map to merge presets with regular tags
+	// Presets replace regular tags when they have the same name
+	const tagMap = new Map();
+	
+	// First, add the tags found by the server
+	tags.forEach(tag => {
+		const key = tag.tag.toLowerCase().trim();
+		tagMap.set(key, tag);
+	});
+	
+	// Then, override with matching character presets
+	autocompleteState.characterPresets.forEach(preset => {
+		const key = preset.tag.toLowerCase().trim();
+		if (matchesTagQuery(key, searchLower)) {
 			tagMap.set(key, preset);
-		});
-		
-		// Convert map back to array and filter matching tags
-		let matching = Array.from(tagMap.values())
-			.filter(item => 
-				item.tag.toLowerCase().includes(searchLower)
-			)
-			.map(item => ({
-				display: item.tag.replace(/_/g, ' '),
-				value: item.isAlias ? 
-					item.aliasFor.replace(/_/g, ' ') : 
-					item.tag.replace(/_/g, ' '),
-				count: item.count,
-				category: item.category,
-				isAlias: item.isAlias,
-				aliasFor: item.aliasFor ? 
-					item.aliasFor.replace(/_/g, ' ') : undefined,
-				isPreset: item.isPreset || false,
-				presetType: item.presetType,
-				characterName: item.characterName,  // For image lookup
-				hasImage: item.hasImage || false,
-				type: 'tag'
-			}));
-		
-		// Filter aliases if setting enabled
-		if (autocompleteState.hideAliasesWithMain) {
-			const mainTagsPresent = new Map();
-			matching.forEach(item => {
-				if (!item.isAlias) {
-					const normalizedValue = 
-						item.value.toLowerCase().replace(/ /g, '_');
-					mainTagsPresent.set(normalizedValue, true);
-				}
-			});
-			
-			matching = matching.filter(item => {
-				if (!item.isAlias || !item.aliasFor) {
-					return true;
-				}
-				
-				const mainTag = 
-					item.aliasFor.toLowerCase().replace(/ /g, '_');
-				const aliasTag = 
-					item.display.toLowerCase().replace(/ /g, '_');
-				
-				if (mainTagsPresent.has(mainTag)) {
-					const searchMatchesAlias = 
-						aliasTag.startsWith(searchLower);
-					const searchMatchesMain = 
-						mainTag.startsWith(searchLower);
-					
-					return searchMatchesAlias && !searchMatchesMain;
-				}
-				
-				return true;
-			});
 		}
-		
-		if (autocompleteState.presetsFirst) {
-			matching.sort((a, b) => {
-				// Presets always come first
-				if (a.isPreset && !b.isPreset) return -1;
-				if (!a.isPreset && b.isPreset) return 1;
-				// Within same group, sort by count
-				return b.count - a.count;
-			});
-		} else {
-			// Just sort by count
-			matching.sort((a, b) => b.count - a.count);
+	});
+	
+	// Finally, override with matching tag presets
+	autocompleteState.tagPresets.forEach(preset => {
+		const key = preset.tag.toLowerCase().trim();
+		if (matchesTagQuery(key, searchLower)) {
+			tagMap.set(key, preset);
 		}
-		
-		filtered = matching.slice(0, 10);
+	});
+	
+	const matching = Array.from(tagMap.values())
+		.map(item => ({
+			display: item.tag.replace(/_/g, ' '),
+			value: item.isAlias ? 
+				item.aliasFor.replace(/_/g, ' ') : 
+				item.tag.replace(/_/g, ' '),
+			count: item.count,
+			category: item.category,
+			isAlias: item.isAlias,
+			aliasFor: item.aliasFor ? 
+				item.aliasFor.replace(/_/g, ' ') : undefined,
+			isPreset: item.isPreset || false,
+			presetType: item.presetType,
+			characterName: item.characterName,  // For image lookup
+			hasImage: item.hasImage || false,
+			imageVersion: item.imageVersion,
+			type: 'tag'
+		}));
+	
+	if (autocompleteState.presetsFirst) {
+		matching.sort((a, b) => {
+			// Presets always come first
+			if (a.isPreset && !b.isPreset) return -1;
+			if (!a.isPreset && b.isPreset) return 1;
+			// Within same group, sort by count
+			return b.count - a.count;
+		});
+	} else {
+		// Just sort by count
+		matching.sort((a, b) => b.count - a.count);
 	}
+	
+	renderAutocomplete(input, context, matching.slice(0, 10));
+}
+
+function renderAutocomplete(input, context, filtered) {
+	const { searchTerm, start } = context;
 
 	if (filtered.length === 0) {
 		hideAutocomplete();
@@ -414,9 +470,10 @@ function showAutocomplete(input, context) {
 				`;
 			}
 		} else {
-			// LoRA/embedding format
+			// LoRA/embedding format, with the base model LoRAs were trained on
 			div.innerHTML = `
-				<span class="autocomplete-tag">${item.display}</span>
+				<span class="autocomplete-tag">${item.display}</span>${item.baseModel ? `
+				<span class="autocomplete-count">${item.baseModel}</span>` : ''}
 			`;
 		}
 
@@ -428,6 +485,9 @@ function showAutocomplete(input, context) {
 		    item.characterName) {
 			div.dataset.characterName = item.characterName;
 			div.dataset.previewType = 'character';
+			if (item.imageVersion) {
+				div.dataset.previewVersion = item.imageVersion;
+			}
 			setupThumbnailHover(div, item.characterName, 'character');
 		} else if (item.type === 'lora' && item.hasPreview) {
 			// Try previewPath first (full path), then fall back to previewName
@@ -436,11 +496,17 @@ function showAutocomplete(input, context) {
 				div.dataset.previewName = item.previewName;
 				div.dataset.previewPath = item.previewPath;
 				div.dataset.previewType = 'lora';
+				if (item.previewVersion) {
+					div.dataset.previewVersion = item.previewVersion;
+				}
 				setupThumbnailHover(div, previewIdentifier, 'lora');
 			}
 		} else if (item.type === 'embedding' && item.hasPreview && item.previewPath) {
 			div.dataset.previewPath = item.previewPath;
 			div.dataset.previewType = 'embedding';
+			if (item.previewVersion) {
+				div.dataset.previewVersion = item.previewVersion;
+			}
 			setupThumbnailHover(div, item.previewPath, 'embedding');
 		}
 		
@@ -561,6 +627,9 @@ export function hideAutocomplete() {
 	const dropdown = document.getElementById('autocompleteDropdown');
 	dropdown.style.display = 'none';
 	
+	// Drop any tag search still in flight
+	cancelTagSearch();
+	
 	// Hide thumbnail
 	hideThumbnail();
 	
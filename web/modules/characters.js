@@ -1,6 +1,6 @@
 import { state } from './state.js';
-import { getSortedNames } from './utils.js';
-import { getImageUrl } from './api.js';
+import { getSortedNames, setSpriteBackground } from './utils.js';
+import { getImageUrl, loadSprites } from './api.js';
 import { setupDragAndDrop } from './dragdrop.js';
 import { characterMatchesCategory } from './categories.js';
 
@@ -36,13 +36,15 @@ export function renderCharacters() {
 
 	emptyState.style.display = filteredNames.length === 0 ? 'block' : 'none';
 
+	const imageCards = new Map();
+
 	for (const name of filteredNames) {
 		const card = document.createElement('div');
 		card.className = 'character-card';
 		const hasImage = state.characterImages[name];
 		if (hasImage) {
 			card.classList.add('has-image');
-			card.style.backgroundImage = `url(${getImageUrl(name)})`;
+			imageCards.set(name, card);
 		}
 
 		card.onclick = () => {
@@ -60,4 +62,15 @@ export function renderCharacters() {
 		setupDragAndDrop(card, name, 'character');
 		grid.appendChild(card);
 	}
+
+	// Images come from a few sprite sheets instead of one request per card
+	loadSprites('character').then(tiles => {
+		for (const [name, card] of imageCards) {
+			if (tiles[name]) {
+				setSpriteBackground(card, tiles[name]);
+			} else {
+				card.style.backgroundImage = `url(${getImageUrl(name)})`;
+			}
+		}
+	});
 }
@@ -209,7 +209,8 @@ export async function saveCharacter() {
 			state.characters[newName] = characterData;
 			
 			if (state.characterImages[state.currentOriginalName]) {
-				state.characterImages[newName] = true;
+				state.characterImages[newName] =
+					state.characterImages[state.currentOriginalName];
 				delete state.characterImages[state.currentOriginalName];
 			}
 			
@@ -318,7 +319,8 @@ export async function saveItem(type) {
 			state.styles[newName] = styleData;
 			
 			if (state.styleImages[state.currentOriginalName]) {
-				state.styleImages[newName] = true;
+				state.styleImages[newName] =
+					state.styleImages[state.currentOriginalName];
 				delete state.styleImages[state.currentOriginalName];
 			}
 		} else {
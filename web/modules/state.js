@@ -33,8 +33,11 @@ export const autocompleteState = {
 	currentWord: '',
 	wordStart: 0,
 	filteredTags: [],
-	tags: [],
 	loras: [],
+	// Checkpoint the LoRA list is filtered for, and a function returning
+	// the checkpoint of the active loader, if the page has one
+	lorasCheckpoint: null,
+	activeCheckpoint: null,
 	embeddings: [],
 	characterPresets: [],
 	tagPresets: [],
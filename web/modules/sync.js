@@ -0,0 +1,138 @@
+import { autocompleteState } from './state.js';
+import * as api from './api.js';
+
+// The server pushes "config X changed to version N, entries [a, b]" events
+// over the ComfyUI websocket. Only the changed entries are fetched, unless
+// events were missed, in which case listeners get null and reload it all.
+export const CONFIG_CHANGED_EVENT = 'mudknight.config_changed';
+
+const RECONNECT_DELAY = 1000;
+const MAX_RECONNECT_DELAY = 30000;
+
+const configVersions = {};
+const listeners = [];
+let queue = Promise.resolve();
+
+export function onConfigChange(listener) {
+	listeners.push(listener);
+}
+
+export async function initConfigVersions() {
+	try {
+		Object.assign(configVersions, await api.loadConfigVersions());
+	} catch (error) {
+		console.error('Error loading config versions:', error);
+	}
+}
+
+export function handleConfigChange(change) {
+	// Changes are applied in the order they were sent
+	queue = queue.then(() => applyConfigChange(change)).catch(error => {
+		console.error('Error applying config change:', error);
+	});
+	return queue;
+}
+
+export function resyncConfigs() {
+	queue = queue.then(async () => {
+		const versions = await api.loadConfigVersions();
+		for (const [config, version] of Object.entries(versions)) {
+			if (configVersions[config] !== version) {
+				configVersions[config] = version;
+				await notify(config, null);
+			}
+		}
+	}).catch(error => {
+		console.error('Error resyncing configs:', error);
+	});
+	return queue;
+}
+
+async function applyConfigChange({ config, version, entries }) {
+	const known = configVersions[config];
+	if (known !== undefined && version <= known) {
+		return;
+	}
+	configVersions[config] = version;
+
+	if (known !== undefined && version > known + 1) {
+		await notify(config, null);
+		return;
+	}
+	const result = await api.loadConfigEntries(config, entries);
+	await notify(config, result.entries);
+}
+
+async function notify(config, values) {
+	await updatePresets(config, values);
+	for (const listener of listeners) {
+		await listener(config, values);
+	}
+}
+
+async function updatePresets(config, values) {
+	if (config === 'characters') {
+		if (values === null) {
+			autocompleteState.characterPresets =
+				await api.loadCharacterPresets();
+			return;
+		}
+		const kept = autocompleteState.characterPresets.filter(
+			preset => !(preset.characterName in values));
+		const added = await api.buildCharacterPresets(
+			Object.keys(values).filter(name => values[name] !== null));
+		autocompleteState.characterPresets = kept.concat(added);
+	} else if (config === 'tags') {
+		if (values === null) {
+			autocompleteState.tagPresets = await api.loadTagPresets();
+			return;
+		}
+		const kept = autocompleteState.tagPresets.filter(
+			preset => !(preset.tagName in values));
+		const added = await api.buildTagPresets(
+			Object.keys(values).filter(name => values[name] !== null));
+		autocompleteState.tagPresets = kept.concat(added);
+	}
+}
+
+// For pages outside the ComfyUI frontend, which have no api.addEventListener
+export function connectConfigSocket() {
+	const protocol = location.protocol === 'https:' ? 'wss:' : 'ws:';
+	let delay = RECONNECT_DELAY;
+	let dropped = false;
+
+	const connect = () => {
+		const socket = new WebSocket(`${protocol}//${location.host}/ws`);
+
+		socket.addEventListener('open', () => {
+			delay = RECONNECT_DELAY;
+			// Anything could have changed while we were away
+			if (dropped) {
+				resyncConfigs();
+			}
+		});
+
+		socket.addEventListener('message', (event) => {
+			// Binary messages are execution previews
+			if (typeof event.data !== 'string') {
+				return;
+			}
+			try {
+				const message = JSON.parse(event.data);
+				if (message.type === CONFIG_CHANGED_EVENT) {
+					handleConfigChange(message.data);
+				}
+			} catch (error) {
+				console.error('Error parsing websocket message:', error);
+			}
+		});
+
+		socket.addEventListener('close', () => {
+			dropped = true;
+			setTimeout(connect, delay);
+			delay = Math.min(delay * 2, MAX_RECONNECT_DELAY);
+		});
+	};
+
+	connect();
+}
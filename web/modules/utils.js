@@ -12,6 +12,15 @@ export function getSortedNames(obj) {
 	);
 }
 
+export function setSpriteBackground(element, tile) {
+	const x = tile.columns > 1 ? tile.column / (tile.columns - 1) * 100 : 0;
+	const y = tile.rows > 1 ? tile.row / (tile.rows - 1) * 100 : 0;
+	element.style.backgroundImage = `url(${tile.url})`;
+	element.style.backgroundSize =
+		`${tile.columns * 100}% ${tile.rows * 100}%`;
+	element.style.backgroundPosition = `${x}% ${y}%`;
+}
+
 export function showStatus(message, type) {
 	const status = document.getElementById('status');
 	status.textContent = message;
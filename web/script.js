@@ -21,6 +21,11 @@ import {
 } from './modules/modals.js';
 import { initSearch, switchTab, clearSearch } from './modules/search.js';
 import { initWeightAdjustment } from './modules/weight-adjustment.js';
+import {
+	initConfigVersions,
+	onConfigChange,
+	connectConfigSocket
+} from './modules/sync.js';
 
 function renderAll() {
 	renderCategories();
@@ -32,20 +37,46 @@ function renderAll() {
 
 
 
+const configLoaders = {
+	characters: api.loadCharacters,
+	models: api.loadModels,
+	styles: api.loadStyles,
+	tags: api.loadTags
+};
+
+async function applyConfigChange(config, values) {
+	if (values === null) {
+		state[config] = await configLoaders[config]();
+	} else {
+		for (const [name, value] of Object.entries(values)) {
+			if (value === null) {
+				delete state[config][name];
+			} else {
+				state[config][name] = value;
+			}
+		}
+	}
+	
+	if (config === 'characters') {
+		await api.checkImages('character');
+	} else if (config === 'styles') {
+		await api.checkImages('style');
+	}
+	renderAll();
+}
+
 async function loadData() {
 	try {
+		// Versions first, so no change made during the load is missed
+		await initConfigVersions();
+		
 		const hideAliases = localStorage.getItem("Mudknight Utils.Autocomplete.HideAliasesWithMain");
 		autocompleteState.hideAliasesWithMain = hideAliases === 'true';
 		
-		const autocompleteTags = await api.loadAutocompleteTags();
-		autocompleteState.tags = autocompleteTags;
-		
-		const characterPresets = await api.loadCharacterPresets(
-			autocompleteTags
-		);
+		const characterPresets = await api.loadCharacterPresets();
 		autocompleteState.characterPresets = characterPresets;
 		
-		const tagPresets = await api.loadTagPresets(autocompleteTags);
+		const tagPresets = await api.loadTagPresets();
 		autocompleteState.tagPresets = tagPresets;
 		
 		const loras = await api.loadLoras();
@@ -121,6 +152,8 @@ function init() {
 		}
 	});
 	
+	onConfigChange(applyConfigChange);
+	connectConfigSocket();
 	loadData();
 }
 